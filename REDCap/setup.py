@@ -52,11 +52,13 @@ def code_REDCap_csv(input_csv):
 
 
 def find_summary_tables():
-    for root, dirs, files in os.walk("output"):
-        for file in files:
-            if file.endswith("summary_version.tsv"):
-                if not file.startswith("IonXpress"):
-                     print(os.path.join(root, file))
+    # the summary tables are listed from the persistent output index; only the output dirs that changed are rescanned
+    # output and data are linked to the pipeline dirs, so the index defaults in global_settings work from here too
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'code'))
+    import output_index
+    index = output_index.get_index()
+    for file in output_index.query_files(index, name = "*summary_version.tsv", not_name = "IonXpress*"):
+        print(file)
 
 def replace_headers(input_tsv):
     '''
@@ -3,9 +3,16 @@
 
 '''
 USAGE: code/IGV_batchscript_generator.py "sample_summary_table_file" "sample_bamfile" "sample_IGV_dir" <args>
+USAGE: code/IGV_batchscript_generator.py -samples_file "analysis_IGV_samples.tsv" -o "analysis_IGV_script.bat" <args>
 DESCRITPION: Generate IGV batch script for creating snapshots of BAMs PER SAMPLE
 based on the sample's summary table of variants
 
+With -samples_file, a single batch script is made for all the samples in an analysis instead,
+so IGV only has to be started once per analysis; the samples file is tab delimited, with the
+summary table, BAM file, and IGV snapshot dir of a sample on each line. For each sample the script
+starts a 'new' session, loads the sample's BAM (and the control BAM), and makes the regular snapshots
+and then the long snapshots of the low frequency variants.
+
 REFERENCE:
 http://software.broadinstitute.org/software/igv/book/export/html/189
 http://software.broadinstitute.org/software/igv/batch
@@ -31,9 +38,15 @@ import subprocess as sp
 import collections
 import argparse
 import pipeline_functions as pl
+import table_schemas
 
 
 # ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+# summary table columns used to make the snapshot filenames, in filename order
+snapshot_columns = ['Analysis ID', 'Barcode', 'Gene', 'Chrom', 'Position', 'Coding']
+# variants below this frequency also get a long snapshot
+long_snapshot_max_frequency = 0.25
+
 def write_IGV_script(IGV_batch_file, IGV_snapshot_dir, bam_file, build_version, image_height,
 # locations,
 summary_df,
@@ -47,24 +60,79 @@ Control_bam_file = None, **kwargs):
     # locations : a list of the chromosome locations in the format ['chr9:21971111-21971111', 'chr9:21971111-21971111', ... etc. ]
 
     # ~~~~ WRITE SETUP INFO ~~~~~~ #
-    # initialize_file("new", IGV_batch_file)
-    pl.initialize_file("new", IGV_batch_file)
-    pl.append_string("snapshotDirectory " + IGV_snapshot_dir, IGV_batch_file)
-    pl.append_string("load " + bam_file, IGV_batch_file)
+    # the whole script goes through a single buffered file handle
+    with open(IGV_batch_file, "w") as batch_file:
+        write_session_setup(batch_file, IGV_snapshot_dir, bam_file, image_height, Control_bam_file = Control_bam_file, build_version = build_version)
+
+        # ~~~~ WRITE CHROM LOC INFO ~~~~~~ #
+        write_snapshot_commands(batch_file, summary_df, **kwargs)
+        batch_file.write("exit\n")
+
+def write_session_setup(batch_file, IGV_snapshot_dir, bam_file, image_height, Control_bam_file = None, build_version = None):
+    # write the commands that start a new IGV session for a sample to an open batch file
+    # the sample's BAM file is loaded, and the control BAM file too if there is one
+    # build_version : reference genome to load after the BAM files; None if the genome was already loaded for the whole script
+    batch_file.write("new\n")
+    batch_file.write("snapshotDirectory " + IGV_snapshot_dir + "\n")
+    batch_file.write("load " + bam_file + "\n")
     if Control_bam_file is not None and type(Control_bam_file) is str:
-        pl.append_string("load " + Control_bam_file, IGV_batch_file)
-    pl.append_string("genome " + build_version, IGV_batch_file)
-    pl.append_string("maxPanelHeight " + image_height, IGV_batch_file)
-
-    # ~~~~ WRITE CHROM LOC INFO ~~~~~~ #
-    for i in range(0, len(summary_df)):
-        summary_dict = summary_df.iloc[i].to_dict()
-        IGV_loc_items = make_IGV_loc_items(summary_dict, **kwargs) # (variant_loc, snapshot_filename)
-        variant_loc = IGV_loc_items[0]
-        snapshot_filename = IGV_loc_items[1]
-        pl.append_string("goto " + variant_loc, IGV_batch_file)
-        pl.append_string("snapshot " + snapshot_filename, IGV_batch_file)
-    pl.append_string("exit", IGV_batch_file)
+        batch_file.write("load " + Control_bam_file + "\n")
+    if build_version is not None:
+        batch_file.write("genome " + build_version + "\n")
+    batch_file.write("maxPanelHeight " + image_height + "\n")
+
+def write_snapshot_commands(batch_file, summary_df, filename_suffix = ''):
+    # write the 'goto' and 'snapshot' commands for each variant in the summary table to an open batch file
+    # the rows are read straight from the columns, without making a dict for each row
+    columns = [summary_df[column].values for column in snapshot_columns]
+    lines = []
+    for row in zip(*columns):
+        # row : Analysis ID, Barcode, Gene, Chrom, Position, Coding
+        lines.append("goto {0}:{1}-{1}\n".format(row[3], row[4]))
+        lines.append("snapshot " + make_snapshot_filename_items(row, filename_suffix = filename_suffix) + "\n")
+    batch_file.writelines(lines)
+    return(len(lines) // 2)
+
+def write_sample_commands(batch_file, IGV_snapshot_dir, bam_file, summary_df, Control_bam_file = None, image_height = '500'):
+    # write the commands for all the snapshots of a single sample to an open analysis batch file
+    # the sample starts a new session, so nothing is left loaded from the previous sample
+    # image_height : height of the regular snapshots; the long snapshots are always 5000, as in the per sample scripts
+    write_session_setup(batch_file, IGV_snapshot_dir, bam_file, image_height, Control_bam_file = Control_bam_file)
+    num_snapshots = write_snapshot_commands(batch_file, summary_df)
+    # long snapshots for low frequency variants
+    summary_lowfreq_df = summary_df.loc[summary_df['Frequency'] < long_snapshot_max_frequency]
+    if len(summary_lowfreq_df) > 0:
+        batch_file.write("maxPanelHeight 5000\n")
+        num_snapshots += write_snapshot_commands(batch_file, summary_lowfreq_df, filename_suffix = 'long')
+    return(num_snapshots)
+
+def write_analysis_IGV_script(IGV_batch_file, samples, build_version, Control_bam_file = None, image_height = '500'):
+    # generate a single IGV batch script for all the samples in an analysis
+    # samples : list of (summary table file, bam file, IGV snapshot dir) for each sample
+    # image_height : height of the regular snapshots
+    # returns the number of snapshots in the script
+    num_snapshots = 0
+    with open(IGV_batch_file, "w") as batch_file:
+        batch_file.write("genome " + build_version + "\n")
+        for summary_table_file, bam_file, IGV_snapshot_dir in samples:
+            summary_df = table_schemas.read_schema_table(summary_table_file, 'summary', stage = 'IGV_snapshots')
+            if len(summary_df) < 1:
+                print "\nNo variants in summary table, skipping sample:\n", summary_table_file
+                continue
+            pl.mkdir_p(IGV_snapshot_dir)
+            num_snapshots += write_sample_commands(batch_file, IGV_snapshot_dir, bam_file, summary_df, Control_bam_file = Control_bam_file, image_height = image_height)
+        batch_file.write("exit\n")
+    return(num_snapshots)
+
+def read_samples_file(samples_file):
+    # read the (summary table file, bam file, IGV snapshot dir) of each sample from a tab delimited file
+    samples = []
+    for line in pl.list_file_lines(samples_file):
+        parts = line.split('\t')
+        if len(parts) < 3:
+            continue
+        samples.append((parts[0], parts[1], parts[2]))
+    return(samples)
 
 def parse_chrom_loc(loc):
     '''
@@ -85,15 +153,13 @@ def make_chrom_locs(summary_dict):
 
 def make_snapshot_filename(summary_dict, filename_suffix = '', file_extension = "png"):
     # build the filename for the IGV snapshot, format required for downstream reporting
-    analysis_ID = summary_dict['Analysis ID']
-    barcode = summary_dict['Barcode']
-    gene = summary_dict['Gene']
-    chrom = summary_dict['Chrom']
-    position = summary_dict['Position']
-    coding = summary_dict['Coding']
+    return(make_snapshot_filename_items([summary_dict[column] for column in snapshot_columns], filename_suffix = filename_suffix, file_extension = file_extension))
+
+def make_snapshot_filename_items(items, filename_suffix = '', file_extension = "png"):
+    # build the snapshot filename from the values of the snapshot_columns of a summary table row
     if len(filename_suffix) > 0:
         file_extension = '.'.join(map(str, [filename_suffix, file_extension]))
-    snapshot_filename = '.'.join(map(str, [analysis_ID, barcode, gene, chrom, position, coding, file_extension]))
+    snapshot_filename = '.'.join(map(str, list(items) + [file_extension]))
     return(snapshot_filename)
 
 def  make_IGV_loc_items(summary_dict, **kwargs):
@@ -105,14 +171,16 @@ def  make_IGV_loc_items(summary_dict, **kwargs):
 # ~~~~ GET SCRIPT ARGS ~~~~~~ #
 parser = argparse.ArgumentParser(description='IGV snapshot batchscript generator.')
 # positional args
-parser.add_argument("summary_table_file", help="Path to the summary table for the sample")
-parser.add_argument("bam_file", help="Path to the BAM file for the sample")
-parser.add_argument("IGV_snapshot_dir", help="Path to the IGV snapshot output directory for the sample")
+parser.add_argument("summary_table_file", nargs = '?', help="Path to the summary table for the sample")
+parser.add_argument("bam_file", nargs = '?', help="Path to the BAM file for the sample")
+parser.add_argument("IGV_snapshot_dir", nargs = '?', help="Path to the IGV snapshot output directory for the sample")
 
 # optional args
 parser.add_argument("-b", default = 'hg19', type = str, dest = 'build_version', metavar = 'build version', help="Build version. Name of the reference genome, Defaults to hg19")
 parser.add_argument("-ht", default = '500', type = str, dest = 'image_height', metavar = 'image height', help="Height for the IGV tracks")
 parser.add_argument("-cb", default = None, type = str, dest = 'NC_bam', metavar = 'control BAM', help="Path to the control BAM file (NC) for the sample")
+parser.add_argument("-samples_file", default = None, type = str, dest = 'samples_file', metavar = 'samples file', help="Tab delimited file with the summary table, BAM file, and IGV snapshot dir of each sample in an analysis; makes a single batch script for all of them")
+parser.add_argument("-o", default = None, type = str, dest = 'IGV_batch_file', metavar = 'batch script file', help="Path to the analysis batch script to write, with -samples_file")
 
 
 args = parser.parse_args()
@@ -123,13 +191,32 @@ IGV_snapshot_dir = args.IGV_snapshot_dir
 build_version = args.build_version
 image_height = args.image_height
 NC_bam = args.NC_bam
+samples_file = args.samples_file
+analysis_IGV_batch_file = args.IGV_batch_file
+
 
 
 
 
 
+if __name__ == "__main__" and samples_file is not None:
+    # ~~~~ ANALYSIS BATCH SCRIPT ~~~~~~ #
+    pl.kill_on_false(analysis_IGV_batch_file is not None, my_message = "ERROR: An output batch script file is needed with -samples_file")
+    print "Now running script:\n", sys.argv[0]
+    print "\nSamples file is:\n", samples_file
+    print "\nIGV_batch_file is:\n", analysis_IGV_batch_file
+    if NC_bam is not None:
+        print "\nNC control BAM is:\n", NC_bam
+    samples = read_samples_file(samples_file)
+    num_snapshots = write_analysis_IGV_script(IGV_batch_file = analysis_IGV_batch_file,
+        samples = samples,
+        build_version = build_version,
+        Control_bam_file = NC_bam,
+        image_height = image_height)
+    print "\nWrote {0} snapshots for {1} samples".format(num_snapshots, len(samples))
 
-if __name__ == "__main__":
+elif __name__ == "__main__":
+    pl.kill_on_false(None not in [summary_table_file, bam_file, IGV_snapshot_dir], my_message = "ERROR: A summary table, BAM file, and IGV snapshot dir are needed, or -samples_file")
     # ~~~~ SETUP ~~~~~~ #
     IGV_batch_file = os.path.join(IGV_snapshot_dir,"IGV_script.bat")
     pl.mkdir_p(IGV_snapshot_dir)
@@ -144,7 +231,8 @@ if __name__ == "__main__":
 
     # ~~~~ PROCESS DATA ~~~~~~ #
     # load summary table
-    summary_df = pd.read_table(summary_table_file)
+    # only the columns used for the snapshots; uses the columnar copy of the table if there is one
+    summary_df = table_schemas.read_schema_table(summary_table_file, 'summary', stage = 'IGV_snapshots')
 
     # ~~~~ GENERATE BATCH SCRIPT ~~~~~~ #
     # start the IGV script output
@@ -160,7 +248,7 @@ if __name__ == "__main__":
 
     # long snapshots for low frequency varaints
     print "\nChecking for low frequency variants..."
-    summary_lowfreq_df = summary_df.ix[summary_df.ix[:,'Frequency'] < 0.25]
+    summary_lowfreq_df = summary_df.ix[summary_df.ix[:,'Frequency'] < long_snapshot_max_frequency]
     if len(summary_lowfreq_df) > 0:
         IGV_batch_file = os.path.join(IGV_snapshot_dir,"IGV_long_script.bat")
         print "\nIGV_batch_file is:\n", IGV_batch_file
@@ -0,0 +1,528 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+USAGE: code/IGV_daemon.py <command> <args>
+DESCRIPTION: Keep IGV running in the background with its batch command port open,
+and make snapshots by sending batch commands over the port
+
+Starting IGV takes longer than making the snapshots for most samples; running IGV once per regions file
+starts a new JVM, loads the genome, and starts an Xvfb display every time.
+The daemon starts one or more IGV servers once; run_IGV_snapshot_automator.py sends each sample's
+'new', 'load', 'goto', and 'snapshot' commands to a running server instead of starting IGV.
+The servers are saved in the daemon file, and each server is locked while a sample is using it.
+
+commands:
+start : start IGV servers and save them to the daemon file
+stop : stop the servers in the daemon file
+status : print the servers in the daemon file, and whether they are running
+mock : run a mock IGV server in the foreground; it accepts the batch commands and writes empty PNG snapshots,
+for testing without Java or a display
+
+example:
+code/IGV_daemon.py start -n 2
+code/IGV_daemon.py status
+code/IGV_daemon.py stop
+
+# test the client against mock servers
+code/IGV_daemon.py start -n 2 -mock
+
+usage in a script:
+import IGV_daemon
+IGV_daemon.snapshot_session(bam_files, [(region_file, '500'), (long_region_file, '5000')], outdir, genome = 'hg19')
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import sys
+import os
+import time
+import errno
+import socket
+import argparse
+import pipeline_functions as pl
+import global_settings
+import display_pool
+import snapshot_cache
+import bam_slicer
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+# IGV batch port; servers use consecutive ports starting here
+default_port = 60151
+default_host = '127.0.0.1'
+# seconds to wait for a response to a command; loading a large BAM can take a while
+command_timeout = 600
+# seconds to wait for a new server to start accepting commands
+start_timeout = 120
+
+# 1x1 PNG written by the mock server for each snapshot
+empty_png = (
+b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89'
+b'\x00\x00\x00\rIDATx\x9cc\xf8\xff\xff?\x00\x05\xfe\x02\xfe\xa75\x81\x84'
+b'\x00\x00\x00\x00IEND\xaeB`\x82'
+)
+
+
+# ~~~~ CLIENT ~~~~~~ #
+def connect(port, host = default_host, timeout = command_timeout):
+    '''
+    Open a connection to the batch port of an IGV server
+    returns a dict with the socket and a file for reading the responses
+    '''
+    sock = socket.create_connection((host, int(port)), timeout = timeout)
+    connection = {'port': int(port), 'socket': sock, 'reader': sock.makefile('r')}
+    return(connection)
+
+def close(connection):
+    '''
+    Close a connection to an IGV server; the server keeps running
+    '''
+    try:
+        connection['reader'].close()
+        connection['socket'].close()
+    except socket.error:
+        pass
+
+def send_command(connection, command):
+    '''
+    Send a single batch command to IGV and return its response; IGV responds 'OK' to a successful command
+    '''
+    connection['socket'].sendall((command + '\n').encode('utf-8'))
+    response = connection['reader'].readline()
+    if response == '':
+        raise socket.error('IGV server on port {0} closed the connection'.format(connection['port']))
+    return(response.strip())
+
+def server_responds(port, host = default_host):
+    '''
+    Check if an IGV server is accepting commands on the port
+    '''
+    try:
+        connection = connect(port, host = host, timeout = 5)
+    except socket.error:
+        return(False)
+    try:
+        return(send_command(connection, 'echo') == 'echo')
+    except socket.error:
+        return(False)
+    finally:
+        close(connection)
+
+def read_regions(region_file):
+    '''
+    Read the regions from a BED file; returns a list of (chrom, start, stop, snapshot filename)
+    regions without a name in the BED file are named chrom_start_stop.png
+    '''
+    regions = []
+    with open(region_file, 'r') as f:
+        for line in f:
+            parts = line.strip().split('\t')
+            if len(parts) < 3 or parts[0].startswith('#') or parts[0].startswith('track'):
+                continue
+            name = parts[3] if len(parts) > 3 and parts[3] != '' else '{0}_{1}_{2}.png'.format(parts[0], parts[1], parts[2])
+            regions.append((parts[0], parts[1], parts[2], name))
+    return(regions)
+
+def session_commands(bam_files, passes, outdir, genome = 'hg19'):
+    '''
+    Make the list of batch commands to snapshot the regions in the BAM files
+    passes : list of (regions, image height); the BAM files are loaded once, and the panel height is changed before each pass,
+    e.g. the regular 500px snapshots of a sample and then the 5000px long snapshots
+    starts with 'new' so nothing is left loaded from the previous sample
+    '''
+    commands = ['new', 'genome ' + genome, 'snapshotDirectory ' + os.path.abspath(outdir)]
+    for bam_file in bam_files:
+        commands.append('load ' + os.path.abspath(bam_file))
+    for regions, image_height in passes:
+        commands.append('maxPanelHeight ' + str(image_height))
+        for chrom, start, stop, name in regions:
+            commands.append('goto {0}:{1}-{2}'.format(chrom, start, stop))
+            commands.append('snapshot ' + name)
+    return(commands)
+
+def run_commands(connection, commands, deadline = None, failed = None):
+    '''
+    Send the commands to IGV in order; returns the number of commands that did not get an 'OK'
+    deadline : time.time() by which all the commands must be done; raises socket.timeout if it is passed
+    failed : list to add the index of each command that did not get an 'OK' to
+    '''
+    errors = 0
+    for i, command in enumerate(commands):
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise socket.timeout('timed out before command: {0}'.format(command))
+            connection['socket'].settimeout(remaining)
+        response = send_command(connection, command)
+        if response != 'OK':
+            print('IGV command "{0}" failed: {1}'.format(command, response))
+            errors += 1
+            if failed is not None:
+                failed.append(i)
+    return(errors)
+
+def failed_snapshot_files(commands, failed, outdir):
+    '''
+    Return the set of snapshot files from the session commands that may be wrong because an IGV command failed
+    failed : indexes of the commands that failed, from run_commands
+    a failed 'goto' or 'snapshot' spoils just its snapshot; any other failed command, e.g. 'load', spoils every snapshot after it
+    '''
+    failed = set(failed)
+    setup_failed = False
+    goto_failed = False
+    files = set()
+    for i, command in enumerate(commands):
+        name, _, arg = command.partition(' ')
+        if name == 'goto':
+            goto_failed = i in failed
+        elif name == 'snapshot':
+            if setup_failed or goto_failed or i in failed:
+                files.add(os.path.join(os.path.abspath(outdir), arg))
+        elif i in failed:
+            setup_failed = True
+    return(files)
+
+
+# ~~~~ DAEMON ~~~~~~ #
+def load_daemon(daemon_file = None):
+    '''
+    Load the servers saved in the daemon file; returns an empty list if there are no servers
+    '''
+    if daemon_file is None:
+        daemon_file = global_settings.IGV_daemon_file
+    if not os.path.isfile(daemon_file):
+        return([])
+    return(pl.load_json(daemon_file)['servers'])
+
+def save_daemon(servers, daemon_file = None):
+    if daemon_file is None:
+        daemon_file = global_settings.IGV_daemon_file
+    pl.write_json({'servers': servers}, daemon_file)
+
+def pid_running(pid):
+    '''
+    Check if a process is running
+    '''
+    if pid is None:
+        return(False)
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return(e.errno == errno.EPERM)
+    return(True)
+
+def running_servers(daemon_file = None):
+    '''
+    Return the servers in the daemon file that are still running
+    '''
+    return([server for server in load_daemon(daemon_file) if pid_running(server['pid'])])
+
+def daemon_running(daemon_file = None):
+    return(len(running_servers(daemon_file)) > 0)
+
+def find_open_port(host = default_host):
+    '''
+    Get an unused port from the OS for a new server
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((host, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return(port)
+
+def start_server(port, igv_jar_bin, igv_mem, log_file, mock = False):
+    '''
+    Start an IGV server with its batch port open, on its own Xvfb display
+    mock : start a mock server instead of IGV
+    returns a dict describing the server; its 'pid' is None if the server could not be started
+    '''
+    import subprocess as sp
+    server = {'port': int(port), 'pid': None, 'display': None, 'xvfb_pid': None, 'mock': mock, 'igv_jar_bin': igv_jar_bin, 'lock_file': None, 'log_file': log_file}
+    log = open(log_file, 'a')
+    try:
+        if mock == True:
+            command = [sys.executable, os.path.abspath(__file__), 'mock', '-port', str(port)]
+            env = os.environ.copy()
+        else:
+            # a display of its own from the display pool, kept until the server is stopped
+            display = display_pool.acquire_display(dedicated = True, log_file = log_file)
+            if display is None:
+                log.write('ERROR: Could not get an X display for IGV\n')
+                return(server)
+            display_pool.release_display(display)
+            server['display'] = display['display']
+            server['xvfb_pid'] = display['pid']
+            command = ['java', '-Xmx{0}m'.format(igv_mem), '-jar', igv_jar_bin, '-p', str(port)]
+            env = os.environ.copy()
+            env['DISPLAY'] = display_pool.display_name(display)
+        # own process group, so the server keeps running after this script exits
+        process = sp.Popen(command, stdout = log, stderr = log, env = env, preexec_fn = os.setpgrp)
+        server['pid'] = process.pid
+    except OSError as e:
+        log.write('ERROR: Could not start IGV server: {0}\n'.format(e))
+    finally:
+        log.close()
+    return(server)
+
+def wait_for_server(server, timeout = start_timeout):
+    '''
+    Wait for a new server to start accepting commands
+    '''
+    start = time.time()
+    while time.time() - start < timeout:
+        if server_responds(server['port']):
+            return(True)
+        if not pid_running(server['pid']):
+            return(False)
+        time.sleep(1)
+    return(False)
+
+def start_daemon(num_servers = 1, port = default_port, igv_jar_bin = None, igv_mem = "4000", daemon_file = None, mock = False):
+    '''
+    Start the IGV servers, and add them to the daemon file
+    '''
+    if igv_jar_bin is None:
+        igv_jar_bin = global_settings.igv_bin
+    if daemon_file is None:
+        daemon_file = global_settings.IGV_daemon_file
+    servers = running_servers(daemon_file)
+    used_ports = [server['port'] for server in servers]
+    daemon_dir = os.path.dirname(os.path.abspath(daemon_file))
+    for i in range(num_servers):
+        while port in used_ports or server_responds(port):
+            port += 1
+        log_file = os.path.join(daemon_dir, 'IGV_daemon_{0}.log'.format(port))
+        server = start_server(port, igv_jar_bin = igv_jar_bin, igv_mem = igv_mem, log_file = log_file, mock = mock)
+        server['lock_file'] = os.path.join(daemon_dir, 'IGV_daemon_{0}.lock'.format(port))
+        if wait_for_server(server) == False:
+            print('ERROR: IGV server on port {0} did not start, see log file: {1}'.format(port, log_file))
+            stop_server(server)
+            continue
+        print('Started IGV server on port {0}, pid {1}'.format(port, server['pid']))
+        servers.append(server)
+        used_ports.append(port)
+    save_daemon(servers, daemon_file)
+    return(servers)
+
+def stop_server(server):
+    '''
+    Stop an IGV server and its Xvfb display
+    '''
+    import signal
+    if pid_running(server['pid']):
+        try:
+            os.killpg(server['pid'], signal.SIGTERM)
+        except OSError:
+            pass
+    if server['display'] is not None:
+        display_pool.stop_display({'display': server['display'], 'pid': server['xvfb_pid']})
+    if server['lock_file'] is not None and os.path.exists(server['lock_file']):
+        os.remove(server['lock_file'])
+
+def stop_daemon(daemon_file = None):
+    '''
+    Stop all the servers in the daemon file
+    '''
+    if daemon_file is None:
+        daemon_file = global_settings.IGV_daemon_file
+    for server in load_daemon(daemon_file):
+        print('Stopping IGV server on port {0}, pid {1}'.format(server['port'], server['pid']))
+        stop_server(server)
+    if os.path.isfile(daemon_file):
+        os.remove(daemon_file)
+
+def acquire_server(daemon_file = None, wait = 5):
+    '''
+    Lock a running server for the caller's exclusive use; waits for a server if they are all in use
+    returns (server, lock), or (None, None) if no servers are running
+    '''
+    import fcntl
+    while True:
+        servers = running_servers(daemon_file)
+        if len(servers) < 1:
+            return((None, None))
+        for server in servers:
+            lock = open(server['lock_file'], 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                lock.close()
+                continue
+            return((server, lock))
+        time.sleep(wait)
+
+def release_server(lock):
+    import fcntl
+    fcntl.flock(lock, fcntl.LOCK_UN)
+    lock.close()
+
+def server_renderer(server):
+    '''
+    Return the snapshot cache renderer ID of a server
+    '''
+    return(snapshot_cache.renderer_ID(igv_jar_bin = server.get('igv_jar_bin', None), mock = server.get('mock', False)))
+
+def start_session_server(igv_jar_bin = None, igv_mem = "4000"):
+    '''
+    Start an IGV server for a single session, when no daemon servers are running
+    returns the server, or None if it did not start
+    '''
+    import tempfile
+    if igv_jar_bin is None:
+        igv_jar_bin = global_settings.igv_bin
+    log_fd, log_file = tempfile.mkstemp(prefix = 'IGV_session_', suffix = '.log')
+    os.close(log_fd)
+    server = start_server(find_open_port(), igv_jar_bin = igv_jar_bin, igv_mem = igv_mem, log_file = log_file)
+    if wait_for_server(server) == False:
+        print('ERROR: IGV server did not start, see log file: {0}'.format(log_file))
+        stop_server(server)
+        return(None)
+    os.remove(log_file)
+    return(server)
+
+def snapshot_session(bam_files, passes, outdir, genome = 'hg19', daemon_file = None, start_new = False, igv_jar_bin = None, igv_mem = "4000"):
+    '''
+    Make the snapshots of all the passes over the BAM files in a single IGV session on a running IGV server
+    snapshots in the snapshot cache are linked from the cache, and only the rest are made by IGV, from slices of the BAM files
+    passes : list of (regions file, image height)
+    start_new : if no daemon server is running, start a server for just this session
+    returns False if no server could be used, or if any IGV command failed, so the caller can run IGV itself
+    '''
+    server, lock = acquire_server(daemon_file)
+    renderer = server_renderer(server) if server is not None else snapshot_cache.renderer_ID(igv_jar_bin = igv_jar_bin)
+    pl.mkdir_p(outdir)
+    region_passes = [(read_regions(region_file), image_height) for region_file, image_height in passes]
+    miss_passes, pending = snapshot_cache.split_cached(bam_files, region_passes, outdir, genome = genome, renderer = renderer)
+    if len(miss_passes) < 1:
+        if lock is not None:
+            release_server(lock)
+        return(True)
+    if server is None and start_new == True:
+        server = start_session_server(igv_jar_bin = igv_jar_bin, igv_mem = igv_mem)
+    if server is None:
+        snapshot_cache.unlink_snapshots(region_passes, outdir)
+        return(False)
+    # load slices of the BAM files with just the windows being snapshot
+    slice_files, scratch_dir = bam_slicer.slice_bams(bam_files, miss_passes)
+    commands = session_commands(slice_files, miss_passes, outdir, genome = genome)
+    print('Sending {0} commands to IGV server on port {1}'.format(len(commands), server['port']))
+    failed = []
+    try:
+        connection = connect(server['port'])
+        try:
+            errors = run_commands(connection, commands, failed = failed)
+        finally:
+            close(connection)
+    except socket.error as e:
+        print('ERROR: Lost connection to IGV server on port {0}: {1}'.format(server['port'], e))
+        snapshot_cache.unlink_snapshots(region_passes, outdir)
+        return(False)
+    finally:
+        if lock is not None:
+            release_server(lock)
+        else:
+            stop_server(server)
+        bam_slicer.remove_slices(scratch_dir)
+    # only cache the snapshots whose commands all succeeded
+    failed_files = failed_snapshot_files(commands, failed, outdir)
+    snapshot_cache.store_snapshots([(snapshot_file, cached_file) for snapshot_file, cached_file in pending if os.path.abspath(snapshot_file) not in failed_files])
+    if errors > 0:
+        print('WARNING: {0} IGV commands failed for regions files {1}'.format(errors, ', '.join([region_file for region_file, image_height in passes])))
+        snapshot_cache.unlink_snapshots(region_passes, outdir)
+        return(False)
+    return(True)
+
+
+# ~~~~ MOCK SERVER ~~~~~~ #
+class MockIGVHandler(socketserver.StreamRequestHandler):
+    '''
+    Respond to IGV batch commands like IGV does; 'snapshot' writes an empty PNG to the snapshot directory
+    '''
+    def handle(self):
+        snapshot_dir = os.getcwd()
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8').strip()
+            if command == '':
+                continue
+            self.server.commands.append(command)
+            name, _, arg = command.partition(' ')
+            response = 'OK'
+            if name == 'echo':
+                response = 'echo'
+            elif name == 'snapshotDirectory':
+                snapshot_dir = arg
+            elif name == 'snapshot':
+                with open(os.path.join(snapshot_dir, arg), 'wb') as f:
+                    f.write(empty_png)
+            elif name == 'load' and not os.path.exists(arg):
+                response = 'ERROR: file not found: {0}'.format(arg)
+            elif name == 'exit':
+                return
+            self.wfile.write((response + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+class MockIGVServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address):
+        socketserver.TCPServer.__init__(self, address, MockIGVHandler)
+        # every command received, for checking the client in tests
+        self.commands = []
+
+def run_mock_server(port = default_port, host = default_host):
+    '''
+    Run a mock IGV server in the foreground
+    '''
+    server = MockIGVServer((host, int(port)))
+    print('Mock IGV server listening on port {0}'.format(port))
+    sys.stdout.flush()
+    server.serve_forever()
+
+
+def run():
+    '''
+    Parse script args to run the script
+    '''
+    # ~~~~ GET SCRIPT ARGS ~~~~~~ #
+    parser = argparse.ArgumentParser(description='Run IGV servers in the background for making snapshots')
+    parser.add_argument("-daemon_file", default = global_settings.IGV_daemon_file, type = str, dest = 'daemon_file', metavar = 'daemon file', help="File to save the running servers to")
+    subparsers = parser.add_subparsers(dest = 'command')
+
+    start_parser = subparsers.add_parser('start', help = 'Start IGV servers')
+    start_parser.add_argument("-n", default = 1, type = int, dest = 'num_servers', metavar = 'number of servers', help="Number of IGV servers to start")
+    start_parser.add_argument("-port", default = default_port, type = int, dest = 'port', metavar = 'port', help="First batch port to use")
+    start_parser.add_argument("-bin", default = global_settings.igv_bin, type = str, dest = 'igv_jar_bin', metavar = 'IGV bin path', help="Path to the IGV jar binary to run")
+    start_parser.add_argument("-mem", default = "4000", type = str, dest = 'igv_mem', metavar = 'IGV memory (MB)', help="Amount of memory to allocate to each IGV, in Megabytes (MB)")
+    start_parser.add_argument("-mock", default = False, action = 'store_true', dest = 'mock', help="Start mock IGV servers instead of IGV")
+
+    stop_parser = subparsers.add_parser('stop', help = 'Stop the IGV servers')
+
+    status_parser = subparsers.add_parser('status', help = 'Print the IGV servers')
+
+    mock_parser = subparsers.add_parser('mock', help = 'Run a mock IGV server in the foreground')
+    mock_parser.add_argument("-port", default = default_port, type = int, dest = 'port', metavar = 'port', help="Port to listen on")
+
+    args = parser.parse_args()
+
+    if args.command == 'start':
+        servers = start_daemon(num_servers = args.num_servers, port = args.port, igv_jar_bin = args.igv_jar_bin, igv_mem = args.igv_mem, daemon_file = args.daemon_file, mock = args.mock)
+        if len(servers) < 1:
+            sys.exit(1)
+    elif args.command == 'stop':
+        stop_daemon(daemon_file = args.daemon_file)
+    elif args.command == 'status':
+        for server in load_daemon(args.daemon_file):
+            status = 'running' if pid_running(server['pid']) else 'stopped'
+            print('port {0}\tpid {1}\tdisplay {2}\t{3}{4}'.format(server['port'], server['pid'], server['display'], status, '\tmock' if server['mock'] else ''))
+    elif args.command == 'mock':
+        run_mock_server(port = args.port)
+
+if __name__ == "__main__":
+    run()
@@ -6,8 +6,8 @@
 ## for all supplied analyses. First, the script will search for a
 ## 'combined_sample_barcode_IDs.tsv' file; if found, the NC control will be parsed out
 ## and used as the control BAM for the IGV screenshots
-## Otherwise, the script will parse out the BAM files per sample and run the
-## IGV screenshot Python script on each one
+## Otherwise, the script will parse out the BAM files per sample, and write a
+## single IGV batch script for all the samples in the analysis, so IGV is only started once per analysis
 ## This script operates on all supplied analyses
 
 
@@ -22,12 +22,7 @@ function run_all_IGV_batchscripts {
         check_dirfile_exists "$batchscript_file" "f" "Checking to make sure IGV batch script was found..."
         echo -e "\nNow running IGV batchscript:\n$batchscript_file\n"
 
-        # find an open X server
-        echo -e "Searching for an open X server to run IGV..."
-        local x_serv="$(find_open_X_server)"
-        echo -e "X server is:\n$x_serv\n"
-
-        # run IGV snapshotter
+        # run IGV snapshotter; it gets its X display from the display pool
         echo -e "Running IGV snapshot batch script..."
         $IGV_run_batchscript_script "$batchscript_file"
     done
@@ -54,6 +49,11 @@ for i in $analysis_ID_list; do
     IGV_batchscript_generator_script="${codedir}/IGV_batchscript_generator.py"
     IGV_run_batchscript_script="${codedir}/run_IGV_batchscript.py"
 
+    # the samples to snapshot, collected for the analysis batch script
+    analysis_IGV_samples_file="${analysis_outdir}/IGV_snapshot_samples.tsv"
+    analysis_IGV_batchscript="${analysis_outdir}/IGV_analysis_script.bat"
+    > "$analysis_IGV_samples_file"
+
 
 
 
@@ -126,7 +126,7 @@ for i in $analysis_ID_list; do
         echo -e "Sample ID is:\n$sample_ID\n"
 
         # check to make sure its not a control sample..
-        if grep -q "$sample_ID" "$control_sample_ID_file"; then
+        if "${codedir}/control_samples.py" -ID_file "$control_sample_ID_file" known "$sample_ID"; then
             echo -e "Sample is a control sample, skipping IGV steps... "
             continue
         fi
@@ -154,42 +154,14 @@ for i in $analysis_ID_list; do
         echo -e "\nMaking sure entries exist in the summary table..."
         check_num_file_lines "$sample_summary_file" "2"
 
-        # CREATE IGV BATCH SCRIPT
-        # only run if at least 2 lines in the summary table file..
-        # with or without control!
+        # ADD THE SAMPLE TO THE ANALYSIS IGV BATCH SCRIPT
+        # only if at least 2 lines in the summary table file..
         echo -e "Checking number of lines in summary table file..."
         num_lines="$(cat "$sample_summary_file" | wc -l)"
         min_number_lines="1"
         if (( $num_lines > $min_number_lines )); then
-            echo -e "Running IGV batchscript generator script..."
-            # set -x
-            # IGV_control_param is exported global variable from `find_NC_control_sample` function
-            [ ! -z "${IGV_control_param:-}" ] && echo -e "Including control BAM parameters:\n${IGV_control_param}"
-            $IGV_batchscript_generator_script "$sample_summary_file" "$sample_bamfile" "$sample_IGV_dir" ${IGV_control_param:-}
-            # set +x
-
-            # find all the IGV batch scripts
-            echo -e "\n\nNew testing this part, searching for all IGV batch scripts\n\n"
-            sample_IGV_batchscripts="$(find "$i" -path "*coverageAnalysis_out*" -path "*$sample_barcode*" -name "IGV*" -name "*.bat")"
-            [ ! -z "$sample_IGV_batchscripts" ] && run_all_IGV_batchscripts "$sample_IGV_batchscripts"
-
-            # find the new batch script.. IGV_script.bat
-            # echo -e "Searching for IGV batchs script..."
-            # sample_IGV_batchscript="$(find_sample_file "$i" "coverageAnalysis_out" "$sample_barcode" "IGV_script.bat" | head -1)"
-            # check_dirfile_exists "$sample_IGV_batchscript" "f" "Checking to make sure IGV batch script was found..."
-            # error_on_zerolength "$sample_IGV_batchscript" "TRUE" "Checking to make sure IGV batch script was found..."
-            # if [ ! -z $sample_IGV_batchscript ]; then
-            #     echo -e "IGV batch script is:\n$sample_IGV_batchscript\n"
-            #
-            #     # find an open X server
-            #     echo -e "Searching for an open X server to run IGV..."
-            #     x_serv="$(find_open_X_server)"
-            #     echo -e "X server is:\n$x_serv\n"
-            #
-            #     # run IGV snapshotter
-            #     echo -e "Running IGV snapshot batch script..."
-            #     $IGV_run_batchscript_script "$sample_IGV_batchscript"
-            # fi
+            echo -e "Adding sample to the analysis IGV batch script..."
+            printf "%s\t%s\t%s\n" "$sample_summary_file" "$sample_bamfile" "$sample_IGV_dir" >> "$analysis_IGV_samples_file"
         elif (( ! $num_lines > $min_number_lines )); then
             echo -e "Summary table has only:\n$num_lines\nnumber of lines."
             echo -e "Minimum lines needed:\n$min_number_lines"
@@ -197,5 +169,21 @@ for i in $analysis_ID_list; do
         fi
         )
     done
+
+    #~~~~~ RUN ANALYSIS IGV BATCH SCRIPT ~~~~~~#
+    # one batch script for all the samples, with or without control!
+    if [ -s "$analysis_IGV_samples_file" ]; then
+        echo -e "\n-----------------------------------\n"
+        echo -e "Running IGV batchscript generator script for all samples in the analysis..."
+        # IGV_control_param is exported global variable from `find_NC_control_sample` function
+        [ ! -z "${IGV_control_param:-}" ] && echo -e "Including control BAM parameters:\n${IGV_control_param}"
+        $IGV_batchscript_generator_script -samples_file "$analysis_IGV_samples_file" -o "$analysis_IGV_batchscript" ${IGV_control_param:-}
+        run_all_IGV_batchscripts "$analysis_IGV_batchscript"
+    else
+        echo -e "No samples with variants found in analysis, skipping IGV snapshot step..."
+    fi
     )
 done
+
+# stop the idle Xvfb displays left running by the IGV batch scripts
+"${codedir}/display_pool.py" stop
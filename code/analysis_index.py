@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+Index of the files and dirs in an analysis output dir, built from a single traversal of the dir
+
+The analysis output dirs are on a network filesystem, and every os.walk of them is expensive;
+the index lists the dir tree once, then answers every lookup of the coverage dir, variant dir,
+sample dirs, BAM, BAI, and summary table files from memory.
+Dirs and files are indexed by name, so a lookup only matches its pattern against the distinct names
+instead of scanning every entry of the tree.
+Lookups return the same paths that a separate os.walk for each item would have found.
+
+usage:
+import analysis_index
+index = analysis_index.index_analysis_dir(analysis_outdir)
+coverage_dir = index['coverage_dir']
+sample_files = analysis_index.get_sample_files(index, barcode = 'IonXpress_001')
+'''
+import os
+import fnmatch
+import pipeline_functions as pl
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+def walk_dir(top):
+    '''
+    Yield (root, dirs, files) for every dir in the tree, in the same order as os.walk
+    uses scandir if it is available, so file types come from the dir listing instead of a stat of every entry
+    '''
+    if scandir is None:
+        for root, dirs, files in os.walk(top):
+            yield((root, dirs, files))
+        return
+    try:
+        entries = list(scandir(top))
+    except OSError:
+        return
+    dirs = []
+    files = []
+    links = set()
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            dirs.append(entry.name)
+            if entry.is_symlink():
+                links.add(entry.name)
+        else:
+            files.append(entry.name)
+    yield((top, dirs, files))
+    # like os.walk, symlinked dirs are listed but not followed
+    for dir in dirs:
+        if dir not in links:
+            for item in walk_dir(os.path.join(top, dir)):
+                yield(item)
+
+def in_dir(root, parent_dir):
+    '''
+    Check if a dir is parent_dir or one of its subdirs
+    '''
+    return(parent_dir is None or root == parent_dir or root.startswith(parent_dir + os.sep))
+
+def name_index(entries):
+    '''
+    Map each dir name and file name in the index entries to its (position, root, path) locations
+    position is the order of the item in os.walk, so lookups by name can return the same first match as a walk
+    '''
+    dir_names = {}
+    file_names = {}
+    position = 0
+    for root, dirs, files in entries:
+        for name in dirs:
+            dir_names.setdefault(name, []).append((position, root, os.path.join(root, name)))
+            position += 1
+        for name in files:
+            file_names.setdefault(name, []).append((position, root, os.path.join(root, name)))
+            position += 1
+    return((dir_names, file_names))
+
+def find_matches(index, kind, pattern):
+    '''
+    Return the (position, root, path) locations of the dirs or files with names matching the pattern, in os.walk order
+    kind : 'dir_names' or 'file_names'
+    Patterns without wildcards are looked up directly by name, others are matched against the distinct names;
+    the matches for each pattern are saved in the index
+    '''
+    key = (kind, pattern)
+    if key not in index['matches']:
+        names = index[kind]
+        if not any(char in pattern for char in '*?['):
+            matches = list(names.get(pattern, []))
+        else:
+            matches = []
+            for name in fnmatch.filter(names.keys(), pattern):
+                matches.extend(names[name])
+            matches.sort()
+        index['matches'][key] = matches
+    return(index['matches'][key])
+
+def dir_files(index, dir_path):
+    '''
+    Return the list of files directly in a dir of the index
+    '''
+    return(index['dirs'].get(dir_path.rstrip(os.sep), ([], []))[1])
+
+def find_dir(index, pattern, parent_dir = None):
+    '''
+    Return the path to the first dir matching the pattern, or None
+    '''
+    if parent_dir is not None:
+        parent_dir = parent_dir.rstrip(os.sep)
+    for position, root, path in find_matches(index, 'dir_names', pattern):
+        if in_dir(root, parent_dir):
+            return(path)
+    return(None)
+
+def find_file(index, pattern, parent_dir = None, root_pattern = None, last = False):
+    '''
+    Return the path to the first file matching the pattern, or None
+    root_pattern : only search dirs with paths matching this pattern
+    last : return the first matching file in the last dir with a match, instead of the first
+    '''
+    if parent_dir is not None:
+        parent_dir = parent_dir.rstrip(os.sep)
+    matches = [(root, path) for position, root, path in find_matches(index, 'file_names', pattern)
+                if in_dir(root, parent_dir) and (root_pattern is None or fnmatch.fnmatch(root, root_pattern))]
+    if len(matches) < 1:
+        return(None)
+    if last == False:
+        return(matches[0][1])
+    last_root = matches[-1][0]
+    for root, path in matches:
+        if root == last_root:
+            return(path)
+
+def index_analysis_dir(analysis_outdir):
+    '''
+    List the analysis output dir once and find the analysis level dirs and files
+    returns a dict; the sample level files are found with get_sample_files
+    '''
+    index = {}
+    index['analysis_outdir'] = analysis_outdir
+    index['entries'] = list(walk_dir(analysis_outdir))
+    index['dirs'] = dict((root, (dirs, files)) for root, dirs, files in index['entries'])
+    index['dir_names'], index['file_names'] = name_index(index['entries'])
+    index['matches'] = {}
+    # ex: coverageAnalysis_out.1052, variantCaller_out.1046
+    index['coverage_dir'] = find_dir(index, "*coverageAnalysis_out*")
+    index['variant_dir'] = find_dir(index, "*variantCaller_out*")
+    index['analysis_barcode_file'] = find_file(index, "sample_barcode_IDs.tsv", root_pattern = "*variantCaller_out*", last = True)
+    index['combined_sample_barcode_IDs_file'] = find_file(index, "combined_sample_barcode_IDs.tsv", root_pattern = "*combined_analysis*", last = True)
+    index['samples'] = {}
+    return(index)
+
+def get_sample_files(index, barcode):
+    '''
+    Return a dict of the dirs and files for a sample in the analysis; the results are saved in the index
+    '''
+    if barcode in index['samples']:
+        return(index['samples'][barcode])
+    pl.kill_on_false(index['coverage_dir'] is not None, my_message = "ERROR: Analysis coverage dir not found!")
+    pl.kill_on_false(index['variant_dir'] is not None, my_message = "ERROR: Analysis variant dir not found!")
+    sample_files = {}
+    sample_files['sample_variant_dir'] = find_dir(index, "*{0}*".format(barcode), parent_dir = index['variant_dir'])
+    sample_files['sample_bam_dir'] = find_dir(index, "*{0}*".format(barcode), parent_dir = index['coverage_dir'])
+    sample_files['sample_summary_table'] = None
+    sample_files['sample_bam_file'] = None
+    sample_files['sample_bai_file'] = None
+    if sample_files['sample_variant_dir'] is not None:
+        sample_files['sample_summary_table'] = find_file(index, "*_summary.tsv", parent_dir = sample_files['sample_variant_dir'])
+    if sample_files['sample_bam_dir'] is not None:
+        sample_files['sample_bam_file'] = find_file(index, "*.bam", parent_dir = sample_files['sample_bam_dir'])
+    if sample_files['sample_bam_file'] is not None:
+        # IonXpress_001_rawlib.bam.bai, or IonXpress_001_rawlib.bai
+        bam_dir = os.path.dirname(sample_files['sample_bam_file'])
+        bam_name = os.path.basename(sample_files['sample_bam_file'])
+        for bai_name in [bam_name + '.bai', os.path.splitext(bam_name)[0] + '.bai']:
+            if bai_name in dir_files(index, bam_dir):
+                sample_files['sample_bai_file'] = os.path.join(bam_dir, bai_name)
+                break
+    index['samples'][barcode] = sample_files
+    return(sample_files)
@@ -54,9 +54,11 @@ for ID in $analysis_ID; do
     analysis_filtered_table="${analysis_outdir}/${ID}${filtered_table_ext}"
     analysis_summary_version_table="${analysis_outdir}/${ID}${summary_version_ext}"
 
-    ${codedir}/concat_tables.py $(find "$analysis_outdir" -path "*variantCaller_out*" -name "*${summary_table_ext}") > "$analysis_summary_table"
-    ${codedir}/concat_tables.py $(find "$analysis_outdir" -path "*variantCaller_out*" -name "*${full_table_ext}") > "$analysis_full_table"
-    ${codedir}/concat_tables.py $(find "$analysis_outdir" -path "*variantCaller_out*" -name "*${filtered_table_ext}") > "$analysis_filtered_table"
+    # the combined summary and full tables also get columnar copies, made from the samples' columnar copies
+    ${codedir}/concat_tables.py $(find "$analysis_outdir" -path "*variantCaller_out*" -name "*${summary_table_ext}") -columnar "$analysis_summary_table" > "$analysis_summary_table"
+    ${codedir}/concat_tables.py $(find "$analysis_outdir" -path "*variantCaller_out*" -name "*${full_table_ext}") -columnar "$analysis_full_table" > "$analysis_full_table"
+    # the samples' filtered tables are views of their full tables; write them from the views manifests
+    ${codedir}/table_views.py filtered $(find "$analysis_outdir" -path "*variantCaller_out*" -name "*${table_views_ext}") > "$analysis_filtered_table"
     ${codedir}/concat_tables.py $(find "$analysis_outdir" -path "*variantCaller_out*" -name "*${summary_version_ext}") > "$analysis_summary_version_table"
 
 done
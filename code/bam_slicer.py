@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+Slice BAM files down to the windows around the variants before they are loaded into IGV
+
+IGV only shows a few hundred bases around each snapshot locus, but loading a full coverage BAM over the network
+storage reads far more than that. Each BAM is sliced with samtools to the union of the padded windows around the
+snapshot regions, and the small indexed slices are written to the local tmp dir; IGV loads the slices instead.
+The slices keep the file names of the original BAMs, so the IGV track names do not change.
+If a BAM cannot be sliced, e.g. samtools is missing or the BAM has no index, the original BAM is used.
+
+usage:
+import bam_slicer
+slice_files, scratch_dir = bam_slicer.slice_bams(bam_files, passes)
+# ... load slice_files into IGV ...
+bam_slicer.remove_slices(scratch_dir)
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import time
+import shutil
+import tempfile
+import subprocess as sp
+import global_settings
+
+# bases to keep on each side of a snapshot locus; more than IGV shows around a single base locus
+default_padding = 500
+# windows closer than this are merged, so reads spanning the gap between them are not written to the slice twice
+merge_gap = 1000
+
+
+def sequence_order(bam_file, samtools_bin):
+    '''
+    Return the order of the sequences in the header of a BAM file, by sequence name
+    '''
+    header = sp.check_output([samtools_bin, 'view', '-H', bam_file])
+    order = {}
+    for line in header.decode('utf-8').splitlines():
+        if line.startswith('@SQ'):
+            for field in line.split('\t'):
+                if field.startswith('SN:'):
+                    order[field[3:]] = len(order)
+    return(order)
+
+def merge_windows(passes, padding = default_padding):
+    '''
+    Return the union of the padded windows around the regions of the passes
+    passes : list of (regions, image height); regions are (chrom, start, stop, snapshot filename)
+    returns a dict of sorted (start, stop) windows by chrom
+    '''
+    windows = {}
+    for regions, image_height in passes:
+        for chrom, start, stop, name in regions:
+            windows.setdefault(chrom, []).append((max(1, int(start) - padding), int(stop) + padding))
+    merged = {}
+    for chrom, chrom_windows in windows.items():
+        merged[chrom] = []
+        for start, stop in sorted(chrom_windows):
+            if len(merged[chrom]) > 0 and start <= merged[chrom][-1][1] + merge_gap:
+                merged[chrom][-1] = (merged[chrom][-1][0], max(merged[chrom][-1][1], stop))
+            else:
+                merged[chrom].append((start, stop))
+    return(merged)
+
+def slice_bam(bam_file, windows, output_file, samtools_bin):
+    '''
+    Write the reads of a BAM file in the windows to a new indexed BAM file
+    the windows are given to samtools in the order of the BAM header, so the slice stays sorted
+    returns True if the slice was made
+    '''
+    try:
+        order = sequence_order(bam_file, samtools_bin)
+    except (OSError, sp.CalledProcessError):
+        return(False)
+    loci = []
+    for chrom in sorted([chrom for chrom in windows.keys() if chrom in order], key = lambda chrom: order[chrom]):
+        for start, stop in windows[chrom]:
+            loci.append('{0}:{1}-{2}'.format(chrom, start, stop))
+    if len(loci) < 1:
+        return(False)
+    # samtools uses the BAM index for explicit regions; a BED file with -L reads the whole BAM in this version
+    with open(os.devnull, 'w') as devnull:
+        if sp.call([samtools_bin, 'view', '-b', '-o', output_file, bam_file] + loci, stderr = devnull) != 0:
+            return(False)
+        if sp.call([samtools_bin, 'index', output_file], stderr = devnull) != 0:
+            return(False)
+    return(True)
+
+def slice_bams(bam_files, passes, scratch_dir = None, padding = default_padding, samtools_bin = None):
+    '''
+    Slice each BAM file to the windows around the regions of the passes
+    passes : list of (regions, image height), as for IGV_daemon.session_commands
+    returns (slice_files, scratch_dir); slice_files are in the same order as bam_files, with the original file for each BAM
+    that could not be sliced. Remove the scratch dir with remove_slices once IGV is done with the slices
+    '''
+    if samtools_bin is None:
+        samtools_bin = global_settings.samtools_bin
+    if not os.path.isfile(samtools_bin):
+        print('samtools not found at {0}, IGV will load the full BAM files'.format(samtools_bin))
+        return((list(bam_files), None))
+    windows = merge_windows(passes, padding = padding)
+    if scratch_dir is None:
+        scratch_dir = tempfile.mkdtemp(prefix = 'IGV_bam_slices_')
+    start = time.time()
+    slice_files = []
+    for i, bam_file in enumerate(bam_files):
+        # a dir for each BAM, so the slices can keep the original file names
+        slice_dir = os.path.join(scratch_dir, str(i + 1))
+        if not os.path.isdir(slice_dir):
+            os.makedirs(slice_dir)
+        slice_file = os.path.join(slice_dir, os.path.basename(bam_file))
+        if slice_bam(bam_file, windows, slice_file, samtools_bin) == True:
+            slice_files.append(slice_file)
+        else:
+            print('Could not slice BAM file {0}, IGV will load the full file'.format(bam_file))
+            slice_files.append(bam_file)
+    num_windows = sum([len(chrom_windows) for chrom_windows in windows.values()])
+    print('Sliced {0} BAM files to {1} windows in {2:.1f}s'.format(len([f for f in slice_files if f not in bam_files]), num_windows, time.time() - start))
+    return((slice_files, scratch_dir))
+
+def remove_slices(scratch_dir):
+    if scratch_dir is not None:
+        shutil.rmtree(scratch_dir, ignore_errors = True)
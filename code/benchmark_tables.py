@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+USAGE: code/benchmark_tables.py <benchmark> <args>
+DESCRIPTION: Benchmark the table processing functions in pipeline_functions.py
+against their previous implementations on synthetic merged variant tables
+
+benchmarks:
+filter : table_multi_filter on a synthetic merged table (default 1,000,000 rows)
+split_rows : split_df_col2rows on a synthetic 'AAChange.refGene' column
+split_cols : split_df_col2cols on the 'AAChange' column produced by split_rows
+
+example:
+code/benchmark_tables.py filter -n 1000000 -f filter_criteria.json
+code/benchmark_tables.py split_rows -n 100000
+code/benchmark_tables.py split_cols -n 100000
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import sys
+import os
+import argparse
+import timeit
+import numpy as np
+import pandas as pd
+import pipeline_functions as pl
+
+
+# ~~~~ PREVIOUS IMPLEMENTATIONS ~~~~~~ #
+def legacy_table_multi_filter(dataframe, filter_criteria):
+    # the original one boolean Series per criteria implementation of table_multi_filter
+    # include values are evaluated as membership so results are comparable
+    conditions_dfs = []
+    for key, value in filter_criteria.get('include', {}).items():
+        if len(value) > 0:
+            conditions_dfs.append(dataframe[key].isin(value))
+    for key, value in filter_criteria.get('exclude', {}).items():
+        for item in value:
+            conditions_dfs.append(dataframe[key] != item)
+    for key, value in filter_criteria.get('less_than', {}).items():
+        conditions_dfs.append(dataframe[key] < value)
+    for key, value in filter_criteria.get('greater_than', {}).items():
+        conditions_dfs.append(dataframe[key] > value)
+    for key, value in filter_criteria.get('less_or_null', {}).items():
+        conditions_dfs.append((dataframe[key] < value) | pd.isnull(dataframe[key]))
+    return dataframe[pl.conjunction(*conditions_dfs)]
+
+def legacy_split_df_col2rows(dataframe, split_col, split_char, new_colname):
+    # the original per row pd.Series implementation of split_df_col2rows
+    tmp_col = dataframe[split_col].str.split(split_char).apply(pd.Series, 1).stack()
+    tmp_col.index = tmp_col.index.droplevel(-1)
+    tmp_col.name = new_colname
+    del dataframe[split_col]
+    dataframe = dataframe.join(tmp_col)
+    dataframe = dataframe.reset_index(drop=True)
+    return dataframe
+
+def legacy_split_df_col2cols(dataframe, split_col, split_char, new_colnames, delete_old = False):
+    # the original per row pd.Series implementation of split_df_col2cols
+    new_cols = dataframe[split_col].astype(np.object_).str.split(split_char).apply(pd.Series, 1)
+    if len(new_cols.columns) < len(new_colnames):
+        for i in range(len(new_cols.columns), len(new_colnames)):
+            new_cols[new_colnames[i]] = np.nan
+    new_cols.columns = new_colnames
+    if delete_old is True:
+        del dataframe[split_col]
+    new_df = dataframe.join(new_cols)
+    return new_df
+
+
+# ~~~~ SYNTHETIC DATA ~~~~~~ #
+def make_merged_table(num_rows, seed = 0):
+    '''
+    Make a synthetic table with the columns used by the filter criteria
+    and the distributions seen in merged IonTorrent variant tables
+    '''
+    random_state = np.random.RandomState(seed)
+    exonic_funcs = np.array(['synonymous SNV', 'nonsynonymous SNV', 'stopgain', 'frameshift deletion', 'unknown'], dtype = object)
+    gene_funcs = np.array(['exonic', 'intronic', 'splicing', 'UTR3', 'intergenic'], dtype = object)
+    maf = random_state.uniform(0, 0.05, num_rows)
+    maf[random_state.uniform(size = num_rows) < 0.6] = np.nan
+    merged_df = pd.DataFrame({
+    'Quality': random_state.uniform(0, 3000, num_rows),
+    'Frequency': random_state.uniform(0, 1, num_rows),
+    'Coverage': random_state.randint(0, 3000, num_rows),
+    'Strand Bias': random_state.uniform(0.5, 1, num_rows),
+    'ExonicFunc.refGene': exonic_funcs[random_state.randint(0, len(exonic_funcs), num_rows)],
+    'Func.refGene': gene_funcs[random_state.randint(0, len(gene_funcs), num_rows)],
+    '1000g2015aug_all': maf
+    })
+    return(merged_df)
+
+def make_annotation_table(num_rows, max_transcripts = 8, seed = 0):
+    '''
+    Make a synthetic table with an ANNOVAR style 'AAChange.refGene' column;
+    a comma separated list of transcript changes per variant, some rows without any
+    '''
+    random_state = np.random.RandomState(seed)
+    num_transcripts = random_state.randint(1, max_transcripts + 1, num_rows)
+    aa_changes = []
+    for i, num in enumerate(num_transcripts):
+        aa_changes.append(','.join(['GENE{0}:NM_{1:06d}:exon{2}:c.{3}G>A:p.G{3}D'.format(i % 50, j, j + 1, i) for j in range(num)]))
+    aa_changes = np.array(aa_changes, dtype = object)
+    aa_changes[random_state.uniform(size = num_rows) < 0.1] = np.nan
+    annotation_df = pd.DataFrame({
+    'Chrom': 'chr1',
+    'Position': np.arange(num_rows),
+    'AAChange.refGene': aa_changes
+    })
+    return(annotation_df)
+
+
+# ~~~~ BENCHMARKS ~~~~~~ #
+def time_function(function, repeat = 3):
+    '''
+    Return the best wall time in seconds of several calls to a function
+    '''
+    return(min(timeit.repeat(function, number = 1, repeat = repeat)))
+
+def print_comparison(name, legacy_time, new_time):
+    print('{0}:'.format(name))
+    print('  previous implementation: {0:.3f}s'.format(legacy_time))
+    print('  current implementation:  {0:.3f}s'.format(new_time))
+    print('  speedup: {0:.1f}x\n'.format(legacy_time / new_time))
+
+def benchmark_filter(num_rows, filter_criteria_json_file, repeat = 3):
+    '''
+    Compare table_multi_filter against the previous implementation
+    '''
+    filter_criteria = pl.load_json(filter_criteria_json_file)
+    merged_df = make_merged_table(num_rows)
+    print('Synthetic merged table: {0} rows\nFilter criteria: {1}\n'.format(len(merged_df), filter_criteria_json_file))
+
+    # make sure both implementations keep the same rows
+    legacy_df = legacy_table_multi_filter(merged_df, filter_criteria)
+    new_df = pl.table_multi_filter(merged_df, filter_criteria)
+    pl.kill_on_false(legacy_df.index.equals(new_df.index), my_message = "ERROR: filter implementations returned different rows!")
+    print('Rows passing filter: {0}\n'.format(len(new_df)))
+
+    legacy_time = time_function(lambda: legacy_table_multi_filter(merged_df, filter_criteria), repeat = repeat)
+    new_time = time_function(lambda: pl.table_multi_filter(merged_df, filter_criteria), repeat = repeat)
+    print_comparison('table_multi_filter', legacy_time, new_time)
+
+def benchmark_split_rows(num_rows, repeat = 3):
+    '''
+    Compare split_df_col2rows against the previous implementation
+    '''
+    annotation_df = make_annotation_table(num_rows)
+    split_args = {'split_col': 'AAChange.refGene', 'split_char': ',', 'new_colname': 'AAChange'}
+    print('Synthetic annotation table: {0} rows\n'.format(len(annotation_df)))
+
+    # make sure both implementations give the same table; the functions delete the split column so pass copies
+    legacy_df = legacy_split_df_col2rows(annotation_df.copy(), **split_args)
+    new_df = pl.split_df_col2rows(annotation_df.copy(), **split_args)
+    pl.kill_on_false(legacy_df.equals(new_df), my_message = "ERROR: split implementations returned different tables!")
+    print('Rows after split: {0}\n'.format(len(new_df)))
+
+    legacy_time = time_function(lambda: legacy_split_df_col2rows(annotation_df.copy(), **split_args), repeat = repeat)
+    new_time = time_function(lambda: pl.split_df_col2rows(annotation_df.copy(), **split_args), repeat = repeat)
+    print_comparison('split_df_col2rows', legacy_time, new_time)
+
+def benchmark_split_cols(num_rows, repeat = 3):
+    '''
+    Compare split_df_col2cols against the previous implementation
+    '''
+    annotation_df = pl.split_df_col2rows(make_annotation_table(num_rows), split_col = 'AAChange.refGene', split_char = ',', new_colname = 'AAChange')
+    split_args = {'split_col': 'AAChange', 'split_char': ':', 'new_colnames': ['Gene.AA', 'Transcript', 'Exon', 'Coding', 'Amino Acid Change'], 'delete_old': True}
+    categorical_cols = ['Gene.AA', 'Transcript', 'Exon']
+    print('Synthetic split annotation table: {0} rows\n'.format(len(annotation_df)))
+
+    # make sure both implementations give the same values
+    legacy_df = legacy_split_df_col2cols(annotation_df.copy(), **split_args)
+    new_df = pl.split_df_col2cols(annotation_df.copy(), categorical_cols = categorical_cols, **split_args)
+    pl.kill_on_false(legacy_df.equals(new_df.astype(legacy_df.dtypes.to_dict())), my_message = "ERROR: split implementations returned different tables!")
+    print('Memory used by the new columns:')
+    print('  previous implementation: {0:.1f}MB'.format(legacy_df[split_args['new_colnames']].memory_usage(index = False, deep = True).sum() / 1e6))
+    print('  current implementation:  {0:.1f}MB\n'.format(new_df[split_args['new_colnames']].memory_usage(index = False, deep = True).sum() / 1e6))
+
+    legacy_time = time_function(lambda: legacy_split_df_col2cols(annotation_df.copy(), **split_args), repeat = repeat)
+    new_time = time_function(lambda: pl.split_df_col2cols(annotation_df.copy(), categorical_cols = categorical_cols, **split_args), repeat = repeat)
+    print_comparison('split_df_col2cols', legacy_time, new_time)
+
+
+def run():
+    '''
+    Parse script args to run the script
+    '''
+    # ~~~~ GET SCRIPT ARGS ~~~~~~ #
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline table processing functions')
+    # required positional args
+    parser.add_argument("benchmark", choices = ['filter', 'split_rows', 'split_cols'], help="The benchmark to run")
+    # optional args
+    parser.add_argument("-n", default = None, type = int, dest = 'num_rows', metavar = 'number of rows', help="Number of rows in the synthetic table; defaults to 1000000 for 'filter', 100000 for 'split_rows' and 'split_cols'")
+    parser.add_argument("-f", default = "filter_criteria.json", type = str, dest = 'filter_criteria_json_file', metavar = 'filter criteria', help="Path to the filter criteria JSON file")
+    parser.add_argument("-r", default = 3, type = int, dest = 'repeat', metavar = 'repeats', help="Number of times to repeat each timing")
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'filter':
+        benchmark_filter(num_rows = args.num_rows or 1000000, filter_criteria_json_file = args.filter_criteria_json_file, repeat = args.repeat)
+    elif args.benchmark == 'split_rows':
+        benchmark_split_rows(num_rows = args.num_rows or 100000, repeat = args.repeat)
+    elif args.benchmark == 'split_cols':
+        benchmark_split_cols(num_rows = args.num_rows or 100000, repeat = args.repeat)
+
+if __name__ == "__main__":
+    run()
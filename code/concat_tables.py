@@ -9,6 +9,10 @@ concat_tables.py $FILES > output_table.tsv
 DESCRIPTION: This script will concatenate multiple flat text 
 based tables which have a common 1-line header
 
+With -columnar, a typed columnar copy of the concatenated table is also saved next to the given output table,
+built from the columnar copies of the input tables where they are current; see pipeline_functions.write_columnar_table
+concat_tables.py $FILES -columnar output_table.tsv > output_table.tsv
+
 bash equivalent:
 $ head -1 $(echo $FILES | cut -d ' ' -f1) > test_output.tsv
 $ for i in $FILES; do tail -n +2 "$i" >> test_output.tsv; done
@@ -72,10 +76,12 @@ parser.add_argument("file_list", help="Paths to input table files", nargs="+")
 
 # optional args
 # parser.add_argument("-o", default = "output.txt", type = str, dest = 'output_file', metavar = 'Table output file', help="Path to the output table file")
+parser.add_argument("-columnar", default = None, type = str, dest = 'columnar_table_file', metavar = 'Table output file', help="Also save a columnar copy of the concatenated table next to this table file; use the path stdout is redirected to")
 
 args = parser.parse_args()
 
 file_list = args.file_list
+columnar_table_file = args.columnar_table_file
 # output_file = args.output_file
 
 if __name__ == "__main__":
@@ -84,6 +90,12 @@ if __name__ == "__main__":
     # print all lines except header from all other files
     for file in file_list:
         print_file_minus_header(file = file)
+    if columnar_table_file is not None:
+        import pipeline_functions as pl
+        # the table has to be written before its columnar copy, or the copy would be older than the table and not used
+        sys.stdout.flush()
+        sidecar_file = pl.write_columnar_table(pl.concat_pipeline_tables(file_list), columnar_table_file)
+        sys.stderr.write("Columnar table saved to:\n{0}\n".format(sidecar_file))
 
 
 
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+USAGE: code/control_samples.py <command> <args>
+DESCRIPTION: Classify sample names as NC control samples or known control samples
+
+NC control samples are matched by the grep regexes in the control sample regex file,
+e.g. '^NC[[:space:]]', '^HAPMAP[[:space:]]'; the regexes are translated to Python and
+compiled into a single pattern.
+Known control samples are the sample IDs listed in the control sample ID file; they are looked up in a set.
+The compiled matcher is cached, and is only rebuilt when one of the files changes.
+
+commands:
+classify : print each sample name with its class; NC_control, known_control, or none
+NC : print the lines of tab delimited barcode files that match the NC control sample regexes, like grep -E -f
+known : exit 0 if a sample ID is a known control sample, otherwise exit 1
+
+example:
+code/control_samples.py NC output/analysis/plugin_out/variantCaller_out.1046/sample_barcode_IDs.tsv
+code/control_samples.py known "NC HAPMAP" && echo "control sample"
+cut -f1 data/misc/sample_barcode_run_analysis_index.tsv | code/control_samples.py classify -
+
+usage in a script:
+import control_samples
+matcher = control_samples.get_control_sample_matcher()
+control_samples.is_NC_control_sample(matcher, 'NC HAPMAP')
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import sys
+import os
+import re
+import argparse
+import pipeline_functions as pl
+import global_settings
+
+# used if there is no control sample regex file
+default_control_sample_regex = r'^NC|^NC\sHAPMAP|^HAPMAP'
+
+# POSIX character classes used in grep regexes, and their Python equivalents
+posix_classes = {
+'[[:space:]]': r'\s',
+'[[:digit:]]': r'\d',
+'[[:alpha:]]': r'[a-zA-Z]',
+'[[:alnum:]]': r'[a-zA-Z0-9]',
+'[[:upper:]]': r'[A-Z]',
+'[[:lower:]]': r'[a-z]'
+}
+
+# compiled matchers, by the paths and modification times of their files and the known control sample IDs
+_matchers = {}
+
+
+def grep_to_python_regex(pattern, whole_line = False):
+    '''
+    Convert a grep -E regex to a Python regex
+    grep matches the whole barcode file line, where a trailing [[:space:]] matches the tab after the sample name;
+    when matching just the sample name, the end of the name counts as the trailing space
+    whole_line : the regex is matched against whole lines, like grep, so the trailing [[:space:]] is kept as is
+    '''
+    trailing_space = pattern.endswith('[[:space:]]') and whole_line == False
+    if trailing_space == True:
+        pattern = pattern[:-len('[[:space:]]')]
+    for posix_class, python_class in posix_classes.items():
+        pattern = pattern.replace(posix_class, python_class)
+    if trailing_space == True:
+        pattern = pattern + r'(?:\s|$)'
+    return(pattern)
+
+def make_control_sample_matcher(regex_patterns = None, control_sample_IDs = None):
+    '''
+    Make a matcher for control sample names
+    regex_patterns : list of grep -E regexes for NC control samples
+    control_sample_IDs : list of known control sample IDs
+    '''
+    if regex_patterns is None or len(regex_patterns) < 1:
+        NC_regex = default_control_sample_regex
+        NC_line_regex = default_control_sample_regex
+    else:
+        NC_regex = r'|'.join(['(?:{0})'.format(grep_to_python_regex(pattern)) for pattern in regex_patterns])
+        NC_line_regex = r'|'.join(['(?:{0})'.format(grep_to_python_regex(pattern, whole_line = True)) for pattern in regex_patterns])
+    matcher = {
+    'pattern': NC_regex,
+    'regex': re.compile(NC_regex, re.IGNORECASE),
+    # same as grep -E -f; case sensitive, and searched anywhere in the whole line
+    'line_regex': re.compile(NC_line_regex),
+    'IDs': frozenset(control_sample_IDs or [])
+    }
+    return(matcher)
+
+def file_key(file_path):
+    '''
+    Return the path and modification time of a file, or None for the time if the file does not exist
+    '''
+    if file_path is not None and os.path.isfile(file_path):
+        return((file_path, os.path.getmtime(file_path)))
+    return((file_path, None))
+
+def get_control_sample_matcher(regex_file = None, ID_file = None, control_sample_IDs = None):
+    '''
+    Return the matcher for the control sample regex and ID files, from the cache if the files have not changed
+    defaults to the files in global_settings
+    control_sample_IDs : list of known control sample IDs to use instead of the ID file
+    '''
+    if regex_file is None:
+        regex_file = global_settings.control_sample_regex_file
+    if ID_file is None:
+        ID_file = global_settings.control_sample_ID_file
+    if control_sample_IDs is None:
+        key = (file_key(regex_file), file_key(ID_file))
+    else:
+        key = (file_key(regex_file), tuple(control_sample_IDs))
+    if key not in _matchers:
+        regex_patterns = pl.list_file_lines(regex_file) if key[0][1] is not None else None
+        if control_sample_IDs is None and key[1][1] is not None:
+            control_sample_IDs = pl.list_file_lines(ID_file)
+        _matchers.clear()
+        _matchers[key] = make_control_sample_matcher(regex_patterns, control_sample_IDs)
+    return(_matchers[key])
+
+def is_NC_control_sample(matcher, sample_name):
+    '''
+    Check if a sample name matches the NC control sample regexes
+    '''
+    return(matcher['regex'].match(sample_name) is not None)
+
+def is_known_control_sample(matcher, sample_name):
+    '''
+    Check if a sample name is in the list of known control sample IDs
+    '''
+    return(sample_name in matcher['IDs'])
+
+def classify_sample(matcher, sample_name):
+    '''
+    Return 'known_control', 'NC_control', or None for a sample name
+    '''
+    if is_known_control_sample(matcher, sample_name):
+        return('known_control')
+    if is_NC_control_sample(matcher, sample_name):
+        return('NC_control')
+    return(None)
+
+def classify_samples(matcher, sample_names):
+    '''
+    Yield (sample name, class) for each sample name; each distinct name is only matched once
+    '''
+    classes = {}
+    for sample_name in sample_names:
+        if sample_name not in classes:
+            classes[sample_name] = classify_sample(matcher, sample_name)
+        yield((sample_name, classes[sample_name]))
+
+def find_NC_control_lines(matcher, barcode_file):
+    '''
+    Yield the lines of a tab delimited barcode file that match the NC control sample regexes
+    Lines are matched the same way as 'grep -E -f <regex file> <barcode file>'; case sensitive, against the whole line, and every matching line
+    '''
+    with open(barcode_file, 'r') as f:
+        for line in f:
+            if matcher['line_regex'].search(line.rstrip('\n')) is not None:
+                yield(line)
+
+def read_sample_names(inputs):
+    '''
+    Yield the sample names from the args; '-' reads one sample name per line from stdin
+    '''
+    for item in inputs:
+        if item == '-':
+            for line in sys.stdin:
+                if line.strip():
+                    yield(line.strip())
+        else:
+            yield(item)
+
+def run():
+    '''
+    Parse script args to run the script
+    '''
+    # ~~~~ GET SCRIPT ARGS ~~~~~~ #
+    parser = argparse.ArgumentParser(description='Classify sample names as NC control samples or known control samples')
+    parser.add_argument("-regex_file", default = global_settings.control_sample_regex_file, type = str, dest = 'regex_file', metavar = 'regex file', help="File with grep regexes for NC control sample names")
+    parser.add_argument("-ID_file", default = global_settings.control_sample_ID_file, type = str, dest = 'ID_file', metavar = 'ID file', help="File with known control sample IDs")
+    subparsers = parser.add_subparsers(dest = 'command')
+
+    classify_parser = subparsers.add_parser('classify', help = 'Print each sample name with its class')
+    classify_parser.add_argument("sample_names", nargs = "+", help="Sample names, or '-' to read one per line from stdin")
+
+    NC_parser = subparsers.add_parser('NC', help = 'Print the barcode file lines of NC control samples')
+    NC_parser.add_argument("barcode_files", nargs = "+", help="Tab delimited barcode files with the sample name in the first column")
+
+    known_parser = subparsers.add_parser('known', help = 'Exit 0 if the sample ID is a known control sample')
+    known_parser.add_argument("sample_ID", help="Sample ID")
+
+    args = parser.parse_args()
+
+    matcher = get_control_sample_matcher(regex_file = args.regex_file, ID_file = args.ID_file)
+    if args.command == 'classify':
+        for sample_name, sample_class in classify_samples(matcher, read_sample_names(args.sample_names)):
+            sys.stdout.write('{0}\t{1}\n'.format(sample_name, sample_class or 'none'))
+    elif args.command == 'NC':
+        for barcode_file in args.barcode_files:
+            for line in find_NC_control_lines(matcher, barcode_file):
+                sys.stdout.write(line)
+    elif args.command == 'known':
+        if is_known_control_sample(matcher, args.sample_ID) == False:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    run()
@@ -150,10 +150,11 @@ function find_NC_control_sample {
 
     echo -e "Searching for NC control sample in file:\n$barcode_file"
     # set -x
-    local nc_ID="$(grep -E -f "$control_sampleID_file" "$barcode_file" | cut -f1)"
-    local nc_barcode="$(grep -E -f "$control_sampleID_file" "$barcode_file" | cut -f2)"
-    local nc_run_ID="$(grep -E -f "$control_sampleID_file" "$barcode_file" | cut -f3)"
-    local nc_analysis_ID="$(grep -E -f "$control_sampleID_file" "$barcode_file" | cut -f4)"
+    local nc_line="$("${codedir}/control_samples.py" -regex_file "$control_sampleID_file" NC "$barcode_file")"
+    local nc_ID="$(echo "$nc_line" | cut -f1)"
+    local nc_barcode="$(echo "$nc_line" | cut -f2)"
+    local nc_run_ID="$(echo "$nc_line" | cut -f3)"
+    local nc_analysis_ID="$(echo "$nc_line" | cut -f4)"
     # set +x
 
     # dir for the control sample
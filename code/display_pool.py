@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+USAGE: code/display_pool.py <command> <args>
+DESCRIPTION: Pool of Xvfb virtual displays for running IGV
+
+Displays are taken from the pool and given back when IGV is done with them; an idle display is
+reused by the next IGV run instead of starting a new Xvfb, and stays running until the pool is stopped.
+Each display in the pool has a lock file that is locked while the display is in use,
+so concurrent snapshot jobs never share a display, and stopping the pool only stops the idle displays.
+Only the Xvfb servers started by the pool are ever stopped; displays used by other users or programs
+are found from the X server lock files in /tmp and are skipped.
+
+commands:
+status : print the displays in the pool, and whether they are in use
+stop : stop the idle displays in the pool
+
+example:
+code/display_pool.py status
+code/display_pool.py stop
+
+usage in a script:
+import display_pool
+display = display_pool.acquire_display()
+os.environ['DISPLAY'] = display_pool.display_name(display)
+...
+display_pool.release_display(display)
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import sys
+import os
+import time
+import glob
+import json
+import errno
+import fcntl
+import signal
+import getpass
+import argparse
+import tempfile
+from contextlib import contextmanager
+
+# the displays are local to each host, so the pool is kept in the local tmp dir
+default_pool_dir = os.path.join(tempfile.gettempdir(), 'IGV_display_pool_{0}'.format(getpass.getuser()))
+# seconds to wait for a new Xvfb to start
+start_timeout = 10
+xvfb_screen = '1280x1024x24'
+
+
+def display_name(display):
+    return(':{0}'.format(display['display']))
+
+def pid_running(pid):
+    if pid is None:
+        return(False)
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return(e.errno == errno.EPERM)
+    return(True)
+
+def display_in_use(display_num):
+    '''
+    Check if an X server is running on the display; the same files Xvfb checks when it starts
+    '''
+    return(os.path.exists('/tmp/.X{0}-lock'.format(display_num)) or os.path.exists('/tmp/.X11-unix/X{0}'.format(display_num)))
+
+def display_file(pool_dir, display_num, ext):
+    return(os.path.join(pool_dir, 'display_{0}{1}'.format(display_num, ext)))
+
+@contextmanager
+def pool_lock(pool_dir):
+    '''
+    Lock the whole pool while displays are added to or removed from it
+    '''
+    if not os.path.isdir(pool_dir):
+        try:
+            os.makedirs(pool_dir)
+        except OSError:
+            pass
+    with open(os.path.join(pool_dir, 'pool.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def load_pool(pool_dir):
+    '''
+    Return the displays in the pool, by display number
+    '''
+    displays = []
+    for pool_file in glob.glob(os.path.join(pool_dir, 'display_*.json')):
+        with open(pool_file, 'r') as f:
+            displays.append(json.load(f))
+    return(sorted(displays, key = lambda display: display['display']))
+
+def lock_display(display, pool_dir):
+    '''
+    Try to lock a display for use; returns True if it was locked
+    '''
+    lock = open(display_file(pool_dir, display['display'], '.lock'), 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        lock.close()
+        return(False)
+    display['lock'] = lock
+    return(True)
+
+def remove_display(display, pool_dir):
+    for ext in ['.json', '.lock']:
+        try:
+            os.remove(display_file(pool_dir, display['display'], ext))
+        except OSError:
+            pass
+
+def start_xvfb(display_num, log_file = os.devnull):
+    '''
+    Start Xvfb on the display, and wait for it to accept connections
+    returns the pid of Xvfb, or None if it did not start
+    '''
+    import subprocess as sp
+    with open(log_file, 'a') as log:
+        try:
+            # own process group, so the display keeps running after the script that started it exits
+            process = sp.Popen(['Xvfb', ':{0}'.format(display_num), '-screen', '0', xvfb_screen], stdout = log, stderr = log, preexec_fn = os.setpgrp)
+        except OSError as e:
+            log.write('ERROR: Could not start Xvfb: {0}\n'.format(e))
+            return(None)
+    start = time.time()
+    while time.time() - start < start_timeout:
+        if os.path.exists('/tmp/.X11-unix/X{0}'.format(display_num)):
+            return(process.pid)
+        if process.poll() is not None:
+            return(None)
+        time.sleep(0.1)
+    os.kill(process.pid, signal.SIGTERM)
+    return(None)
+
+def new_display(pool_dir, dedicated = False, log_file = os.devnull):
+    '''
+    Start Xvfb on the first display that is not used by any X server and add it to the pool, locked for use
+    dedicated : the display is only for the caller, e.g. a background IGV server, and is not reused by acquire_display;
+    it stays in use until stop_display is called for it
+    returns the display, or None if no display could be started
+    '''
+    pool_displays = [display['display'] for display in load_pool(pool_dir)]
+    for display_num in range(1, 1000):
+        if display_num in pool_displays or display_in_use(display_num):
+            continue
+        display = {'display': display_num, 'pid': None, 'dedicated': dedicated}
+        if lock_display(display, pool_dir) == False:
+            continue
+        display['pid'] = start_xvfb(display_num, log_file = log_file)
+        if display['pid'] is None:
+            release_display(display)
+            remove_display(display, pool_dir)
+            # the display may have been taken by another X server since it was checked; try the next one
+            if display_in_use(display_num):
+                continue
+            return(None)
+        with open(display_file(pool_dir, display_num, '.json'), 'w') as f:
+            json.dump(dict((key, value) for key, value in display.items() if key != 'lock'), f)
+        return(display)
+    return(None)
+
+def acquire_display(pool_dir = default_pool_dir, dedicated = False, log_file = os.devnull):
+    '''
+    Get a display to run IGV on; an idle display from the pool, or a new one if they are all in use
+    returns a dict with the 'display' number, the 'pid' of its Xvfb, and its 'lock'; or None if no display could be started
+    '''
+    with pool_lock(pool_dir):
+        if dedicated == False:
+            for display in load_pool(pool_dir):
+                if display['dedicated'] == True:
+                    continue
+                if not pid_running(display['pid']):
+                    remove_display(display, pool_dir)
+                    continue
+                if lock_display(display, pool_dir) == True:
+                    return(display)
+        return(new_display(pool_dir, dedicated = dedicated, log_file = log_file))
+
+def release_display(display):
+    '''
+    Give a display back to the pool; the display keeps running for the next IGV run
+    '''
+    lock = display.pop('lock', None)
+    if lock is not None:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+
+def kill_display(display, pool_dir):
+    if pid_running(display['pid']):
+        try:
+            os.killpg(display['pid'], signal.SIGTERM)
+        except OSError:
+            pass
+    remove_display(display, pool_dir)
+
+def stop_display(display, pool_dir = default_pool_dir):
+    '''
+    Stop a display that was acquired from the pool, e.g. a dedicated display
+    '''
+    with pool_lock(pool_dir):
+        release_display(display)
+        kill_display(display, pool_dir)
+
+def stop_pool(pool_dir = default_pool_dir, force = False):
+    '''
+    Stop the displays in the pool that are not in use
+    force : also stop the displays that are in use
+    returns the list of stopped display numbers
+    '''
+    stopped = []
+    if not os.path.isdir(pool_dir):
+        return(stopped)
+    with pool_lock(pool_dir):
+        for display in load_pool(pool_dir):
+            if display['dedicated'] == True and force == False:
+                continue
+            if lock_display(display, pool_dir) == True or force == True:
+                release_display(display)
+                kill_display(display, pool_dir)
+                stopped.append(display['display'])
+    return(stopped)
+
+def pool_status(pool_dir = default_pool_dir):
+    '''
+    Return the displays in the pool with their status; 'idle', 'in use', or 'stopped'
+    '''
+    displays = load_pool(pool_dir) if os.path.isdir(pool_dir) else []
+    for display in displays:
+        if not pid_running(display['pid']):
+            display['status'] = 'stopped'
+        elif lock_display(display, pool_dir) == True:
+            release_display(display)
+            display['status'] = 'idle'
+        else:
+            display['status'] = 'in use'
+    return(displays)
+
+
+def run():
+    '''
+    Parse script args to run the script
+    '''
+    # ~~~~ GET SCRIPT ARGS ~~~~~~ #
+    parser = argparse.ArgumentParser(description='Pool of Xvfb displays for IGV')
+    parser.add_argument("-pool_dir", default = default_pool_dir, type = str, dest = 'pool_dir', metavar = 'pool dir', help="Dir with the pool's display lock files")
+    subparsers = parser.add_subparsers(dest = 'command')
+
+    status_parser = subparsers.add_parser('status', help = 'Print the displays in the pool')
+
+    stop_parser = subparsers.add_parser('stop', help = 'Stop the idle displays in the pool')
+    stop_parser.add_argument("-force", default = False, action = 'store_true', dest = 'force', help="Also stop the displays that are in use, including dedicated displays")
+
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        for display in pool_status(args.pool_dir):
+            print(':{0}\tpid {1}\t{2}{3}'.format(display['display'], display['pid'], display['status'], '\tdedicated' if display['dedicated'] else ''))
+    elif args.command == 'stop':
+        for display_num in stop_pool(args.pool_dir, force = args.force):
+            print('Stopped display :{0}'.format(display_num))
+
+if __name__ == "__main__":
+    run()
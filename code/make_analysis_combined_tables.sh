@@ -22,23 +22,25 @@ for i in $analysis_ID_list; do
     analysis_outdir="${outdir}/${analysis_ID}"
 
     # make list of summary tables
+    # the files are listed from the persistent output index; only the analysis dirs that changed are rescanned
     summary_pattern="*summary.tsv"
     if [ -z "${summary_table_list:-}" ]; then
         # if list doesn't exit, make it
-        summary_table_list="$(find_analysis_files "$analysis_outdir" "$summary_pattern")"
+        summary_table_list="$("${codedir}/output_index.py" query -analysis "$analysis_ID" -name "$summary_pattern")"
     elif [ ! -z "${summary_table_list:-}" ]; then
         # if list exists, add to it
-        summary_table_list="${summary_table_list} $(find_analysis_files "$analysis_outdir" "summary_pattern")"
+        summary_table_list="${summary_table_list} $("${codedir}/output_index.py" query -analysis "$analysis_ID" -name "$summary_pattern")"
     fi
 
     # make list of all annotation files
+    # the index was just updated for the analysis
     annotation_pattern="*_multianno.txt"
     if [ -z "${annotation_table_list:-}" ]; then
         # if list doesn't exit, make it
-        annotation_table_list="$(find_analysis_files "$analysis_outdir" "$annotation_pattern")"
+        annotation_table_list="$("${codedir}/output_index.py" query -no_update -analysis "$analysis_ID" -name "$annotation_pattern")"
     elif [ ! -z "${annotation_table_list:-}" ]; then
         # if list exists, add to it
-        annotation_table_list="${annotation_table_list} $(find_analysis_files "$analysis_outdir" "$annotation_pattern")"
+        annotation_table_list="${annotation_table_list} $("${codedir}/output_index.py" query -no_update -analysis "$analysis_ID" -name "$annotation_pattern")"
     fi
 
 done
@@ -37,12 +37,13 @@ for i in $analysis_ID_list; do
 
     #~~~~~ FIND ANALYIS SAMPLES ~~~~~~#
     # find all samples in the analysis dir
+    # the dirs and files are listed from the persistent output index; only the analysis dirs that changed are rescanned
     echo -e "Searching for samples in analysis dir..."
-    analysis_samples="$(find "$analysis_outdir" -type d -path "*variantCaller_out*" -name "*IonXpress_*")"
+    analysis_samples="$("${codedir}/output_index.py" dirs -analysis "$analysis_ID" -path "*variantCaller_out*" -name "*IonXpress_*")"
     error_on_zerolength "$analysis_samples" "TRUE" "Checking to make sure samples were found..."
 
     echo -e "Searching for analysis barcodes file..."
-    barcodes_file="$(find "$analysis_outdir" -type f -path "*variantCaller_out*" -name "sample_barcode_IDs.tsv")"
+    barcodes_file="$("${codedir}/output_index.py" query -no_update -analysis "$analysis_ID" -path "*variantCaller_out*" -name "sample_barcode_IDs.tsv")"
     error_on_zerolength "$barcodes_file" "TRUE" "Checking to make sure barcode file was found..."
     echo -e "Barcode file is:\n$barcodes_file"
 
@@ -76,7 +77,7 @@ for i in $analysis_ID_list; do
         # find sample IGV dir
         set -x
         echo -e "\nSearching for IGV snapshot dir..."
-        sample_IGV_dir="$(find "$analysis_outdir" -type d -path "*coverageAnalysis_out*" -path "*$sample_barcode*" -name "*IGV_snapshots*")"
+        sample_IGV_dir="$("${codedir}/output_index.py" dirs -no_update -analysis "$analysis_ID" -path "*coverageAnalysis_out*${sample_barcode}*" -name "*IGV_snapshots*")"
         check_dirfile_exists "$sample_IGV_dir" "d" "Checking to make sure IGV dir was found..."
         echo -e "\nIGV snapshot dir is:\n$sample_IGV_dir"
 
@@ -115,7 +116,7 @@ for i in $analysis_ID_list; do
 
         # FIND SUMMARY TABLE
         echo -e "\nSearching for sample summary table file..."
-        sample_summary_file="$(find_sample_file "$analysis_outdir" "variantCaller_out" "$sample_barcode" "_summary.tsv" | head -1)"
+        sample_summary_file="$("${codedir}/output_index.py" query -no_update -analysis "$analysis_ID" -path "*variantCaller_out*${sample_barcode}*" -name "*_summary.tsv" | head -1)"
         # error_on_zerolength "$sample_summary_file" "TRUE" "Checking to make sure sample file was found..."
         check_dirfile_exists "$sample_summary_file" "f" "Checking to make sure sample file was found..."
         echo -e "\nSample summary table file is:\n$sample_summary_file\n"
@@ -135,7 +136,7 @@ for i in $analysis_ID_list; do
 
         # find comments file.. # IonXpress_008_comments.md
         echo -e "\nSearching for sample report comments file..."
-        sample_comments_file="$(find_sample_file "$analysis_outdir" "variantCaller_out" "$sample_barcode" "_comments.md" | head -1)"
+        sample_comments_file="$("${codedir}/output_index.py" query -no_update -analysis "$analysis_ID" -path "*variantCaller_out*${sample_barcode}*" -name "*_comments.md" | head -1)"
         # error_on_zerolength "$sample_summary_file" "TRUE" "Checking to make sure sample file was found..."
         check_dirfile_exists "$sample_comments_file" "f" "Checking to make sure report comments file was found..."
         echo -e "\nSample comments file is:\n$sample_comments_file\n"
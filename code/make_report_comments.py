@@ -15,6 +15,8 @@ import os
 import errno
 import re
 import argparse
+import pipeline_functions as pl
+import table_schemas
 
 # ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
 def my_debugger():
@@ -81,7 +83,10 @@ if __name__ == "__main__":
     print summary_table_file
     print clin_file
 
-    summary_df = pd.read_table(summary_table_file)
+    # get list of genes; from the summary table metadata if it is up to date, otherwise from the table
+    summary_metadata = pl.load_summary_metadata(summary_table_file)
+    if summary_metadata is None:
+        summary_df = table_schemas.read_schema_table(summary_table_file, 'summary', stage = 'report_comments')
     # print summary_df
 
     # clin_df = pd.read_table(clin_file, encoding='utf-16')
@@ -91,9 +96,12 @@ if __name__ == "__main__":
 
     # get list of genes
     gene_list = []
-    for gene in summary_df['Gene'].tolist():
-        if gene not in gene_list:
-            gene_list.append(gene)
+    if summary_metadata is not None:
+        gene_list = summary_metadata['genes']
+    else:
+        for gene in summary_df['Gene'].tolist():
+            if gene not in gene_list:
+                gene_list.append(gene)
     print gene_list
 
     
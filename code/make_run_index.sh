@@ -21,7 +21,8 @@ done
 
 }
 
-find output/ -name "*.xls" -name "R_*" -path "*variantCaller_out.*" ! -name "*cov.xls" | while read file; do 
+# R_*.xls run sheets in the variantCaller_out dirs; from the persistent output index instead of a find of the whole output dir
+code/output_index.py query -kind run_xls -not_name "*cov.xls" | while read file; do 
     make_barcodes_list "$file" | grep -Ev '^#' | grep -Ev '^$'
 done
 
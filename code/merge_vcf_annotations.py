@@ -3,7 +3,8 @@
 
 
 """
-USAGE: merge_vcf_annotations.py run_barcodes_file.txt vcf_query_file.tsv annovar_annotations_file.txt transcript_list.txt panel_genes.txt actionable_genes.txt
+USAGE: merge_vcf_annotations.py run_barcodes_file.txt vcf_query_file.tsv annovar_annotations_file.txt transcript_list.txt panel_genes.txt actionable_genes.txt analysis_ID TSVC_variants.vcf
+USAGE: merge_vcf_annotations.py -analysis_dir /path/to/analysis_dir -analysis_ID analysis_ID -threads 4
 
 DESCRIPTION:
 0. Get Sample ID's and Barcode ID's from the sample_barcode_IDs.tsv file previously created by the pipeline
@@ -11,9 +12,12 @@ DESCRIPTION:
 2. Merge the VCF and Annotation tables
 3. Split the Annotaton transcript fields into separate rows
 4. Add sample ID, barcode, and run fields
-5. Save summary, full, and filtered tables
+5. Save the full table, and the summary and filtered tables as views of it;
+the views are saved as tables too unless -tiered is used, see code/table_views.py
 
-This script operates on a single sample in an analysis run
+This script operates on a single sample in an analysis run,
+or on every IonXpress_* sample in an analysis dir with -analysis_dir;
+the reference lists and filter criteria are then loaded once and the samples are processed in a pool of processes
 """
 
 # ~~~~ LOAD PACKAGES ~~~~~~ #
@@ -23,14 +27,26 @@ import os
 import errno
 import pandas as pd # pandas==0.17.1
 import numpy as np # numpy==1.11.0
+import argparse
 import pipeline_functions as pl
+import global_settings
+import table_schemas
+import stage_profiler
+
+# Summary Table Fields:
+summary_cols = table_schemas.summary_cols
+
+# merge key fields
+merge_cols = ['Chrom', 'Position', 'Ref', 'Variant']
+
+# reference data used by the processes in the sample pool; set by pool_init
+pool_reference_data = None
 
 # ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
 def test_canonical_transcripts(df, canon_trancr_list):
     # check to make sure that only canonical transcript ID's are in the df
-    for transcript in  df['Transcript'].tolist():
-        transcript = str(transcript)
-        # print transcript
+    # canon_trancr_list is a set, check each unique transcript once
+    for transcript in set(df['Transcript'].astype(str)):
         if not transcript in canon_trancr_list:
             print "ERROR: Transcript in table is not in the canonical transcript list:\n" + transcript
             print "Exiting..."
@@ -55,139 +71,475 @@ def find_vcf_timestamp(vcf_file):
                 return line.strip().split("=")[1]
 
 
-# ~~~~ GET SCRIPT ARGS ~~~~~~ #
-# print 'script name is:', sys.argv[0]
-# print 'Number of arguments:\n', len(sys.argv)
-# print 'Argument List:', str(sys.argv)
-barcodes_file = sys.argv[1]
-query_file = sys.argv[2]
-annotation_file = sys.argv[3]
-canon_trancr_file = sys.argv[4]
-panel_genes_file = sys.argv[5]
-actionable_genes_file = sys.argv[6]
-analysis_ID = sys.argv[7]
-vcf_file = sys.argv[8]
-
-# load the filter criteria for the summary table
-filter_criteria_json_file = 'filter_criteria.json'
-filter_criteria = pl.load_json(filter_criteria_json_file)
-
-vcf_timestamp = find_vcf_timestamp(vcf_file)
-canon_trancr_list = pl.list_file_lines(canon_trancr_file)
-panel_genes = pl.list_file_lines(panel_genes_file)
-actionable_genes = pl.list_file_lines(actionable_genes_file)
-outdir = os.path.dirname(annotation_file)
-
-# Summary Table Fields:
-summary_cols = ["Chrom", "Position", "Ref", "Variant", "Gene", "Quality", "Coverage", "Allele Coverage", "Strand Bias", "Coding", "Amino Acid Change", "Transcript", "Frequency", "Sample Name", "Barcode", "Run Name", "Review", "Analysis ID", "Date"]
-
-
-
-# ~~~~ LOAD TABLES ~~~~~~ #
-barcodes_df = pd.read_table(barcodes_file,sep='\t',header=0,na_values=['.'])
-query_df = pd.read_table(query_file,sep='\t',header=0,na_values=['.'])
-annotation_df = pd.read_table(annotation_file,sep='\t',header=0,na_values=['.'])
-
-
-# ~~~~ GET SAMPLE BARCODE ID ~~~~~~ #
-barcode_ID = os.path.basename(os.path.dirname(query_file))
-sample_ID = barcodes_df.loc[barcodes_df['Barcode'] == barcode_ID, 'Sample Name'].values[0]
-run_ID = barcodes_df.loc[barcodes_df['Barcode'] == barcode_ID, 'Run Name'].values[0]
-
-
-# ~~~~ PROCESS & MERGE TABLES ~~~~~~ #
-# rename the columns for merging
-annotation_df = annotation_df.rename(columns = {'Chr':'Chrom', 'Start':'Position', 'Ref':'Ref', 'Alt':'Variant', 'Gene.refGene':'Gene'})
-
-query_df = query_df.rename(columns = {'Chrom':'Chrom', 'Position':'Position', 'Ref':'Ref'})
-
-# merge
-merge_df = pd.merge(annotation_df, query_df, on=['Chrom', 'Position', 'Ref', 'Variant']) # , how = 'left'
-
-# split the AAChange rows in the table
-merge_df = pl.split_df_col2rows(dataframe = merge_df, split_col = 'AAChange.refGene', split_char = ',', new_colname = 'AAChange')
-
-
-# split the new columns into separate columns
-merge_df = pl.split_df_col2cols(dataframe = merge_df, split_col = 'AAChange', split_char = ':', new_colnames = ['Gene.AA', 'Transcript', 'Exon', 'Coding', 'Amino Acid Change'], delete_old = True)
-
-# the merged fields:
-# Chrom Position    End Ref Variant Func.refGene    Gene.refGene    GeneDetail.refGene
-# ExonicFunc.refGene  cosmic68    clinvar_20150629    1000g2015aug_all
-# Quality Allele Frequency    Coverage    Allele Coverage Strand Bias Gene
-# Transcript  Exon    Coding  Amino Acid Change   Barcode Sample Name Run Name
-
-# ~~~~ FILTER TABLE ~~~~~~ #
-'''
-merge table:
-filter for only canon transcripts # canon_trancr_list
-filter for desired variant qualities
-
-summary table:
-filter for desired columns
-'''
-
-# get the list of unique genes in the table
-table_genes = merge_df.Gene.unique()
-
-# keep only canonical transcripts
-merge_df = merge_df[merge_df['Transcript'].isin(canon_trancr_list)]
-
-# sanity check:
-# make sure only canonical transcripts passed the filter
-test_canonical_transcripts(merge_df, canon_trancr_list)
-# make sure that all unique genes are represented after filtering for canonical transcripts
-# test_filtered_genes(merge_df, table_genes)
-# don't do this it doesn't work for variants that had no trainscript..
-
-
-
-# add sample IDs to table
-merge_df['Barcode'] = barcode_ID
-merge_df['Sample Name'] = sample_ID
-merge_df['Run Name'] = run_ID
-merge_df['Analysis ID'] = analysis_ID
-merge_df['Date'] = vcf_timestamp
-
-# keep only the panel genes; default Unknown Significance
-merge_df = merge_df[merge_df["Gene"].isin(panel_genes)]
-
-# add review; Known Signficance, Unknown Significance ; panel genes
-# default is Unknown Signficiance
-merge_df['Review'] = 'US'
-
-# change actionable genes to Known Signficance
-merge_df.loc[merge_df["Gene"].isin(actionable_genes), 'Review'] = "KS"
-# !! need tests for these ^^
-
-# make a copy of the complete table before filtering for qualities
-full_df = merge_df
-
-# filter varaints based on quality criteria; filter rows
-# only filter if there's at least 1 row..
-# pl.my_debugger(globals().copy())
-if len(merge_df) > 0:
-    merge_df = pl.table_multi_filter(merge_df, filter_criteria)
-else:
-    print """
+def process_merged_table(merge_df, canon_trancr_list, panel_genes, actionable_genes, sample_fields, profile = None):
+    '''
+    Split the annotation transcripts into rows and columns, keep the canonical transcripts and panel genes,
+    and add the sample ID and review fields
+    sample_fields : dict of column name: value to add to every row; Barcode, Sample Name, etc.
+    profile : stage_profiler profile to add the split and annotate stages to
+    returns the full table
+    '''
+    with stage_profiler.profile_stage(profile, 'split_transcripts', rows_in = len(merge_df)) as stage:
+        # split the AAChange rows in the table
+        merge_df = pl.split_df_col2rows(dataframe = merge_df, split_col = 'AAChange.refGene', split_char = ',', new_colname = 'AAChange')
+
+        # split the new columns into separate columns
+        # low cardinality fields are stored as categoricals
+        merge_df = pl.split_df_col2cols(dataframe = merge_df, split_col = 'AAChange', split_char = ':', new_colnames = ['Gene.AA', 'Transcript', 'Exon', 'Coding', 'Amino Acid Change'], delete_old = True, categorical_cols = ['Gene.AA', 'Transcript', 'Exon'])
+        stage['rows_out'] = len(merge_df)
+
+    with stage_profiler.profile_stage(profile, 'annotate', rows_in = len(merge_df)) as stage:
+        # the merged fields:
+        # Chrom Position    End Ref Variant Func.refGene    Gene.refGene    GeneDetail.refGene
+        # ExonicFunc.refGene  cosmic68    clinvar_20150629    1000g2015aug_all
+        # Quality Allele Frequency    Coverage    Allele Coverage Strand Bias Gene
+        # Transcript  Exon    Coding  Amino Acid Change   Barcode Sample Name Run Name
+
+        # ~~~~ FILTER TABLE ~~~~~~ #
+        '''
+        merge table:
+        filter for only canon transcripts # canon_trancr_list
+        filter for desired variant qualities
+
+        summary table:
+        filter for desired columns
+        '''
+
+        # keep only canonical transcripts
+        merge_df = merge_df[merge_df['Transcript'].isin(canon_trancr_list)]
+
+        # sanity check:
+        # make sure only canonical transcripts passed the filter
+        test_canonical_transcripts(merge_df, canon_trancr_list)
+        # make sure that all unique genes are represented after filtering for canonical transcripts
+        # test_filtered_genes(merge_df, table_genes)
+        # don't do this it doesn't work for variants that had no trainscript..
+
+        # add sample IDs to table
+        for key in ['Barcode', 'Sample Name', 'Run Name', 'Analysis ID', 'Date']:
+            merge_df[key] = sample_fields[key]
+
+        # keep only the panel genes; default Unknown Significance
+        merge_df = merge_df[merge_df["Gene"].isin(panel_genes)]
+
+        # add review; Known Signficance, Unknown Significance ; panel genes
+        # default is Unknown Signficiance
+        merge_df['Review'] = 'US'
+
+        # change actionable genes to Known Signficance
+        merge_df.loc[merge_df["Gene"].isin(actionable_genes), 'Review'] = "KS"
+        # !! need tests for these ^^
+        stage['rows_out'] = len(merge_df)
+    return(merge_df)
+
+def filter_full_table_rows(full_df, filter_criteria):
+    '''
+    Filter the variants in the full table based on quality criteria
+    returns the positions of the rows in the full table that pass the criteria
+    '''
+    # filter varaints based on quality criteria; filter rows
+    # only filter if there's at least 1 row..
+    if len(full_df) > 0:
+        filter_plan = pl.compile_filter_criteria(filter_criteria)
+        return(pl.filter_plan_rows(full_df, filter_plan))
+    else:
+        print """
 WARNING: Table lenght {} is less than 1; table has no rows, and will not be filtered.
-    """.format(len(merge_df))
-
-# make the summary table
-# filter out fields that aren't needed for reporting; filter columns
-summary_df = merge_df[summary_cols]
-
-
-
-# ~~~~ SAVE TABLES ~~~~~~ #
-summary_file = os.path.join(outdir, barcode_ID + "_summary.tsv")
-summary_df.to_csv(summary_file, sep='\t', index=False)
-print "Summary table (filtered rows & columns) saved to:\n" + summary_file + "\n"
-
-merge_file = os.path.join(outdir, barcode_ID + "_filtered.tsv")
-merge_df.to_csv(merge_file, sep='\t', index=False)
-print "Filtered table (rows only) saved to:\n" + merge_file + "\n"
-
-full_table_file = os.path.join(outdir, barcode_ID + "_full_table.tsv")
-full_df.to_csv(full_table_file, sep='\t', index=False)
-print "Full table saved to :\n" + full_table_file + "\n"
+    """.format(len(full_df))
+        return(np.arange(len(full_df)))
+
+def select_view(full_df, rows, columns = None):
+    '''
+    Select a view of the full table; the rows at the given positions, and the given columns or all columns
+    '''
+    view_df = full_df.iloc[rows]
+    if columns is not None:
+        view_df = view_df[columns]
+    return(view_df)
+
+def filter_full_table(full_df, filter_criteria):
+    '''
+    Filter the variants in the full table based on quality criteria
+    returns the filtered table (rows only) and the summary table (filtered rows & columns)
+    '''
+    filter_rows = filter_full_table_rows(full_df, filter_criteria)
+    merge_df = select_view(full_df, filter_rows)
+    # make the summary table
+    # filter out fields that aren't needed for reporting; filter columns
+    summary_df = select_view(full_df, filter_rows, summary_cols)
+    return(merge_df, summary_df)
+
+def new_summary_metadata():
+    '''
+    Start the metadata for a sample's summary table; see update_summary_metadata
+    '''
+    import hashlib
+    metadata = {'rows': 0, 'min_frequency': None, 'max_frequency': None, 'genes': [], 'review_counts': {'KS': 0, 'US': 0}, 'columns': list(summary_cols)}
+    return((metadata, hashlib.sha1()))
+
+def update_summary_metadata(metadata, sha1, summary_df, header = True):
+    '''
+    Add the rows of a summary table, or of a block of it, to the summary metadata
+    sha1 : hash of the summary table text, updated with the rows as they are written to the table
+    '''
+    metadata['rows'] += len(summary_df)
+    frequency = summary_df['Frequency'].dropna()
+    if len(frequency) > 0:
+        metadata['min_frequency'] = min([value for value in [metadata['min_frequency'], float(frequency.min())] if value is not None])
+        metadata['max_frequency'] = max([value for value in [metadata['max_frequency'], float(frequency.max())] if value is not None])
+    # genes in the order they first appear in the table
+    for gene in summary_df['Gene'].dropna().unique():
+        if gene not in metadata['genes']:
+            metadata['genes'].append(gene)
+    for review, count in summary_df['Review'].value_counts().iteritems():
+        metadata['review_counts'][review] = metadata['review_counts'].get(review, 0) + int(count)
+    sha1.update(summary_df.to_csv(sep='\t', index=False, header = header))
+
+def write_summary_metadata(metadata, sha1, summary_file):
+    '''
+    Save the summary metadata next to the summary table
+    '''
+    import os
+    metadata['sha1'] = sha1.hexdigest()
+    metadata['summary_table'] = os.path.basename(summary_file)
+    metadata_file = pl.summary_metadata_file(summary_file)
+    pl.write_json(metadata, metadata_file)
+    return(metadata_file)
+
+def read_annotation_table(annotation_file, chunksize = None, nrows = None):
+    # load the ANNOVAR table and rename the columns for merging
+    # with chunksize, returns an iterator of renamed chunks
+    annotation_cols = {'Chr':'Chrom', 'Start':'Position', 'Ref':'Ref', 'Alt':'Variant', 'Gene.refGene':'Gene'}
+    if chunksize is None:
+        annotation_df = table_schemas.read_schema_table(annotation_file, 'annotation', stage = 'merge', nrows = nrows)
+        return(annotation_df.rename(columns = annotation_cols))
+    reader = table_schemas.read_schema_table(annotation_file, 'annotation', stage = 'merge', chunksize = chunksize)
+    return((chunk.rename(columns = annotation_cols) for chunk in reader))
+
+def read_query_table(query_file, chunksize = None, nrows = None):
+    # load the bcftools query table
+    return(table_schemas.read_schema_table(query_file, 'query', stage = 'merge', chunksize = chunksize, nrows = nrows))
+
+def iter_merged_blocks(query_file, annotation_file, vcf_file, chunksize):
+    '''
+    Yield the blocks of the streaming merge of the query and annotation tables
+    if no blocks are merged, e.g. a table has no rows, yields a single empty block so the output tables still get their headers
+    raises ValueError if either table is not in the contig order of the VCF
+    '''
+    query_chunks = read_query_table(query_file, chunksize = chunksize)
+    annotation_chunks = read_annotation_table(annotation_file, chunksize = chunksize)
+    blocks = 0
+    # the tables are in the contig order of the VCF header, which need not be karyotypic
+    for merge_df in pl.iter_sorted_merge(annotation_chunks, query_chunks, on = merge_cols, chrom_order = pl.vcf_contig_order(vcf_file)):
+        blocks += 1
+        yield(merge_df)
+    if blocks < 1:
+        yield(pl.empty_merge(read_annotation_table(annotation_file, nrows = 0), read_query_table(query_file, nrows = 0), on = merge_cols))
+
+
+def load_reference_data(canon_trancr_file, panel_genes_file, actionable_genes_file, filter_criteria_json_file = 'filter_criteria.json', bundle_file = global_settings.reference_bundle_file):
+    '''
+    Load the reference lists and filter criteria shared by every sample in an analysis
+    the lists are loaded as sets from the reference bundle if it is up to date with the list files
+    '''
+    list_files = {'canonical_transcripts': canon_trancr_file, 'panel_genes': panel_genes_file, 'actionable_genes': actionable_genes_file}
+    reference_sets = pl.load_reference_sets(list_files, bundle_file = bundle_file)
+    reference_data = {}
+    reference_data['filter_criteria'] = pl.load_json(filter_criteria_json_file)
+    reference_data['canon_trancr_list'] = reference_sets['canonical_transcripts']
+    reference_data['panel_genes'] = reference_sets['panel_genes']
+    reference_data['actionable_genes'] = reference_sets['actionable_genes']
+    return(reference_data)
+
+def merge_sample(barcodes_file, query_file, annotation_file, analysis_ID, vcf_file, reference_data, stream = False, chunksize = 10000, barcodes_df = None, columnar = False, tiered = False, materialize = None, profile = False):
+    '''
+    Merge the query and annotation tables for a single sample and save the summary, filtered, and full tables
+    barcodes_df : the loaded barcodes_file, if it has already been read
+    columnar : also save a typed columnar copy of each table next to the TSV; not available with stream
+    tiered : write the full table only once; the summary and filtered tables are saved as views of it in the views manifest
+    materialize : with tiered, list of views to also write as tables; 'summary', 'filtered'
+    profile : save the wall time, CPU time, peak memory, and rows in and out of each stage to <barcode>_profile.jsonl
+    '''
+    filter_criteria = reference_data['filter_criteria']
+    canon_trancr_list = reference_data['canon_trancr_list']
+    panel_genes = reference_data['panel_genes']
+    actionable_genes = reference_data['actionable_genes']
+    vcf_timestamp = find_vcf_timestamp(vcf_file)
+    outdir = os.path.dirname(annotation_file)
+
+    # ~~~~ GET SAMPLE BARCODE ID ~~~~~~ #
+    if barcodes_df is None:
+        barcodes_df = table_schemas.read_schema_table(barcodes_file, 'barcodes', stage = 'merge')
+    barcode_ID = os.path.basename(os.path.dirname(query_file))
+    sample_ID = barcodes_df.loc[barcodes_df['Barcode'] == barcode_ID, 'Sample Name'].values[0]
+    run_ID = barcodes_df.loc[barcodes_df['Barcode'] == barcode_ID, 'Run Name'].values[0]
+
+    sample_fields = {'Barcode': barcode_ID, 'Sample Name': sample_ID, 'Run Name': run_ID, 'Analysis ID': analysis_ID, 'Date': vcf_timestamp}
+    sample_profile = None
+    if profile == True:
+        sample_profile = stage_profiler.new_profile({'Barcode': barcode_ID, 'Sample Name': sample_ID, 'Analysis ID': analysis_ID, 'stream': stream, 'tiered': tiered})
+
+    summary_file = os.path.join(outdir, barcode_ID + "_summary.tsv")
+    merge_file = os.path.join(outdir, barcode_ID + "_filtered.tsv")
+    full_table_file = os.path.join(outdir, barcode_ID + "_full_table.tsv")
+    views_file = os.path.join(outdir, barcode_ID + "_views.json")
+    profile_file = os.path.join(outdir, barcode_ID + stage_profiler.profile_ext)
+
+    # the summary and filtered tables are views of the full table; the same filtered rows, all or only the summary columns
+    # they are always saved in the views manifest, and written as tables unless tiered output is used
+    view_files = {'summary': summary_file, 'filtered': merge_file}
+    view_columns = {'summary': summary_cols, 'filtered': None}
+    if tiered == True:
+        write_views = [view_name for view_name in ['summary', 'filtered'] if view_name in (materialize or [])]
+    else:
+        write_views = ['summary', 'filtered']
+    # remove view tables left from a previous run so they are not mistaken for the current ones
+    for view_name in view_files.keys():
+        if view_name not in write_views:
+            for old_file in [view_files[view_name]] + pl.columnar_table_files(view_files[view_name]):
+                if os.path.isfile(old_file):
+                    os.remove(old_file)
+
+    # summary of the summary table for the later pipeline steps; row count, Frequency range, genes, etc.
+    summary_metadata, summary_sha1 = new_summary_metadata()
+
+    if stream == False:
+        # ~~~~ LOAD TABLES ~~~~~~ #
+        with stage_profiler.profile_stage(sample_profile, 'load') as stage:
+            query_df = read_query_table(query_file)
+            annotation_df = read_annotation_table(annotation_file)
+            stage['rows_out'] = len(query_df) + len(annotation_df)
+
+        # ~~~~ PROCESS & MERGE TABLES ~~~~~~ #
+        with stage_profiler.profile_stage(sample_profile, 'merge', rows_in = len(query_df) + len(annotation_df)) as stage:
+            merge_df = pd.merge(annotation_df, query_df, on=merge_cols) # , how = 'left'
+            stage['rows_out'] = len(merge_df)
+        full_df = process_merged_table(merge_df, canon_trancr_list, panel_genes, actionable_genes, sample_fields, profile = sample_profile)
+        with stage_profiler.profile_stage(sample_profile, 'filter', rows_in = len(full_df)) as stage:
+            filter_rows = filter_full_table_rows(full_df, filter_criteria)
+            stage['rows_out'] = len(filter_rows)
+
+        # ~~~~ SAVE TABLES ~~~~~~ #
+        with stage_profiler.profile_stage(sample_profile, 'write', rows_in = len(full_df)) as stage:
+            full_df.to_csv(full_table_file, sep='\t', index=False)
+            view_dfs = {}
+            for view_name in write_views:
+                view_dfs[view_name] = select_view(full_df, filter_rows, view_columns[view_name])
+                view_dfs[view_name].to_csv(view_files[view_name], sep='\t', index=False)
+            stage['rows_out'] = len(full_df) + sum([len(view_df) for view_df in view_dfs.values()])
+            update_summary_metadata(summary_metadata, summary_sha1, select_view(full_df, filter_rows, summary_cols))
+
+        if columnar == True:
+            with stage_profiler.profile_stage(sample_profile, 'write_columnar'):
+                print "Columnar table saved to:\n" + pl.write_columnar_table(full_df, full_table_file) + "\n"
+                for view_name in write_views:
+                    print "Columnar table saved to:\n" + pl.write_columnar_table(view_dfs[view_name], view_files[view_name]) + "\n"
+
+    elif stream == True:
+        # ~~~~ STREAM, PROCESS & SAVE TABLES ~~~~~~ #
+        # both tables come from the same rebuilt VCF so they are in the same genomic order;
+        # merge them one block of positions at a time and append each block to the output tables
+        print "Streaming merge of the query and annotation tables, {} rows per chunk".format(chunksize)
+        write_header = True
+        # number of rows written to the full table so far; offsets the view rows of each block
+        full_table_rows = 0
+        filter_rows = []
+        merged_blocks = iter_merged_blocks(query_file, annotation_file, vcf_file, chunksize)
+        while True:
+            # reading the chunks happens inside the merge, so they are profiled together
+            with stage_profiler.profile_stage(sample_profile, 'load_merge') as stage:
+                merge_df = next(merged_blocks, None)
+                stage['rows_out'] = len(merge_df) if merge_df is not None else 0
+            if merge_df is None:
+                break
+            full_df = process_merged_table(merge_df, canon_trancr_list, panel_genes, actionable_genes, sample_fields, profile = sample_profile)
+            with stage_profiler.profile_stage(sample_profile, 'filter', rows_in = len(full_df)) as stage:
+                block_filter_rows = filter_full_table_rows(full_df, filter_criteria)
+                stage['rows_out'] = len(block_filter_rows)
+            write_mode = 'w' if write_header == True else 'a'
+            with stage_profiler.profile_stage(sample_profile, 'write', rows_in = len(full_df)) as stage:
+                full_df.to_csv(full_table_file, sep='\t', index=False, mode = write_mode, header = write_header)
+                for view_name in write_views:
+                    select_view(full_df, block_filter_rows, view_columns[view_name]).to_csv(view_files[view_name], sep='\t', index=False, mode = write_mode, header = write_header)
+                stage['rows_out'] = len(full_df) + len(block_filter_rows) * len(write_views)
+                update_summary_metadata(summary_metadata, summary_sha1, select_view(full_df, block_filter_rows, summary_cols), header = write_header)
+            filter_rows.extend(block_filter_rows + full_table_rows)
+            full_table_rows += len(full_df)
+            write_header = False
+        if columnar == True:
+            print "WARNING: Columnar tables are not saved in stream mode"
+
+    views = dict((view_name, {'rows': filter_rows, 'columns': view_columns[view_name], 'file': view_files[view_name]}) for view_name in view_files.keys())
+    pl.write_table_views(full_table_file, views, views_file)
+    summary_metadata_file = write_summary_metadata(summary_metadata, summary_sha1, summary_file)
+
+    print "Full table saved to :\n" + full_table_file + "\n"
+    if 'summary' in write_views:
+        print "Summary table (filtered rows & columns) saved to:\n" + summary_file + "\n"
+    if 'filtered' in write_views:
+        print "Filtered table (rows only) saved to:\n" + merge_file + "\n"
+    print "Table views (summary, filtered) saved to:\n" + views_file + "\n"
+    print "Summary table metadata saved to:\n" + summary_metadata_file + "\n"
+    if sample_profile is not None:
+        print "Stage profile saved to:\n" + stage_profiler.write_profile(sample_profile, profile_file) + "\n"
+    return(summary_file)
+
+def find_analysis_samples(analysis_dir):
+    '''
+    Find the barcodes file and the files for each IonXpress_* sample in the variantCaller_out dir of an analysis
+    returns (barcodes_file, list of dicts with the query, annotation, and VCF file for each sample)
+    '''
+    import fnmatch
+    barcodes_file = None
+    samples = []
+    for root, dirs, files in os.walk(analysis_dir):
+        if barcodes_file is None and "sample_barcode_IDs.tsv" in files:
+            barcodes_file = os.path.join(root, "sample_barcode_IDs.tsv")
+        if fnmatch.fnmatch(root, "*{0}*".format(global_settings.IT_variant_dir_name_pattern)) and fnmatch.fnmatch(os.path.basename(root), "IonXpress_*"):
+            sample = {'barcode': os.path.basename(root), 'query_file': None, 'annotation_file': None, 'vcf_file': None}
+            for file in sorted(files):
+                if fnmatch.fnmatch(file, "IonXpress_*" + global_settings.query_ext):
+                    sample['query_file'] = os.path.join(root, file)
+                elif fnmatch.fnmatch(file, "IonXpress_*" + global_settings.annovar_output_ext):
+                    sample['annotation_file'] = os.path.join(root, file)
+                elif file == global_settings.source_vcf_basename:
+                    sample['vcf_file'] = os.path.join(root, file)
+            samples.append(sample)
+    return((barcodes_file, sorted(samples, key = lambda sample: sample['barcode'])))
+
+def pool_init(reference_data):
+    '''
+    Give each process in the sample pool a copy of the shared reference data
+    '''
+    global pool_reference_data
+    pool_reference_data = reference_data
+
+def merge_sample_pool(sample_args):
+    '''
+    Run merge_sample in a pool process; returns (barcode, summary_file or None)
+    errors are caught so a single bad sample does not hang the pool
+    '''
+    barcode = os.path.basename(os.path.dirname(sample_args['query_file']))
+    try:
+        summary_file = merge_sample(reference_data = pool_reference_data, **sample_args)
+        return((barcode, summary_file))
+    except (Exception, SystemExit) as e:
+        print("ERROR: Could not merge tables for sample {0}: {1}".format(barcode, repr(e)))
+        return((barcode, None))
+
+def merge_analysis(analysis_dir, analysis_ID, canon_trancr_file, panel_genes_file, actionable_genes_file, threads = 1, stream = False, chunksize = 10000, columnar = False, tiered = False, materialize = None, profile = False):
+    '''
+    Merge the tables for every sample in an analysis dir in a single Python session
+    the reference lists, filter criteria, and barcodes file are loaded once and shared by all samples
+    returns a dict of barcode: summary_file, None for samples that could not be merged
+    '''
+    barcodes_file, samples = find_analysis_samples(analysis_dir)
+    pl.file_exists(barcodes_file, kill = True)
+    reference_data = load_reference_data(canon_trancr_file, panel_genes_file, actionable_genes_file)
+    barcodes_df = table_schemas.read_schema_table(barcodes_file, 'barcodes', stage = 'merge')
+
+    sample_args_list = []
+    for sample in samples:
+        if None in [sample['query_file'], sample['annotation_file'], sample['vcf_file']]:
+            print("WARNING: Sample {0} is missing its query, annotation, or VCF file and will not be merged".format(sample['barcode']))
+            continue
+        sample_args_list.append({'barcodes_file': barcodes_file, 'query_file': sample['query_file'], 'annotation_file': sample['annotation_file'], 'analysis_ID': analysis_ID, 'vcf_file': sample['vcf_file'], 'stream': stream, 'chunksize': chunksize, 'barcodes_df': barcodes_df, 'columnar': columnar, 'tiered': tiered, 'materialize': materialize, 'profile': profile})
+    print("Merging tables for {0} samples in analysis {1} with {2} processes".format(len(sample_args_list), analysis_ID, threads))
+
+    if threads > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes = threads, initializer = pool_init, initargs = (reference_data,))
+        results = pool.map(merge_sample_pool, sample_args_list)
+        pool.close()
+        pool.join()
+    else:
+        pool_init(reference_data)
+        results = [merge_sample_pool(sample_args) for sample_args in sample_args_list]
+    return(dict(results))
+
+
+def main(barcodes_file = None, query_file = None, annotation_file = None, canon_trancr_file = None, panel_genes_file = None, actionable_genes_file = None, analysis_ID = None, vcf_file = None, analysis_dir = None, threads = 1, stream = False, chunksize = 10000, columnar = False, tiered = False, materialize = None, profile = False):
+    '''
+    Main control function for the script
+    merges the tables for every sample in analysis_dir if passed, otherwise for the single sample given
+    '''
+    if analysis_dir is not None:
+        results = merge_analysis(analysis_dir = analysis_dir, analysis_ID = analysis_ID, canon_trancr_file = canon_trancr_file, panel_genes_file = panel_genes_file, actionable_genes_file = actionable_genes_file, threads = threads, stream = stream, chunksize = chunksize, columnar = columnar, tiered = tiered, materialize = materialize, profile = profile)
+        failed = [barcode for barcode, summary_file in results.items() if summary_file is None]
+        if len(failed) > 0:
+            print("ERROR: Tables could not be merged for samples: {0}".format(', '.join(sorted(failed))))
+            sys.exit(1)
+    else:
+        reference_data = load_reference_data(canon_trancr_file, panel_genes_file, actionable_genes_file)
+        try:
+            merge_sample(barcodes_file = barcodes_file, query_file = query_file, annotation_file = annotation_file, analysis_ID = analysis_ID, vcf_file = vcf_file, reference_data = reference_data, stream = stream, chunksize = chunksize, columnar = columnar, tiered = tiered, materialize = materialize, profile = profile)
+        except ValueError as e:
+            # e.g. -stream with tables that are not in genomic order
+            print("ERROR: Could not merge tables for sample {0}: {1}".format(os.path.basename(os.path.dirname(query_file)), e))
+            sys.exit(1)
+
+def run():
+    '''
+    Parse script args to run the script
+    '''
+    # ~~~~ GET SCRIPT ARGS ~~~~~~ #
+    parser = argparse.ArgumentParser(description='Merge the VCF query and ANNOVAR annotation tables for a sample, or for every sample in an analysis')
+    # positional args; single sample mode
+    parser.add_argument("barcodes_file", nargs='?', help="Path to the sample_barcode_IDs.tsv file for the analysis")
+    parser.add_argument("query_file", nargs='?', help="Path to the bcftools VCF query table for the sample")
+    parser.add_argument("annotation_file", nargs='?', help="Path to the ANNOVAR multianno table for the sample")
+    parser.add_argument("canon_trancr_file", nargs='?', help="Path to the canonical transcript list")
+    parser.add_argument("panel_genes_file", nargs='?', help="Path to the panel genes list")
+    parser.add_argument("actionable_genes_file", nargs='?', help="Path to the actionable genes list")
+    parser.add_argument("analysis_ID_pos", nargs='?', metavar = "analysis_ID", help="Analysis ID")
+    parser.add_argument("vcf_file", nargs='?', help="Path to the sample VCF file")
+    # optional args
+    parser.add_argument("-analysis_dir", default = None, type = str, dest = 'analysis_dir', metavar = 'analysis dir', help="Merge the tables for every IonXpress_* sample in this analysis dir instead of a single sample")
+    parser.add_argument("-analysis_ID", default = None, type = str, dest = 'analysis_ID', metavar = 'analysis ID', help="Analysis ID, for use with -analysis_dir")
+    parser.add_argument("-transcr", default = global_settings.transcr_file, type = str, dest = 'transcr_file', metavar = 'transcript list', help="Path to the canonical transcript list, for use with -analysis_dir")
+    parser.add_argument("-panel", default = global_settings.panel_genes_file, type = str, dest = 'panel_file', metavar = 'panel genes list', help="Path to the panel genes list, for use with -analysis_dir")
+    parser.add_argument("-actionable", default = global_settings.actionable_genes_file, type = str, dest = 'actionable_file', metavar = 'actionable genes list', help="Path to the actionable genes list, for use with -analysis_dir")
+    parser.add_argument("-threads", default = 1, type = int, dest = 'threads', metavar = 'number of processes', help="Number of samples to process at once with -analysis_dir")
+    parser.add_argument("-stream", default = False, action='store_true', dest = 'stream', help="Merge the query and annotation tables in chunks with a streaming sorted merge-join, writing the output tables incrementally; both tables must be in genomic order")
+    parser.add_argument("-columnar", default = False, action='store_true', dest = 'columnar', help="Also save a typed columnar copy (Feather, or NumPy .npz) of each output table, for faster loading downstream")
+    parser.add_argument("-tiered", default = False, action='store_true', dest = 'tiered', help="Write the full table only once, and save the summary and filtered tables as views of it in the views manifest; use code/table_views.py to write them as tables later")
+    parser.add_argument("-materialize", default = [], nargs = '*', choices = ['summary', 'filtered'], dest = 'materialize', help="Views to also write as tables with -tiered")
+    parser.add_argument("-profile", default = False, action='store_true', dest = 'profile', help="Save the time, memory, and rows in and out of each stage for each sample to <barcode>_profile.jsonl; summarize them with code/stage_profiler.py")
+    parser.add_argument("-chunksize", default = 10000, type = int, dest = 'chunksize', metavar = 'rows per chunk', help="Number of rows to read from each table at a time in -stream mode")
+
+    args = parser.parse_args()
+
+    if args.analysis_dir is not None:
+        if args.analysis_ID is None:
+            parser.error("-analysis_ID is required with -analysis_dir")
+        analysis_ID = args.analysis_ID
+        canon_trancr_file = args.transcr_file
+        panel_genes_file = args.panel_file
+        actionable_genes_file = args.actionable_file
+    else:
+        if args.vcf_file is None:
+            parser.error("all 8 positional arguments are required when -analysis_dir is not used")
+        analysis_ID = args.analysis_ID_pos
+        canon_trancr_file = args.canon_trancr_file
+        panel_genes_file = args.panel_genes_file
+        actionable_genes_file = args.actionable_genes_file
+
+    main(barcodes_file = args.barcodes_file,
+        query_file = args.query_file,
+        annotation_file = args.annotation_file,
+        canon_trancr_file = canon_trancr_file,
+        panel_genes_file = panel_genes_file,
+        actionable_genes_file = actionable_genes_file,
+        analysis_ID = analysis_ID,
+        vcf_file = args.vcf_file,
+        analysis_dir = args.analysis_dir,
+        threads = args.threads,
+        stream = args.stream,
+        chunksize = args.chunksize,
+        columnar = args.columnar,
+        tiered = args.tiered,
+        materialize = args.materialize,
+        profile = args.profile)
+
+if __name__ == "__main__":
+    run()
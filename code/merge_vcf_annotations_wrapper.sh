@@ -7,7 +7,9 @@
 ## find all files needed to make the merged summary tables per sample,
 ## and pass them to the merge_vcf_annotations.py script for merging
 ## This script will output summary tables, and filtered annotation tables
-## This script operates on a single analysis dir
+## This script operates on a single analysis dir; all samples are merged by a single
+## merge_vcf_annotations.py process, set 'merge_threads' to change the number of samples merged at once
+## set 'merge_tiered=true' to write the full table only once, and save the filtered table only as a view of it
 
 
 #~~~~~ CUSTOM ENVIRONMENT ~~~~~~#
@@ -30,10 +32,25 @@ echo -e "Analysis ID is:\n$analysis_ID"
 # merge script location
 merge_script="${codedir}/merge_vcf_annotations.py"
 
-# ~~~~~~ Find Barcode file ~~~~~~ #
-echo -e "Finding barcodes file for the analysis..."
-barcodes_file="$(find "$input_dir" -type f -name "sample_barcode_IDs.tsv")"
-echo -e "Barcode file is:\n$barcodes_file"
+# number of samples to merge at once
+merge_threads="${merge_threads:-4}"
+
+# write the filtered tables only as views of the full tables; off by default, so every sample still gets its _filtered.tsv
+merge_tiered="${merge_tiered:-false}"
+merge_tiered_args=""
+if [ "$merge_tiered" == "true" ]; then
+    merge_tiered_args="-tiered -materialize summary"
+fi
+
+# ~~~~~~ Merge all samples ~~~~~~ #
+# the merge script finds the barcodes file and every sample's query, annotation, and VCF files,
+# loads the reference lists once, and merges the samples in a pool of processes
+# columnar copies of the tables are saved for faster loading by later pipeline steps
+# with merge_tiered, the full table is written once and the filtered table is only saved as a view of it, see code/table_views.py
+echo -e "Making summary tables for all samples in the analysis..."
+set -x
+$merge_script -analysis_dir "$input_dir" -analysis_ID "$analysis_ID" -threads "$merge_threads" -columnar $merge_tiered_args -transcr "$transcr_file" -panel "$panel_genes_file" -actionable "$actionable_genes_file"
+set +x
 
 # ~~~~~~ Find Sample dirs ~~~~~~ #
 echo -e "Finding sample directories for the analysis..."
@@ -41,21 +58,8 @@ echo -e "Finding sample directories for the analysis..."
 # sample dirs labeled IonXpress_001, IonXpress_002, ...
 sample_dirs="$(find "$input_dir" -type d -path "*variantCaller_out*" -name "IonXpress_*")"
 
-# ~~~~~~ Find Sample files ~~~~~~ #
-echo -e "Finding files for each sample in the analysis..."
-
 for i in $sample_dirs; do
     samplei="$i"
-    echo -e "---------------------------------------"
-    echo -e "\nMaking summary tables for:\n$samplei\n"
-    query_file="$(find "$samplei" -type f -name "IonXpress_*" -name "*${query_ext}")"
-    annot_file="$(find "$samplei" -type f -name "IonXpress_*" -name "*${annovar_output_ext}")"
-    vcf_file="$(find "$samplei" -type f -name "TSVC_variants.vcf")"
-    set -x
-    $merge_script "$barcodes_file" "$query_file" "$annot_file" "$transcr_file" "$panel_genes_file" "$actionable_genes_file" "$analysis_ID" "$vcf_file"
-    set +x
-    echo -e "---------------------------------------"
-
     echo -e "---------------------------------------"
     printf "\nAdding version control information to the summary table...\n"
     barcode_ID="$(basename "$samplei")"
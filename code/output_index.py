@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+USAGE: code/output_index.py <command> <args>
+DESCRIPTION: Persistent index of the analysis IDs, barcodes, and files in the output dir
+
+The index is a SQLite database of every dir and file in the output dir.
+Each dir is saved with its modification time; when the index is updated, only the dirs whose
+modification time has changed are listed again, the files in all other dirs are taken from the index.
+A dir's modification time changes when files are added to, removed from, or renamed in it,
+so the index stays current without listing thousands of unchanged archived analyses.
+
+commands:
+update : update the index from the output dir
+query : print the paths of indexed files; updates the index first unless -no_update is used
+dirs : print the paths of indexed dirs; updates the index first unless -no_update is used
+analyses : print the indexed analysis IDs
+With -analysis, query and dirs only update the dirs of those analyses.
+
+example:
+code/output_index.py update
+code/output_index.py query -kind summary_version -not_path "*Ion*"
+code/output_index.py query -analysis Auto_user_SN2-213-IT16-049-2_269_302 -barcode IonXpress_011 -kind bam
+code/output_index.py dirs -analysis Auto_user_SN2-213-IT16-049-2_269_302 -path "*variantCaller_out*" -name "IonXpress_*"
+
+usage in a script:
+import output_index
+index = output_index.open_index()
+output_index.update_index(index)
+summary_tables = output_index.query_files(index, kind = 'summary', analysis_IDs = ['Auto_user_SN2-213-IT16-049-2_269_302'])
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import sys
+import os
+import re
+import fnmatch
+import sqlite3
+import argparse
+import global_settings
+
+index_version = 2
+
+# file kinds, in order of precedence; (kind, file name pattern, path pattern or None)
+file_kinds = [
+('summary_version', '*_summary_version.tsv', None),
+('summary_meta', '*_summary_meta.json', None),
+('summary', '*_summary.tsv', None),
+('filtered', '*_filtered.tsv', None),
+('full_table', '*_full_table.tsv', None),
+('table_views', '*_views.json', None),
+('stage_profile', '*_profile.jsonl', None),
+('query', '*_query.tsv', None),
+('multianno', '*_multianno.txt', None),
+('barcodes', 'sample_barcode_IDs.tsv', None),
+('combined_barcodes', 'combined_sample_barcode_IDs.tsv', None),
+('run_xls', 'R_*.xls', '*variantCaller_out.*'),
+('vcf', '*.vcf', None),
+('bam', '*.bam', None),
+('bai', '*.bai', None),
+('snapshot', '*.png', None),
+('snapshot_manifest', '*_manifest.tsv', None)
+]
+
+barcode_pattern = re.compile(r'IonXpress_[0-9]+')
+
+schema = [
+'CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)',
+'CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, analysis_ID TEXT, mtime REAL)',
+'CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, name TEXT, analysis_ID TEXT, barcode TEXT, kind TEXT)',
+'CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)',
+'CREATE INDEX IF NOT EXISTS files_dir ON files (dir)',
+'CREATE INDEX IF NOT EXISTS files_analysis ON files (analysis_ID, barcode)',
+'CREATE INDEX IF NOT EXISTS files_kind ON files (kind)'
+]
+
+
+# ~~~~ INDEX ~~~~~~ #
+def open_index(index_file = global_settings.output_index_file, output_dir = global_settings.outdir):
+    '''
+    Open the index database, creating it if needed
+    returns a dict with the database connection and the output dir it indexes
+    paths are saved relative to the output dir, and returned joined to it
+    '''
+    connection = sqlite3.connect(index_file)
+    for statement in schema:
+        connection.execute(statement)
+    version = connection.execute("SELECT value FROM info WHERE key = 'index_version'").fetchone()
+    if version is None or int(version[0]) != index_version:
+        # the saved layout is out of date; rebuild the index from scratch
+        connection.execute('DELETE FROM dirs')
+        connection.execute('DELETE FROM files')
+        connection.execute("INSERT OR REPLACE INTO info VALUES ('index_version', ?)", (str(index_version),))
+    connection.commit()
+    return({'connection': connection, 'index_file': index_file, 'output_dir': output_dir})
+
+def file_kind(name, rel_path):
+    '''
+    Return the kind of a file from its name and path, or None
+    '''
+    for kind, name_pattern, path_pattern in file_kinds:
+        if fnmatch.fnmatchcase(name, name_pattern):
+            if path_pattern is None or fnmatch.fnmatchcase(rel_path, path_pattern):
+                return(kind)
+    return(None)
+
+def path_fields(rel_path):
+    '''
+    Return the (analysis ID, barcode) of a path relative to the output dir
+    the analysis ID is the first dir in the path, the barcode is the last IonXpress_* in the path
+    '''
+    parts = rel_path.split(os.sep)
+    analysis_ID = parts[0] if parts[0] != '' else None
+    barcodes = barcode_pattern.findall(rel_path)
+    barcode = barcodes[-1] if len(barcodes) > 0 else None
+    return((analysis_ID, barcode))
+
+def list_dir(dir_path):
+    '''
+    Return (dirs, files, symlinked dirs) in a dir; symlinked dirs are listed as dirs but not followed, like os.walk
+    '''
+    dirs = []
+    files = []
+    links = []
+    try:
+        names = os.listdir(dir_path)
+    except OSError:
+        return((dirs, files, links))
+    for name in names:
+        item_path = os.path.join(dir_path, name)
+        if os.path.isdir(item_path):
+            dirs.append(name)
+            if os.path.islink(item_path):
+                links.append(name)
+        else:
+            files.append(name)
+    return((dirs, files, links))
+
+def update_index(index, analysis_IDs = None):
+    '''
+    Bring the index up to date with the output dir
+    only dirs with a changed modification time are listed; files and dirs that no longer exist are removed
+    analysis_IDs : only update the dirs of these analyses, instead of the whole output dir
+    returns a dict of counts of the dirs checked and listed
+    '''
+    connection = index['connection']
+    output_dir = index['output_dir']
+    saved_mtimes = dict(connection.execute('SELECT path, mtime FROM dirs').fetchall())
+    counts = {'dirs_checked': 0, 'dirs_listed': 0, 'dirs_removed': 0}
+    if analysis_IDs is not None and len(analysis_IDs) > 0:
+        # only the saved dirs of the analyses can be removed
+        saved_mtimes = dict((rel_dir, mtime) for rel_dir, mtime in saved_mtimes.items() if rel_dir.split(os.sep)[0] in analysis_IDs)
+        pending = list(analysis_IDs)
+    else:
+        # rel path '' is the output dir itself
+        pending = ['']
+    seen = set()
+    while len(pending) > 0:
+        rel_dir = pending.pop()
+        dir_path = os.path.join(output_dir, rel_dir) if rel_dir != '' else output_dir
+        try:
+            mtime = os.stat(dir_path).st_mtime
+        except OSError:
+            continue
+        seen.add(rel_dir)
+        counts['dirs_checked'] += 1
+        if rel_dir in saved_mtimes and saved_mtimes[rel_dir] == mtime:
+            # unchanged dir; descend into the saved subdirs without listing it
+            subdirs = [row[0] for row in connection.execute('SELECT path FROM dirs WHERE parent = ?', (rel_dir,))]
+            pending.extend(subdirs)
+            continue
+        counts['dirs_listed'] += 1
+        dirs, files, links = list_dir(dir_path)
+        analysis_ID = path_fields(rel_dir)[0]
+        connection.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)', (rel_dir, None if rel_dir == '' else os.path.dirname(rel_dir), analysis_ID, mtime))
+        connection.execute('DELETE FROM files WHERE dir = ?', (rel_dir,))
+        file_rows = []
+        for name in files:
+            rel_path = os.path.join(rel_dir, name)
+            file_analysis_ID, barcode = path_fields(rel_path)
+            file_rows.append((rel_path, rel_dir, name, file_analysis_ID, barcode, file_kind(name, rel_path)))
+        connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)', file_rows)
+        # subdirs removed since the last listing are dropped at the end
+        for name in dirs:
+            if name not in links:
+                pending.append(os.path.join(rel_dir, name))
+    # remove the dirs, and their files, that were not reached
+    for rel_dir in set(saved_mtimes.keys()) - seen:
+        connection.execute('DELETE FROM dirs WHERE path = ?', (rel_dir,))
+        connection.execute('DELETE FROM files WHERE dir = ?', (rel_dir,))
+        counts['dirs_removed'] += 1
+    connection.commit()
+    return(counts)
+
+def query_files(index, kind = None, analysis_IDs = None, barcode = None, name = None, path = None, not_name = None, not_path = None):
+    '''
+    Return the sorted list of paths of the indexed files matching all of the criteria
+    name, path, not_name, not_path : glob patterns for the file name or the full path, like 'find -name' and 'find -path'
+    '''
+    query = 'SELECT path FROM files WHERE 1'
+    params = []
+    full_path = "(? || '/' || path)"
+    if kind is not None:
+        query += ' AND kind = ?'
+        params.append(kind)
+    if analysis_IDs is not None and len(analysis_IDs) > 0:
+        query += ' AND analysis_ID IN ({0})'.format(', '.join(['?'] * len(analysis_IDs)))
+        params.extend(analysis_IDs)
+    if barcode is not None:
+        query += ' AND barcode = ?'
+        params.append(barcode)
+    if name is not None:
+        query += ' AND name GLOB ?'
+        params.append(name)
+    if not_name is not None:
+        query += ' AND NOT name GLOB ?'
+        params.append(not_name)
+    if path is not None:
+        query += ' AND {0} GLOB ?'.format(full_path)
+        params.extend([index['output_dir'], path])
+    if not_path is not None:
+        query += ' AND NOT {0} GLOB ?'.format(full_path)
+        params.extend([index['output_dir'], not_path])
+    query += ' ORDER BY path'
+    return([os.path.join(index['output_dir'], row[0]) for row in index['connection'].execute(query, params)])
+
+def query_dirs(index, analysis_IDs = None, name = None, path = None):
+    '''
+    Return the sorted list of paths of the indexed dirs matching all of the criteria
+    name, path : glob patterns for the dir name or the full path, like 'find -type d -name' and 'find -type d -path'
+    symlinked dirs are not indexed, so they are not returned, like 'find -type d'
+    '''
+    query = "SELECT path FROM dirs WHERE path != ''"
+    params = []
+    if analysis_IDs is not None and len(analysis_IDs) > 0:
+        query += ' AND analysis_ID IN ({0})'.format(', '.join(['?'] * len(analysis_IDs)))
+        params.extend(analysis_IDs)
+    if path is not None:
+        query += " AND (? || '/' || path) GLOB ?"
+        params.extend([index['output_dir'], path])
+    query += ' ORDER BY path'
+    rel_dirs = [row[0] for row in index['connection'].execute(query, params)]
+    if name is not None:
+        # sqlite has no basename function; the dir names are matched here
+        rel_dirs = [rel_dir for rel_dir in rel_dirs if fnmatch.fnmatchcase(os.path.basename(rel_dir), name)]
+    return([os.path.join(index['output_dir'], rel_dir) for rel_dir in rel_dirs])
+
+def list_analyses(index):
+    '''
+    Return the sorted list of analysis IDs in the index
+    '''
+    query = "SELECT path FROM dirs WHERE parent = '' ORDER BY path"
+    return([row[0] for row in index['connection'].execute(query)])
+
+def get_index(index_file = global_settings.output_index_file, output_dir = global_settings.outdir, update = True):
+    '''
+    Open the index and bring it up to date with the output dir
+    '''
+    index = open_index(index_file = index_file, output_dir = output_dir)
+    if update == True:
+        update_index(index)
+    return(index)
+
+
+def run():
+    '''
+    Parse script args to run the script
+    '''
+    # ~~~~ GET SCRIPT ARGS ~~~~~~ #
+    parser = argparse.ArgumentParser(description='Persistent index of the files in the output dir')
+    parser.add_argument("-index", default = global_settings.output_index_file, type = str, dest = 'index_file', metavar = 'index file', help="Path to the index database")
+    parser.add_argument("-output_dir", default = global_settings.outdir, type = str, dest = 'output_dir', metavar = 'output dir', help="Path to the output dir to index")
+    subparsers = parser.add_subparsers(dest = 'command')
+
+    update_parser = subparsers.add_parser('update', help = 'Update the index from the output dir')
+
+    query_parser = subparsers.add_parser('query', help = 'Print the paths of indexed files')
+    query_parser.add_argument("-kind", default = None, choices = [kind for kind, name_pattern, path_pattern in file_kinds], dest = 'kind', help="Kind of file")
+    query_parser.add_argument("-analysis", default = [], action = 'append', dest = 'analysis_IDs', metavar = 'analysis ID', help="Analysis ID; can be used more than once")
+    query_parser.add_argument("-barcode", default = None, type = str, dest = 'barcode', metavar = 'barcode', help="Sample barcode, e.g. IonXpress_011")
+    query_parser.add_argument("-name", default = None, type = str, dest = 'name', metavar = 'name pattern', help="Glob pattern for the file name, like 'find -name'")
+    query_parser.add_argument("-path", default = None, type = str, dest = 'path', metavar = 'path pattern', help="Glob pattern for the file path, like 'find -path'")
+    query_parser.add_argument("-not_name", default = None, type = str, dest = 'not_name', metavar = 'name pattern', help="Exclude files with names matching this pattern")
+    query_parser.add_argument("-not_path", default = None, type = str, dest = 'not_path', metavar = 'path pattern', help="Exclude files with paths matching this pattern")
+    query_parser.add_argument("-no_update", default = False, action = 'store_true', dest = 'no_update', help="Query the index without updating it first")
+
+    dirs_parser = subparsers.add_parser('dirs', help = 'Print the paths of indexed dirs')
+    dirs_parser.add_argument("-analysis", default = [], action = 'append', dest = 'analysis_IDs', metavar = 'analysis ID', help="Analysis ID; can be used more than once")
+    dirs_parser.add_argument("-name", default = None, type = str, dest = 'name', metavar = 'name pattern', help="Glob pattern for the dir name, like 'find -name'")
+    dirs_parser.add_argument("-path", default = None, type = str, dest = 'path', metavar = 'path pattern', help="Glob pattern for the dir path, like 'find -path'")
+    dirs_parser.add_argument("-no_update", default = False, action = 'store_true', dest = 'no_update', help="Query the index without updating it first")
+
+    analyses_parser = subparsers.add_parser('analyses', help = 'Print the indexed analysis IDs')
+    analyses_parser.add_argument("-no_update", default = False, action = 'store_true', dest = 'no_update', help="Use the index without updating it first")
+
+    args = parser.parse_args()
+
+    index = open_index(index_file = args.index_file, output_dir = args.output_dir)
+    if args.command == 'update':
+        counts = update_index(index)
+        sys.stderr.write("Index {0} updated: {1} dirs checked, {2} dirs listed, {3} dirs removed\n".format(args.index_file, counts['dirs_checked'], counts['dirs_listed'], counts['dirs_removed']))
+        return
+    if args.no_update == False:
+        # a query of some analyses only needs their dirs to be current
+        update_index(index, analysis_IDs = getattr(args, 'analysis_IDs', None))
+    if args.command == 'query':
+        results = query_files(index, kind = args.kind, analysis_IDs = args.analysis_IDs, barcode = args.barcode, name = args.name, path = args.path, not_name = args.not_name, not_path = args.not_path)
+    elif args.command == 'dirs':
+        results = query_dirs(index, analysis_IDs = args.analysis_IDs, name = args.name, path = args.path)
+    elif args.command == 'analyses':
+        results = list_analyses(index)
+    for item in results:
+        print(item)
+
+if __name__ == "__main__":
+    run()
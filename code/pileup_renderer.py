@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+USAGE: code/pileup_renderer.py <regions.bed> <bam> <bam> ... -o <outdir>
+DESCRIPTION: Draw pileup snapshots of BAM files without IGV
+
+An alternate snapshot engine for the routine review views; the reads in each region are read straight from the
+BAM files with pysam and drawn to a PNG with PIL, so no Java, IGV, or X display is needed.
+Each BAM file is drawn as a track with a coverage bar chart and a stack of reads, like the IGV expanded view;
+mismatches are coloured by base, deletions are drawn as a line and insertions as a purple mark.
+Coverage bars are split by base where the non-reference bases are at least 20% of the reads.
+The reference bases are taken from the MD tags of the reads, so no genome FASTA is needed.
+Snapshots are named from the 4th column of the regions BED file, like the 'nf4' mode of make_IGV_snapshots.py,
+and the image height limits the height of the read stacks like the IGV 'maxPanelHeight'.
+
+example:
+code/pileup_renderer.py IGV_regions.bed IonXpress_001_rawlib.bam NC_rawlib.bam -o IGV_snapshots -height 500
+
+usage in a script:
+import pileup_renderer
+pileup_renderer.snapshot_session(bam_files, [(region_file, '500'), (long_region_file, '5000')], outdir, genome = 'hg19')
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import time
+import argparse
+import pysam
+from PIL import Image, ImageDraw, ImageFont
+import pipeline_functions as pl
+import snapshot_cache
+import IGV_daemon
+
+# changing how the snapshots are drawn needs a new version, so the old snapshots in the snapshot cache are not used
+renderer_version = 1
+renderer = 'pileup:{0}'.format(renderer_version)
+
+image_width = 1000
+# bases shown on each side of the snapshot locus
+view_flank = 40
+ruler_height = 24
+track_label_height = 14
+coverage_height = 50
+read_height = 8
+read_gap = 2
+# fraction of non-reference bases at a position for its coverage bar to be split by base
+allele_fraction_threshold = 0.2
+
+background_color = (255, 255, 255)
+text_color = (0, 0, 0)
+read_color = (185, 185, 185)
+# reads with mapping quality 0 are drawn faded, like in IGV
+mapq0_color = (230, 230, 230)
+coverage_color = (175, 175, 175)
+locus_color = (120, 120, 120)
+insertion_color = (138, 43, 226)
+base_colors = {'A': (0, 150, 0), 'C': (0, 0, 255), 'G': (209, 113, 5), 'T': (255, 0, 0), 'N': (100, 100, 100)}
+
+
+# ~~~~ READS ~~~~~~ #
+def view_window(start, stop):
+    '''
+    Return the 0-based half open window to show for a 1-based BED style snapshot region
+    '''
+    return((max(0, int(start) - 1 - view_flank), int(stop) + view_flank))
+
+def keep_read(read):
+    '''
+    Skip the reads that IGV hides by default
+    '''
+    return(not (read.is_unmapped or read.is_secondary or read.is_qcfail or read.is_duplicate))
+
+def fetch_reads(bam, chrom, view_start, view_end):
+    '''
+    Return the reads in the window; an empty list if the chrom is not in the BAM file
+    '''
+    try:
+        return([read for read in bam.fetch(chrom, view_start, view_end) if keep_read(read)])
+    except (ValueError, KeyError):
+        return([])
+
+def pack_reads(reads, max_rows, view_end):
+    '''
+    Stack the reads into rows, each read in the first row that is free at its start; reads that do not fit are left out
+    returns a list of rows, each a list of reads
+    '''
+    rows = []
+    row_ends = []
+    for read in reads:
+        # the reads are sorted by start; once every row is full to the end of the window, no more reads can be shown
+        if len(rows) == max_rows and min(row_ends) >= view_end:
+            break
+        for i, row_end in enumerate(row_ends):
+            if read.reference_start > row_end:
+                rows[i].append(read)
+                row_ends[i] = read.reference_end
+                break
+        else:
+            if len(rows) < max_rows:
+                rows.append([read])
+                row_ends.append(read.reference_end)
+    return(rows)
+
+def reference_bases(reads, view_start, view_end):
+    '''
+    Get the reference bases in the window from the MD tags of the reads
+    returns a dict of base by 0-based position; positions not covered by a read with an MD tag are missing
+    '''
+    reference = {}
+    for read in reads:
+        if len(reference) >= view_end - view_start:
+            break
+        if not read.has_tag('MD'):
+            continue
+        for query_pos, ref_pos, ref_base in read.get_aligned_pairs(matches_only = True, with_seq = True):
+            if view_start <= ref_pos < view_end:
+                reference[ref_pos] = ref_base.upper()
+    return(reference)
+
+def base_counts(bam, chrom, view_start, view_end):
+    '''
+    Return the counts of A, C, G, and T at each position in the window, as a list of 4 arrays
+    '''
+    try:
+        return(bam.count_coverage(chrom, view_start, view_end, quality_threshold = 0, read_callback = 'all'))
+    except (ValueError, KeyError):
+        return([[0] * (view_end - view_start) for base in 'ACGT'])
+
+
+# ~~~~ DRAWING ~~~~~~ #
+def draw_ruler(draw, font, chrom, start, stop, view_start, view_end, scale, image_height):
+    '''
+    Draw the locus label, and mark the snapshot locus down the whole image
+    '''
+    draw.text((4, 4), '{0}:{1}-{2}'.format(chrom, start, stop), fill = text_color, font = font)
+    draw.text((image_width - 80, 4), '{0} bp'.format(view_end - view_start), fill = text_color, font = font)
+    locus_start = (int(start) - 1 - view_start) * scale
+    locus_end = (int(stop) - view_start) * scale
+    for x in [locus_start, locus_end]:
+        for y in range(ruler_height - 6, image_height, 6):
+            draw.line([(x, y), (x, y + 2)], fill = locus_color)
+
+def draw_coverage(draw, font, counts, reference, view_start, scale, top):
+    '''
+    Draw the coverage bar chart of a track
+    '''
+    depths = [sum([counts[i][pos] for i in range(4)]) for pos in range(len(counts[0]))]
+    max_depth = max(depths) if len(depths) > 0 else 0
+    bottom = top + coverage_height
+    for pos, depth in enumerate(depths):
+        if depth < 1:
+            continue
+        x0 = pos * scale
+        x1 = max(x0 + 1, (pos + 1) * scale - 1)
+        bar_height = coverage_height * float(depth) / max_depth
+        ref_base = reference.get(view_start + pos, None)
+        ref_count = counts['ACGT'.index(ref_base)][pos] if ref_base is not None and ref_base in 'ACGT' else depth
+        if 1 - float(ref_count) / depth < allele_fraction_threshold:
+            draw.rectangle([x0, bottom - bar_height, x1, bottom], fill = coverage_color)
+            continue
+        # split the bar by base
+        y = bottom
+        for i, base in enumerate('ACGT'):
+            base_height = bar_height * float(counts[i][pos]) / depth
+            if base_height > 0:
+                draw.rectangle([x0, y - base_height, x1, y], fill = base_colors[base])
+                y -= base_height
+    # the data range over the bars, like IGV
+    draw.text((4, top), '[0-{0}]'.format(max_depth), fill = text_color, font = font)
+
+def draw_read(draw, read, reference, view_start, view_end, scale, y):
+    '''
+    Draw a single read; aligned blocks in grey, then its deletions, insertions, and mismatches over the top
+    '''
+    color = mapq0_color if read.mapping_quality == 0 else read_color
+    y1 = y + read_height - 1
+    middle = y + read_height // 2
+    blocks = read.get_blocks()
+    for block_start, block_end in blocks:
+        if block_end <= view_start or block_start >= view_end:
+            continue
+        draw.rectangle([(max(block_start, view_start) - view_start) * scale, y, (min(block_end, view_end) - view_start) * scale - 1, y1], fill = color)
+    # gaps between the blocks are deletions or skipped bases
+    for (last_start, last_end), (block_start, block_end) in zip(blocks[:-1], blocks[1:]):
+        if last_end < view_end and block_start > view_start:
+            draw.line([((max(last_end, view_start) - view_start) * scale, middle), ((min(block_start, view_end) - view_start) * scale, middle)], fill = text_color)
+    ref_pos = read.reference_start
+    for operation, length in read.cigartuples:
+        # M, D, N, =, X use up reference bases; I marks the position it is inserted at
+        if operation == 1 and view_start <= ref_pos < view_end:
+            x = (ref_pos - view_start) * scale
+            draw.rectangle([x - 1, y, x, y1], fill = insertion_color)
+        if operation in [0, 2, 3, 7, 8]:
+            ref_pos += length
+    if len(reference) < 1:
+        return
+    query_sequence = read.query_sequence
+    for query_pos, ref_pos in read.get_aligned_pairs(matches_only = True):
+        if ref_pos < view_start or ref_pos >= view_end:
+            continue
+        base = query_sequence[query_pos]
+        ref_base = reference.get(ref_pos, None)
+        if ref_base is not None and base != ref_base:
+            x0 = (ref_pos - view_start) * scale
+            draw.rectangle([x0, y, max(x0, (ref_pos + 1 - view_start) * scale - 1), y1], fill = base_colors.get(base, base_colors['N']))
+
+def render_region(bams, bam_names, chrom, start, stop, output_file, image_height = 500, font = None):
+    '''
+    Draw the snapshot of a region in all the BAM files to a PNG file
+    bams : list of open pysam.AlignmentFile
+    image_height : max height of the read stacks of all the tracks together
+    '''
+    if font is None:
+        font = ImageFont.load_default()
+    view_start, view_end = view_window(start, stop)
+    scale = float(image_width) / (view_end - view_start)
+    track_overhead = track_label_height + coverage_height + read_gap
+    max_rows = max(1, ((int(image_height) - ruler_height) // len(bams) - track_overhead) // (read_height + read_gap))
+    tracks = []
+    for bam in bams:
+        reads = fetch_reads(bam, chrom, view_start, view_end)
+        tracks.append({'rows': pack_reads(reads, max_rows, view_end), 'counts': base_counts(bam, chrom, view_start, view_end), 'reference': reference_bases(reads, view_start, view_end)})
+    # share the reference bases between the tracks, e.g. when the control sample has no reads with MD tags
+    reference = {}
+    for track in tracks:
+        reference.update(track['reference'])
+    height = ruler_height + sum([track_overhead + len(track['rows']) * (read_height + read_gap) for track in tracks])
+    image = Image.new('RGB', (image_width, height), background_color)
+    draw = ImageDraw.Draw(image)
+    draw_ruler(draw, font, chrom, start, stop, view_start, view_end, scale, height)
+    top = ruler_height
+    for bam_name, track in zip(bam_names, tracks):
+        draw.line([(0, top), (image_width, top)], fill = coverage_color)
+        draw.text((60, top + 1), bam_name, fill = text_color, font = font)
+        top += track_label_height
+        draw_coverage(draw, font, track['counts'], reference, view_start, scale, top)
+        top += coverage_height + read_gap
+        for row in track['rows']:
+            for read in row:
+                draw_read(draw, read, reference, view_start, view_end, scale, top)
+            top += read_height + read_gap
+    # low compression; the snapshots are mostly flat colour, and encoding is most of the time taken for tall snapshots
+    image.save(output_file, 'PNG', compress_level = 1)
+
+def render_regions(bam_files, regions, outdir, image_height = 500):
+    '''
+    Draw the snapshots of the regions; the BAM files are opened once for all the regions
+    regions : list of (chrom, start, stop, snapshot filename)
+    returns the number of snapshots made
+    '''
+    pl.mkdir_p(outdir)
+    bams = [pysam.AlignmentFile(bam_file, 'rb') for bam_file in bam_files]
+    bam_names = [os.path.basename(bam_file) for bam_file in bam_files]
+    font = ImageFont.load_default()
+    start_time = time.time()
+    try:
+        for chrom, start, stop, name in regions:
+            render_region(bams, bam_names, chrom, start, stop, os.path.join(outdir, name), image_height = image_height, font = font)
+    finally:
+        for bam in bams:
+            bam.close()
+    elapsed = time.time() - start_time
+    print('Drew {0} pileup snapshots in {1:.1f}s ({2:.1f} per second)'.format(len(regions), elapsed, len(regions) / elapsed if elapsed > 0 else 0.0))
+    return(len(regions))
+
+def snapshot_session(bam_files, passes, outdir, genome = 'hg19'):
+    '''
+    Draw the snapshots of all the passes over the BAM files; snapshots in the snapshot cache are linked from the cache
+    passes : list of (regions file, image height), as for IGV_daemon.snapshot_session
+    '''
+    pl.mkdir_p(outdir)
+    region_passes = [(IGV_daemon.read_regions(region_file), image_height) for region_file, image_height in passes]
+    miss_passes, pending = snapshot_cache.split_cached(bam_files, region_passes, outdir, genome = genome, renderer = renderer)
+    for regions, image_height in miss_passes:
+        render_regions(bam_files, regions, outdir, image_height = image_height)
+    snapshot_cache.store_snapshots(pending)
+
+
+def run():
+    '''
+    Parse script args to run the script
+    '''
+    # ~~~~ GET SCRIPT ARGS ~~~~~~ #
+    parser = argparse.ArgumentParser(description='Draw pileup snapshots of BAM files without IGV')
+    parser.add_argument("region_file", help="BED file with the regions to snapshot; the 4th column is the snapshot filename")
+    parser.add_argument("bam_files", nargs = "+", help="Indexed BAM files to draw, one track each")
+    parser.add_argument("-o", default = '.', type = str, dest = 'outdir', metavar = 'output dir', help="Dir to save the snapshots in")
+    parser.add_argument("-height", default = '500', type = str, dest = 'image_height', metavar = 'image height', help="Max height of the read stacks, in pixels")
+    args = parser.parse_args()
+
+    render_regions(args.bam_files, IGV_daemon.read_regions(args.region_file), args.outdir, image_height = args.image_height)
+
+if __name__ == "__main__":
+    run()
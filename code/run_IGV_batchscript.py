@@ -18,6 +18,7 @@ import glob
 import argparse
 from datetime import datetime
 import pipeline_functions as pl
+import display_pool
 
 
 # ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
@@ -28,32 +29,20 @@ import pipeline_functions as pl
 #     proc_stdout = process.communicate()[0].strip()
 #     print proc_stdout
 
-def get_open_X_server():
-    '''
-    Search for an open Xvfb port to render into
-    '''
-    x_serv_command= '''
-for serv_num in $(seq 1 1000); do
-    if ! (xdpyinfo -display :${serv_num})&>/dev/null; then
-        echo "$serv_num" && break
-    fi
-done
-'''
-    import subprocess as sp
-    # run the command, capture the output
-    process = sp.Popen(x_serv_command,stdout=sp.PIPE, shell=True)
-    x_serv_port = int(process.communicate()[0].strip())
-    return(x_serv_port)
-
 def run_IGV_script(igv_script, igv_jar, memMB, x_serv_num):
-    # run the IGV script
-    x_serv_num = get_open_X_server()
-    igv_command = "(Xvfb :{} &) && DISPLAY=:{} java -Xmx{}m -jar {} -b {} && killall Xvfb".format(x_serv_num, x_serv_num, memMB, igv_jar, igv_script)
+    # run the IGV script on a display from the display pool
+    # the display is given back to the pool afterwards, still running, for the next IGV script
+    display = display_pool.acquire_display()
+    pl.kill_on_false(display is not None, my_message = "ERROR: Could not get an X display to run IGV")
+    igv_command = "DISPLAY={} java -Xmx{}m -jar {} -b {}".format(display_pool.display_name(display), memMB, igv_jar, igv_script)
     startTime = datetime.now()
-    print('\nOpen Xvfb port found on:\n{}\n'.format(x_serv_num))
+    print('\nXvfb display from pool:\n{}\n'.format(display_pool.display_name(display)))
     print "\nStarting IGV\nCurrent time is:\t", startTime
     print "\nIGV command is:\n", igv_command
-    pl.subprocess_cmd(igv_command)
+    try:
+        pl.subprocess_cmd(igv_command)
+    finally:
+        display_pool.release_display(display)
     print "\n\nTime to process completion:\t", datetime.now() - startTime
 
 
@@ -67,7 +56,7 @@ parser.add_argument("batchscript_file", help="Path to the IGV batchscript file t
 # optional args
 parser.add_argument("-bin", default = "bin/IGV_2.3.81/igv.jar", type = str, dest = 'igv_jar_bin', metavar = 'IGV bin path', help="Path to the IGV jar binary to run")
 parser.add_argument("-mem", default = "4000", type = str, dest = 'igv_mem', metavar = 'IGV memory (MB)', help="Amount of memory to allocate to IGV, in Megabytes (MB)")
-parser.add_argument("-x", default = "1", type = str, dest = 'x_serv', metavar = 'X server to use for IGV', help="X server to use for IGV")
+parser.add_argument("-x", default = "1", type = str, dest = 'x_serv', metavar = 'X server to use for IGV', help="X server to use for IGV; ignored, the display is taken from the display pool")
 
 args = parser.parse_args()
 
@@ -17,6 +17,10 @@ import argparse
 import pipeline_functions as pl
 import global_settings
 import make_IGV_snapshots
+import IGV_daemon
+import snapshot_pool
+import bam_slicer
+import snapshot_cache
 
 def print_analysis_data(analysis_data):
     '''
@@ -95,23 +99,70 @@ def make_snapshot_filename(summary_dict, filename_suffix = '', file_extension =
     return(snapshot_filename)
 
 
+def region_manifest_file(IGV_regions_file):
+    '''
+    Return the manifest file written next to a regions BED file; regions.bed -> regions_manifest.tsv
+    '''
+    return(os.path.splitext(IGV_regions_file)[0] + '_manifest.tsv')
+
+def coalesce_regions(entries, distance = None):
+    '''
+    Merge the snapshot loci of variants that are close together into shared snapshot regions
+    entries : list of (chrom, position, snapshot filename), one for each summary table row
+    distance : max number of bases from the first locus of a region to the other loci merged into it;
+    0 only merges loci at the same position, e.g. the same variant on different transcripts
+    returns a list of (chrom, start, stop, snapshot filename, list of variant snapshot filenames);
+    each region's snapshot is named for its first variant
+    '''
+    if distance is None:
+        distance = global_settings.IGV_snapshot_coalesce_distance
+    regions = []
+    for chrom, position, filename in sorted(entries, key = lambda entry: (entry[0], int(entry[1]))):
+        position = int(position)
+        if len(regions) > 0 and regions[-1][0] == chrom and position - regions[-1][1] <= distance:
+            regions[-1][2] = position
+            if filename not in regions[-1][4]:
+                regions[-1][4].append(filename)
+        else:
+            regions.append([chrom, position, position, filename, [filename]])
+    return([tuple(region) for region in regions])
+
+def write_regions(entries, output_file):
+    '''
+    Write the coalesced snapshot regions to the BED file, and the manifest of the snapshot for each variant next to it
+    use nf4 mode of 'make_IGV_snapshots.py' to stash a custom snapshot name for each BED entry in the 4th column
+    '''
+    import csv
+    regions = coalesce_regions(entries)
+    manifest_file = region_manifest_file(output_file)
+    with open(output_file, 'w') as bedout, open(manifest_file, 'w') as manifestout:
+        writer = csv.writer(bedout, delimiter='\t')
+        manifest_writer = csv.writer(manifestout, delimiter='\t')
+        manifest_writer.writerow(['Snapshot', 'Region Snapshot', 'Chrom', 'Start', 'Stop'])
+        for chrom, start, stop, filename, variant_filenames in regions:
+            entry = [chrom, start, stop, filename]
+            print(entry)
+            writer.writerow(entry)
+            for variant_filename in variant_filenames:
+                manifest_writer.writerow([variant_filename, filename, chrom, start, stop])
+    print('{0} snapshot regions for {1} variants, manifest file: {2}'.format(len(regions), len(entries), manifest_file))
+
 def summary_table_to_bed(sample_summary_table, output_file, filename_suffix = ''):
     '''
     Convert a summary table into BED coordinates
-    use nf4 mode of 'make_IGV_snapshots.py' to stash a custom snapshot name for each BED entry in the 4th column
+    variants close together share a snapshot region; see coalesce_regions
     '''
     import csv
     print('input file: {0}'.format(sample_summary_table))
     print('output file: {0}'.format(output_file))
-    with open(sample_summary_table, 'r') as tsvin, open(output_file, 'w') as bedout:
+    entries = []
+    with open(sample_summary_table, 'r') as tsvin:
         reader = csv.DictReader(tsvin, delimiter='\t')
-        writer = csv.writer(bedout, delimiter='\t')
         for row in reader:
             # print()
             filename = make_snapshot_filename(summary_dict = row, filename_suffix = filename_suffix)
-            entry = [row['Chrom'], row['Position'], row['Position'], filename]
-            print(entry)
-            writer.writerow(entry)
+            entries.append((row['Chrom'], row['Position'], filename))
+    write_regions(entries, output_file)
 
 def summary_table_to_bed_long(sample_summary_table, output_file, filename_suffix = 'long', min_frequency = 1):
     '''
@@ -124,20 +175,42 @@ def summary_table_to_bed_long(sample_summary_table, output_file, filename_suffix
     print('Find low frequency variants...')
     print('input file: {0}'.format(sample_summary_table))
     print('output file: {0}'.format(output_file))
-    with open(sample_summary_table, 'r') as tsvin, open(output_file, 'w') as bedout:
+    entries = []
+    with open(sample_summary_table, 'r') as tsvin:
         reader = csv.DictReader(tsvin, delimiter='\t')
-        writer = csv.writer(bedout, delimiter='\t')
         for row in reader:
             if float(row['Frequency']) < min_frequency:
                 print(row['Frequency'])
                 filename = make_snapshot_filename(summary_dict = row, filename_suffix = filename_suffix)
-                entry = [row['Chrom'], row['Position'], row['Position'], filename]
-                print(entry)
-                writer.writerow(entry)
+                entries.append((row['Chrom'], row['Position'], filename))
+    write_regions(entries, output_file)
 
-def sample_snapshot_run(sample_name, bam_files, IGV_regions_file, IGV_snapshots_dir, image_height = '500'):
+def link_variant_snapshots(passes, IGV_snapshots_dir):
+    '''
+    Link the snapshot of each coalesced region to the snapshot filenames of all its variants, from the regions manifests,
+    so the reports find a snapshot for every variant
+    passes : list of (regions file, image height)
+    '''
+    import csv
+    linked = 0
+    for IGV_regions_file, image_height in passes:
+        manifest_file = region_manifest_file(IGV_regions_file)
+        if not os.path.isfile(manifest_file):
+            continue
+        with open(manifest_file, 'r') as f:
+            for row in csv.DictReader(f, delimiter='\t'):
+                if row['Snapshot'] == row['Region Snapshot']:
+                    continue
+                region_snapshot = os.path.join(IGV_snapshots_dir, row['Region Snapshot'])
+                if os.path.isfile(region_snapshot):
+                    snapshot_cache.link_file(region_snapshot, os.path.join(IGV_snapshots_dir, row['Snapshot']))
+                    linked += 1
+    return(linked)
+
+def sample_snapshot_run(sample_name, bam_files, IGV_regions_file, IGV_snapshots_dir, image_height = '500', engine = None):
     '''
     Final step in validating input files and running the snapshotter
+    engine : "IGV", or "pileup" to draw the snapshots with pileup_renderer.py instead; defaults to the engine in global_settings
     '''
     genome = 'hg19'
     # igv_jar_bin = "bin/IGV_2.3.81/igv.jar"
@@ -148,13 +221,81 @@ def sample_snapshot_run(sample_name, bam_files, IGV_regions_file, IGV_snapshots_
     if validate_bed(bed_file = IGV_regions_file) != True:
         print('Sample {0} bed file {1} does not pass safety criteria, skipping IGV snapshot...'.format(sample_name, IGV_regions_file))
         return()
+    if engine is None:
+        engine = global_settings.snapshot_engine
+    if engine == 'pileup':
+        # only needs pysam and PIL when it is used
+        import pileup_renderer
+        pileup_renderer.render_regions(bam_files, IGV_daemon.read_regions(IGV_regions_file), IGV_snapshots_dir, image_height = image_height)
+        return()
     make_IGV_snapshots.main(input_files = bam_files, region_file = IGV_regions_file, genome = genome, image_height = image_height, outdir = IGV_snapshots_dir, igv_jar_bin = igv_jar_bin, igv_mem = igv_mem, nf4_mode = nf4_mode)
 
+def snapshots_made(passes, IGV_snapshots_dir):
+    '''
+    Check that the snapshot of every region in the regions files was made
+    passes : list of (regions file, image height)
+    '''
+    for IGV_regions_file, image_height in passes:
+        for chrom, start, stop, name in IGV_daemon.read_regions(IGV_regions_file):
+            snapshot_file = os.path.join(IGV_snapshots_dir, name)
+            if not os.path.isfile(snapshot_file) or os.path.getsize(snapshot_file) < 1:
+                print('WARNING: IGV snapshot was not made: {0}'.format(snapshot_file))
+                return(False)
+    return(True)
+
+def sample_snapshot_session(sample_name, bam_files, passes, IGV_snapshots_dir, jobs = None, engine = None):
+    '''
+    Make all the snapshots of a sample in a single IGV session, so the BAM files are only loaded once
+    passes : list of (regions file, image height); the regular snapshots, then the long snapshots
+    jobs : list to add the session to, to be run later by the snapshot pool, instead of running it now
+    engine : snapshot engine, see sample_snapshot_run; the pileup engine does not use IGV, so it is always run now
+    returns True if all the snapshots were made, False if any are missing, or None if the session was added to the jobs
+    '''
+    genome = 'hg19'
+    igv_jar_bin = global_settings.igv_bin
+    igv_mem = "4000"
+    # make sure the regions files look OK
+    valid_passes = []
+    for IGV_regions_file, image_height in passes:
+        if validate_bed(bed_file = IGV_regions_file) != True:
+            print('Sample {0} bed file {1} does not pass safety criteria, skipping IGV snapshot...'.format(sample_name, IGV_regions_file))
+            continue
+        valid_passes.append((IGV_regions_file, image_height))
+    if len(valid_passes) < 1:
+        # nothing to snapshot
+        return(True)
+    if engine is None:
+        engine = global_settings.snapshot_engine
+    if engine == 'pileup':
+        import pileup_renderer
+        pileup_renderer.snapshot_session(bam_files, valid_passes, IGV_snapshots_dir, genome = genome)
+    elif jobs is not None:
+        # the variant snapshots are linked once the pool has run the session
+        jobs.append({'sample_name': sample_name, 'bam_files': bam_files, 'passes': valid_passes, 'IGV_snapshots_dir': IGV_snapshots_dir})
+        return(None)
+    elif IGV_daemon.snapshot_session(bam_files = bam_files, passes = valid_passes, outdir = IGV_snapshots_dir, genome = genome, start_new = True, igv_jar_bin = igv_jar_bin, igv_mem = igv_mem) == True:
+        # used a running IGV server if there is one, otherwise started IGV once for all the passes
+        pass
+    else:
+        # IGV could not be run as a server; run it once per regions file instead, on slices of the BAM files
+        region_passes = [(IGV_daemon.read_regions(IGV_regions_file), image_height) for IGV_regions_file, image_height in valid_passes]
+        slice_files, scratch_dir = bam_slicer.slice_bams(bam_files, region_passes)
+        try:
+            for IGV_regions_file, image_height in valid_passes:
+                sample_snapshot_run(sample_name = sample_name, bam_files = slice_files, IGV_regions_file = IGV_regions_file, IGV_snapshots_dir = IGV_snapshots_dir, image_height = image_height)
+        finally:
+            bam_slicer.remove_slices(scratch_dir)
+    link_variant_snapshots(valid_passes, IGV_snapshots_dir)
+    return(snapshots_made(valid_passes, IGV_snapshots_dir))
+
 
-def sample_snapshot_parse(sample, NC_control_bam = None):
+def sample_snapshot_parse(sample, NC_control_bam = None, jobs = None, engine = None):
     '''
     Parse out information for the snapshotter, then submit for running
     'sample' is a dict generated by the parser earlier
+    jobs : list to add the sample's snapshot session to instead of running it; see sample_snapshot_session
+    engine : snapshot engine, see sample_snapshot_run
+    returns the result of sample_snapshot_session; True if there was nothing to snapshot for the sample
     '''
     # get some items from the sample dict
     is_control_sample = sample['is_control_sample']
@@ -183,7 +324,7 @@ def sample_snapshot_parse(sample, NC_control_bam = None):
     # make sure the sample is not a control sample
     if is_control_sample == True:
         print('Sample {0} is a control sample, skipping IGV snapshot...'.format(sample_name))
-        return()
+        return(True)
 
     # start list of bam files to include for the snapshots
     bam_files = []
@@ -197,28 +338,95 @@ def sample_snapshot_parse(sample, NC_control_bam = None):
     if len(bam_files) > 0:
         # convert the sample summary table to BED format
         if ( sample_summary_table != None and os.path.isfile(str(sample_summary_table)) ):
+            # skip tables with no variants, and long snapshots of tables with no low frequency variants, using the metadata from merge_vcf_annotations.py
+            summary_metadata = pl.load_summary_metadata(sample_summary_table)
+            if summary_metadata is not None and summary_metadata['rows'] < 1:
+                print("No variants in sample summary table {0}, IGV snapshot will not be run.".format(sample_summary_table))
+                return(True)
+            if summary_metadata is not None and not (summary_metadata['min_frequency'] is not None and summary_metadata['min_frequency'] < 1):
+                IGV_regions_file_long = None
+            passes = []
             # first do the regular regions file
             if IGV_regions_file != None:
                 summary_table_to_bed(sample_summary_table = sample_summary_table, output_file = IGV_regions_file)
-                sample_snapshot_run(sample_name = sample_name, bam_files = bam_files, IGV_regions_file = IGV_regions_file, IGV_snapshots_dir = IGV_snapshots_dir)
-                # check the bed file before trying to run the snapshotter
+                passes.append((IGV_regions_file, '500'))
 
             # check for long regions file
             if IGV_regions_file_long != None:
                 summary_table_to_bed_long(sample_summary_table = sample_summary_table, output_file = IGV_regions_file_long)
-                sample_snapshot_run(sample_name = sample_name, bam_files = bam_files, IGV_regions_file = IGV_regions_file_long, IGV_snapshots_dir = IGV_snapshots_dir, image_height = '5000')
+                passes.append((IGV_regions_file_long, '5000'))
+
+            # both sets of snapshots in one IGV session; the bed files are checked before running the snapshotter
+            return(sample_snapshot_session(sample_name = sample_name, bam_files = bam_files, passes = passes, IGV_snapshots_dir = IGV_snapshots_dir, jobs = jobs, engine = engine))
         else:
             print("Could not validate sample summary table! IGV Snapshot will not be run.")
-            return()
+            return(True)
     else:
         print("No .bam files found for sample {0}, IGV snapshot will not be run!".format(sample_name))
+        return(True)
+
+def sample_snapshot_jobs(samples, NC_control_bam = None, statuses = None):
+    '''
+    Yield a snapshot pool job for each sample that has snapshots to run
+    statuses : dict to record the status of the samples that have nothing to run in, by barcode
+    '''
+    for sample in samples:
+        sessions = []
+        status = sample_snapshot_parse(sample, NC_control_bam = NC_control_bam, jobs = sessions)
+        if len(sessions) > 0:
+            yield({'name': sample['Sample Name'], 'barcode': sample['Barcode'], 'sessions': sessions})
+        elif statuses is not None:
+            statuses[sample['Barcode']] = status != False
+
+def sample_snapshot_parse_safe(sample, NC_control_bam = None, engine = None):
+    '''
+    Run sample_snapshot_parse, counting any error as failed snapshots so the other samples are still run
+    returns True if the sample's snapshots were all made
+    '''
+    try:
+        return(sample_snapshot_parse(sample, NC_control_bam = NC_control_bam, engine = engine) != False)
+    except Exception as e:
+        print('ERROR: IGV snapshots failed for sample {0}: {1}'.format(sample['Sample Name'], repr(e)))
+        return(False)
+
+def sample_snapshot_parse_pool(sample_args):
+    '''
+    Run sample_snapshot_parse in a pool process, for the pileup engine
+    returns (barcode, True if the sample's snapshots were all made)
+    '''
+    sample, NC_control_bam, engine = sample_args
+    return((sample['Barcode'], sample_snapshot_parse_safe(sample, NC_control_bam = NC_control_bam, engine = engine)))
 
-def main(analysis_data, json_file = False):
+def pool_result_status(result):
+    '''
+    Finish a snapshot pool job; link the variant snapshots of the jobs that were run,
+    and run the jobs that failed, or that no IGV server could be started for, the usual way
+    returns True if all the job's snapshots were made
+    '''
+    status = True
+    for session in result['job']['sessions']:
+        try:
+            if result['status'] != 'done':
+                print('Snapshot pool job {0} {1}, running its snapshots again without the pool...'.format(result['name'], result['status']))
+                session_status = sample_snapshot_session(**session)
+            else:
+                link_variant_snapshots(session['passes'], session['IGV_snapshots_dir'])
+                session_status = snapshots_made(session['passes'], session['IGV_snapshots_dir'])
+        except Exception as e:
+            print('ERROR: IGV snapshots failed for sample {0}: {1}'.format(result['name'], repr(e)))
+            session_status = False
+        status = status and session_status == True
+    return(status)
+
+def main(analysis_data, json_file = False, workers = 1, engine = None):
     '''
     Main control function for the script
     parses the analysis_data for a single run and runs the IGV snapshot for each sample
     based on supplied criteria
     json_file : analysis_data is a JSON file that needs to be loaded first
+    workers : number of samples to snapshot at once, each on its own IGV and display; or in its own process with the pileup engine
+    engine : snapshot engine, see sample_snapshot_run
+    returns a dict of the barcode of each sample that was run, and True if all its snapshots were made
     '''
     print('foo')
     if json_file != False:
@@ -237,5 +445,37 @@ def main(analysis_data, json_file = False):
     ):
         NC_control_bam = analysis_data['NC_control_sample']['sample_bam_file']
 
+    # if the parser listed which samples changed since their last snapshots, only snapshot those
+    samples_needing_snapshots = analysis_data.get('samples_needing_snapshots', None)
+    samples = []
     for sample in analysis_data['coverage_samples']:
-        sample_snapshot_parse(sample, NC_control_bam = NC_control_bam)
+        if samples_needing_snapshots is not None and sample['Barcode'] not in samples_needing_snapshots:
+            print('Sample {0} has not changed since its last snapshots, skipping IGV snapshot...'.format(sample['Sample Name']))
+            continue
+        samples.append(sample)
+
+    if engine is None:
+        engine = global_settings.snapshot_engine
+    statuses = {}
+    if engine == 'pileup' and workers > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes = workers)
+        try:
+            for barcode, status in pool.imap_unordered(sample_snapshot_parse_pool, [(sample, NC_control_bam, engine) for sample in samples]):
+                print('Finished pileup snapshots for sample {0}'.format(barcode))
+                statuses[barcode] = status
+        finally:
+            pool.close()
+            pool.join()
+    elif workers > 1:
+        results = snapshot_pool.run_snapshot_jobs(sample_snapshot_jobs(samples, NC_control_bam = NC_control_bam, statuses = statuses), num_workers = workers)
+        for result in results:
+            statuses[result['job']['barcode']] = pool_result_status(result)
+    else:
+        for sample in samples:
+            statuses[sample['Barcode']] = sample_snapshot_parse_safe(sample, NC_control_bam = NC_control_bam, engine = engine)
+
+    failed = sorted([barcode for barcode, status in statuses.items() if status == False])
+    if len(failed) > 0:
+        print('ERROR: IGV snapshots failed for samples: {0}'.format(', '.join(failed)))
+    return(statuses)
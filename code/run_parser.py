@@ -2,6 +2,8 @@
 
 '''
 USAGE: run_parser.py <analysis ID> <analysis ID> <analysis ID> ...
+USAGE: run_parser.py -threads 4 <analysis ID> <analysis ID> <analysis ID> ...
+USAGE: run_parser.py -snapshot_workers 4 <analysis ID> <analysis ID> <analysis ID> ...
 
 This script will look for BAM files in analysis output directories and run the IGV snapshot automator on them
 
@@ -16,8 +18,12 @@ This script will look for BAM files in analysis output directories and run the I
 import sys
 import os
 import csv
+import json
 import argparse
 import pipeline_functions as pl
+import table_schemas
+import analysis_index
+import control_samples
 import global_settings
 import run_IGV_snapshot_automator
 
@@ -126,7 +132,7 @@ def find_analysis_variant_dir(analysis_dir):
                 variant_dir = os.path.join(root, dir)
                 return(variant_dir)
     if variant_dir == None:
-        pl.kill_on_false(False, my_message = "ERROR: Analysis coverage dir not found!")
+        pl.kill_on_false(False, my_message = "ERROR: Analysis variant dir not found!")
 
 def find_sample_variant_dir(variant_dir, barcode):
     '''
@@ -214,37 +220,20 @@ def get_control_sample_IDs():
     '''
     return(pl.list_file_lines(global_settings.control_sample_ID_file))
 
-def find_NC_control_sample(analysis_ID, analysis_barcode_index, combined_sample_barcode_IDs_index):
+def find_NC_control_sample(analysis_ID, analysis_barcode_index, combined_sample_barcode_IDs_index, matcher):
     '''
     Parse the analysis_barcode_index list of dicts to find the sample that matches the NC sample ID's for the run
+    matcher : control sample matcher from control_samples.get_control_sample_matcher
     If a match is found, returns (index, barcode, sample name)
     otherwise returns None
     '''
-    import re
-    import copy
-    # # # # # # #
-    # Set up the NC Sample ID search params
-    # # # # # # #
-    # mess with this if I need to do this kind of matching again later; trying to convert the file contents grep regex to Python regex dynamically...
-    # # # # # ## #
-    # NC_sampleID_patterns = pl.list_file_lines(global_settings.control_sample_regex_file)
-    # # # ['^NC[[:space:]]', '^NC[[:space:]]HAPMAP[[:space:]]', '^HAPMAP[[:space:]]'] # # file contents grep regex
-    # NC_sampleID_patterns = [re.escape(item.replace(r'[[:space:]]', r'\s')) for item in NC_sampleID_patterns]
-    # NC_sampleID_patterns = [r'{0}'.format(item) for item in NC_sampleID_patterns]
-    # NC_sampleID_patterns = [item.replace(r'[[:space:]]', r'\s' ) for item in NC_sampleID_patterns]
-    # NC_sampleID_patterns = r'|'.join(NC_sampleID_patterns)
-    # # # no trailing [[:space:]] because reading in the items strips them out
-    NC_sampleID_patterns_regex = r'^NC|^NC\sHAPMAP|^HAPMAP'
-    NC_sampleID_patterns = re.compile(NC_sampleID_patterns_regex, re.IGNORECASE)
-
     # first search the combined_sample_barcode_IDs_index
     if combined_sample_barcode_IDs_index != None:
         for i, item in enumerate(combined_sample_barcode_IDs_index):
             sample_name = item['Sample Name']
-            match = re.match(NC_sampleID_patterns, sample_name)
-            if match is not None:
-                result = copy.deepcopy(item)
-                result['NC_sampleID_patterns_regex'] = NC_sampleID_patterns_regex
+            if control_samples.is_NC_control_sample(matcher, sample_name):
+                result = dict(item)
+                result['NC_sampleID_patterns_regex'] = matcher['pattern']
                 result['found_in_current_run'] = False
                 result['found_in_paired_run'] = True
                 return(result)
@@ -252,10 +241,9 @@ def find_NC_control_sample(analysis_ID, analysis_barcode_index, combined_sample_
     # next search the analysis_barcode_index
     for i, item in enumerate(analysis_barcode_index):
         sample_name = item['Sample Name']
-        match = re.match(NC_sampleID_patterns, sample_name)
-        if match is not None:
-            result = copy.deepcopy(item)
-            result['NC_sampleID_patterns_regex'] = NC_sampleID_patterns_regex
+        if control_samples.is_NC_control_sample(matcher, sample_name):
+            result = dict(item)
+            result['NC_sampleID_patterns_regex'] = matcher['pattern']
             result['Analysis ID'] = analysis_ID # not present in the analysis_barcode_index but required later
             result['found_in_current_run'] = True
             result['found_in_paired_run'] = False
@@ -275,29 +263,29 @@ def test_for_paired_analysis(analysis_outdir):
         is_paired = True
     return((is_paired, combined_sample_barcode_IDs_file))
 
-def test_for_control_sample(analysis_barcode_index, control_sample_IDs):
+def test_for_control_sample(analysis_barcode_index, matcher):
     '''
     Evalutate each 'Sample Name' in dict list coverage_samples to determine if it matches an entry in list of known control_sample_IDs
     If an entry matches a known control sample, remove it from the dict of coverage samples
+    matcher : control sample matcher from control_samples.get_control_sample_matcher
 
     This lets us exclude known control samples from being snapshotted later, since controls dont need snapshots on their own
     '''
     for item in analysis_barcode_index:
         barcode = item['Barcode']
         sample_ID = item['Sample Name']
-        if sample_ID in control_sample_IDs:
-            item['is_control_sample'] = True
-        elif sample_ID not in control_sample_IDs:
-            item['is_control_sample'] = False
+        item['is_control_sample'] = control_samples.is_known_control_sample(matcher, sample_ID)
     return(analysis_barcode_index)
 
-def make_sample_IGV_dir(analysis_outdir, barcode, return_path = True):
+def make_sample_IGV_dir(analysis_outdir, barcode, return_path = True, sample_bam_dir = None):
     '''
     Create the IGV snapshot dir for a sample
+    sample_bam_dir : the sample's coverage dir, if it has already been found
     '''
     import os
-    coverage_dir = find_analysis_coverage_dir(analysis_outdir)
-    sample_bam_dir = find_sample_bam_dir(coverage_dir, barcode)
+    if sample_bam_dir is None:
+        coverage_dir = find_analysis_coverage_dir(analysis_outdir)
+        sample_bam_dir = find_sample_bam_dir(coverage_dir, barcode)
     IGV_snapshots_dir = pl.mkdir_p(os.path.join(sample_bam_dir, 'IGV_snapshots'), return_path = True)
     if return_path == True:
         return(IGV_snapshots_dir)
@@ -322,6 +310,15 @@ def check_for_IGV_long_regions_snapshot(sample_summary_table, min_frequency = 1)
     needs_long_regions_file = False
     any_variant_has_low_freq = False
     print("\nChecking {0} for low frequency variants that will need long snapshots".format(sample_summary_table))
+    # use the row count and Frequency range saved by merge_vcf_annotations.py, if they are up to date
+    summary_metadata = pl.load_summary_metadata(sample_summary_table)
+    if summary_metadata is not None:
+        if summary_metadata['rows'] < 1:
+            print("File {0} has no variants and should not be used for IGV snapshots.".format(sample_summary_table))
+            return(needs_long_regions_file)
+        any_variant_has_low_freq = summary_metadata['min_frequency'] is not None and summary_metadata['min_frequency'] < min_frequency
+        print("Low frequency variants present in sample: {0}".format(any_variant_has_low_freq))
+        return(any_variant_has_low_freq)
     # make sure the variant table has at least 2 lines; 1 header, one entry
     min_lines = 2
     test_pass = pl.file_min_lines(file_path = sample_summary_table, min_lines = min_lines)
@@ -329,12 +326,9 @@ def check_for_IGV_long_regions_snapshot(sample_summary_table, min_frequency = 1)
         print("File {0} has less than {1} lines and should not be used for IGV snapshots.".format(sample_summary_table, min_lines))
         return(needs_long_regions_file)
     elif test_pass == True:
-        # check if ANY variants have low frequency
-        with open(sample_summary_table, 'r') as tsvin:
-            reader = csv.DictReader(tsvin, delimiter='\t')
-            for row in reader:
-                if float(row['Frequency']) < min_frequency:
-                    any_variant_has_low_freq = True
+        # check if ANY variants have low frequency; uses the columnar copy of the table if there is one
+        summary_df = table_schemas.read_schema_table(sample_summary_table, 'summary', stage = 'long_snapshots')
+        any_variant_has_low_freq = bool((summary_df['Frequency'] < min_frequency).any())
         print("Low frequency variants present in sample: {0}".format(any_variant_has_low_freq))
     if any_variant_has_low_freq == True:
         needs_long_regions_file = True
@@ -342,19 +336,25 @@ def check_for_IGV_long_regions_snapshot(sample_summary_table, min_frequency = 1)
 
 
 
-def find_sample_files(analysis_outdir, sample):
+def find_sample_files(analysis_outdir, sample, index = None):
     '''
     Find the files for a single sample
     sample is a dict that should have a Barcode
+    index : analysis_index of the analysis_outdir; the dir is indexed if not passed
     '''
     barcode = sample['Barcode']
-    coverage_dir = find_analysis_coverage_dir(analysis_outdir)
-    variant_dir = find_analysis_variant_dir(analysis_outdir)
-    sample_variant_dir = find_sample_variant_dir(variant_dir, barcode)
-    sample_summary_table = find_sample_summary_table(analysis_outdir = analysis_outdir, barcode = barcode)
-    sample_bam_dir = find_sample_bam_dir(coverage_dir, barcode)
-    sample_bam_file = find_sample_bam(analysis_outdir = analysis_outdir, barcode = barcode)
-    IGV_snapshots_dir = make_sample_IGV_dir(analysis_outdir = analysis_outdir, barcode = barcode)
+    if index is None:
+        index = analysis_index.index_analysis_dir(analysis_outdir)
+    pl.kill_on_false(index['coverage_dir'] is not None, my_message = "ERROR: Analysis coverage dir not found!")
+    pl.kill_on_false(index['variant_dir'] is not None, my_message = "ERROR: Analysis variant dir not found!")
+    coverage_dir = index['coverage_dir']
+    variant_dir = index['variant_dir']
+    sample_files = analysis_index.get_sample_files(index, barcode)
+    sample_variant_dir = sample_files['sample_variant_dir']
+    sample_summary_table = sample_files['sample_summary_table']
+    sample_bam_dir = sample_files['sample_bam_dir']
+    sample_bam_file = sample_files['sample_bam_file']
+    IGV_snapshots_dir = make_sample_IGV_dir(analysis_outdir = analysis_outdir, barcode = barcode, sample_bam_dir = sample_bam_dir)
     IGV_regions_file = os.path.join(IGV_snapshots_dir, "regions.bed") # doesnt exist yet will fill out later
 
     needs_long_regions_file = check_for_IGV_long_regions_snapshot(sample_summary_table)
@@ -369,29 +369,85 @@ def find_sample_files(analysis_outdir, sample):
     sample['coverage_dir'] = coverage_dir
     sample['sample_bam_dir'] = sample_bam_dir
     sample['sample_bam_file'] = sample_bam_file
+    sample['sample_bai_file'] = sample_files['sample_bai_file']
     sample['IGV_snapshots_dir'] = IGV_snapshots_dir
     sample['IGV_regions_file'] = IGV_regions_file
     sample['IGV_regions_file_long'] = IGV_regions_file_long
     return(sample)
 
 
-def find_coverage_samples_files(analysis_outdir, coverage_samples):
+# sample input files that are fingerprinted to tell if a sample has changed since the last parse
+fingerprint_keys = ['sample_summary_table', 'sample_bam_file', 'sample_bai_file']
+
+# sample entries set by find_sample_files; reused from the last parse for unchanged samples
+sample_file_keys = ['variant_dir', 'sample_summary_table', 'sample_variant_dir', 'coverage_dir', 'sample_bam_dir', 'sample_bam_file', 'sample_bai_file', 'IGV_snapshots_dir', 'IGV_regions_file', 'IGV_regions_file_long']
+
+def file_fingerprint(file_path, hash_files = False):
+    '''
+    Return a dict of the size and modification time of a file, and its SHA1 hash if hash_files; None if there is no file
+    '''
+    import hashlib
+    if file_path is None or not os.path.isfile(file_path):
+        return(None)
+    stat = os.stat(file_path)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if hash_files == True:
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(block)
+        fingerprint['sha1'] = sha1.hexdigest()
+    return(fingerprint)
+
+def load_previous_analysis_data(output_JSON):
+    '''
+    Load the analysis_data saved by the last parse of an analysis, or None
+    '''
+    if not os.path.isfile(output_JSON):
+        return(None)
+    try:
+        return(pl.load_json(output_JSON))
+    except ValueError:
+        print("WARNING: Could not load the previous analysis data from {0}; all samples will be parsed".format(output_JSON))
+        return(None)
+
+def find_coverage_samples_files(analysis_outdir, coverage_samples, index = None, previous_samples = None, hash_files = False):
     '''
     Find the files and dirs for each of the coverage samples
     coverage_samples is a list of dicts
-    '''
+    index : analysis_index of the analysis_outdir
+    previous_samples : dict of barcode: sample dict from the last parse; samples whose input file fingerprints
+    have not changed reuse these entries instead of being parsed again
+    returns (coverage_samples, list of the barcodes of the samples that were parsed again)
+    '''
+    if index is None:
+        index = analysis_index.index_analysis_dir(analysis_outdir)
+    if previous_samples is None:
+        previous_samples = {}
+    changed_barcodes = []
     for item in coverage_samples:
-        item = find_sample_files(analysis_outdir, sample = item)
-    return(coverage_samples)
+        barcode = item['Barcode']
+        sample_files = analysis_index.get_sample_files(index, barcode)
+        fingerprints = dict((key, file_fingerprint(sample_files[key], hash_files = hash_files)) for key in fingerprint_keys)
+        previous_sample = previous_samples.get(barcode)
+        if previous_sample is not None and previous_sample.get('input_fingerprints') == fingerprints:
+            for key in sample_file_keys:
+                item[key] = previous_sample.get(key)
+        else:
+            item = find_sample_files(analysis_outdir, sample = item, index = index)
+            changed_barcodes.append(barcode)
+        item['input_fingerprints'] = fingerprints
+    return((coverage_samples, changed_barcodes))
 
-def find_NC_control_sample_files(analysis_outdir, NC_control_sample):
+def find_NC_control_sample_files(analysis_outdir, NC_control_sample, index = None):
     '''
     Find the files related to the NC control sample
     NC_control_sample is a dict, or None
+    index : analysis_index of the analysis_outdir; not used for an NC control sample from the paired analysis
     '''
     if NC_control_sample != None:
         if NC_control_sample['found_in_current_run'] == True:
-            NC_control_sample = find_sample_files(analysis_outdir = analysis_outdir, sample = NC_control_sample)
+            NC_control_sample = find_sample_files(analysis_outdir = analysis_outdir, sample = NC_control_sample, index = index)
         elif NC_control_sample['found_in_current_run'] == False:
             if 'Analysis ID' in NC_control_sample.keys():
                 analysis_ID = NC_control_sample['Analysis ID']
@@ -414,28 +470,69 @@ def run_snapshot(analysis_data):
     ):
         print('')
 
-def parse_analysis_dir(analysis_ID, analysis_outdir, control_sample_IDs):
+def parse_analysis_dir(analysis_ID, analysis_outdir, control_sample_IDs, force = False, hash_files = False):
     '''
     Gather all the data needed to run the IGV snapshotter
+    the analysis dir is listed once, and all of the dirs and files are found from that listing
+
+    The sizes and modification times of each sample's summary table, BAM, and BAI files, and of the barcode files,
+    are saved in the JSON; when the analysis is parsed again, only the samples whose files changed are parsed,
+    and 'samples_needing_snapshots' lists the samples that need new snapshots.
+    The JSON is only rewritten if the analysis data changed.
+    force : parse every sample again, and snapshot all of them
+    hash_files : also compare the SHA1 hash of the files
     '''
+    output_JSON = os.path.join(analysis_outdir, '{0}.json'.format(analysis_ID))
+    previous_analysis_data = None if force == True else load_previous_analysis_data(output_JSON)
+    index = analysis_index.index_analysis_dir(analysis_outdir)
     # check if the analysis was paired
-    is_paired, combined_sample_barcode_IDs_file = test_for_paired_analysis(analysis_outdir)
+    combined_sample_barcode_IDs_file = index['combined_sample_barcode_IDs_file']
+    is_paired = combined_sample_barcode_IDs_file != None
     # if it was paired, get the index for the pair
     combined_sample_barcode_IDs_index = get_combined_sample_barcode_IDs_index(combined_sample_barcode_IDs_file)
     # index of samples for the run; list of dicts
-    analysis_barcode_file = find_analysis_barcode_file(analysis_outdir)
+    analysis_barcode_file = index['analysis_barcode_file']
+    if analysis_barcode_file == None:
+        print("ERROR: Analysis barcode file not found")
+    pl.file_exists(analysis_barcode_file, kill = True)
     analysis_barcode_index = get_analysis_barcode_index(analysis_barcode_file)
+    # the barcode files list the samples in the analysis; if they changed, parse every sample again
+    analysis_fingerprints = {
+    'analysis_barcode_file': file_fingerprint(analysis_barcode_file, hash_files = hash_files),
+    'combined_sample_barcode_IDs_file': file_fingerprint(combined_sample_barcode_IDs_file, hash_files = hash_files)
+    }
+    previous_samples = {}
+    if previous_analysis_data is not None and previous_analysis_data.get('input_fingerprints') == analysis_fingerprints:
+        previous_samples = dict((sample['Barcode'], sample) for sample in previous_analysis_data['coverage_samples'])
     # samples with coverage directories in the analysis run
     # samples_present_in_coverage_dir = find_coverage_samples(analysis_outdir)
+    # one matcher for the NC sample regexes and the known control sample IDs; compiled once and cached between analyses
+    matcher = control_samples.get_control_sample_matcher(control_sample_IDs = control_sample_IDs)
     # exclude known control samples from being snapshotted; list of dicts
-    coverage_samples = test_for_control_sample(analysis_barcode_index, control_sample_IDs)
+    coverage_samples = test_for_control_sample(analysis_barcode_index, matcher)
     # get the coverage files and dirs for each sample; add to dict entries
-    coverage_samples = find_coverage_samples_files(analysis_outdir, coverage_samples)
+    coverage_samples, parsed_barcodes = find_coverage_samples_files(analysis_outdir, coverage_samples, index = index, previous_samples = previous_samples, hash_files = hash_files)
     # get the
     # the NC sample, if present in the run; otherwise None
-    NC_control_sample = find_NC_control_sample(analysis_ID, analysis_barcode_index, combined_sample_barcode_IDs_index)
+    NC_control_sample = find_NC_control_sample(analysis_ID, analysis_barcode_index, combined_sample_barcode_IDs_index, matcher)
     # get the NC control sample files
-    NC_control_sample = find_NC_control_sample_files(analysis_outdir = analysis_outdir, NC_control_sample = NC_control_sample)
+    NC_control_sample = find_NC_control_sample_files(analysis_outdir = analysis_outdir, NC_control_sample = NC_control_sample, index = index)
+    if NC_control_sample != None:
+        NC_control_sample['input_fingerprints'] = dict((key, file_fingerprint(NC_control_sample.get(key), hash_files = hash_files)) for key in fingerprint_keys)
+
+    # the NC control BAM is included in every snapshot; if it changed, all the samples need new snapshots
+    previous_NC_control_sample = previous_analysis_data.get('NC_control_sample') if previous_analysis_data is not None else None
+    NC_changed = (NC_control_sample is None) != (previous_NC_control_sample is None)
+    if NC_control_sample is not None and previous_NC_control_sample is not None:
+        NC_changed = NC_control_sample.get('sample_bam_file') != previous_NC_control_sample.get('sample_bam_file') or NC_control_sample['input_fingerprints'] != previous_NC_control_sample.get('input_fingerprints')
+    changed_barcodes = list(parsed_barcodes)
+    if NC_changed == True:
+        changed_barcodes = [sample['Barcode'] for sample in coverage_samples]
+    # samples from the last parse that have not been snapshotted yet still need snapshots
+    if previous_analysis_data is not None:
+        changed_barcodes = changed_barcodes + [barcode for barcode in previous_analysis_data.get('samples_needing_snapshots', []) if barcode not in changed_barcodes]
+    samples_needing_snapshots = [sample['Barcode'] for sample in coverage_samples if sample['Barcode'] in changed_barcodes and sample['is_control_sample'] == False]
+    print("Analysis {0}: {1} of {2} samples changed since the last parse; samples needing new snapshots: {3}".format(analysis_ID, len(parsed_barcodes), len(coverage_samples), ', '.join(samples_needing_snapshots) or 'none'))
 
 
     analysis_data = {}
@@ -449,31 +546,127 @@ def parse_analysis_dir(analysis_ID, analysis_outdir, control_sample_IDs):
     analysis_data['coverage_samples'] = coverage_samples
     analysis_data['combined_sample_barcode_IDs_index'] = combined_sample_barcode_IDs_index
     analysis_data['NC_control_sample'] = NC_control_sample
+    analysis_data['input_fingerprints'] = analysis_fingerprints
+    analysis_data['samples_needing_snapshots'] = samples_needing_snapshots
 
     # run_IGV_snapshot_automator.print_analysis_data(analysis_data)
     # save JSON of the analysis_data
-    output_JSON = os.path.join(analysis_outdir, '{0}.json'.format(analysis_ID))
     print('JSON output: {0}'.format(output_JSON))
-    pl.write_json(object = analysis_data, output_file = output_JSON)
+    if previous_analysis_data is not None and json.loads(json.dumps(analysis_data)) == previous_analysis_data:
+        print('Analysis data has not changed, JSON file not rewritten')
+    else:
+        pl.write_json(object = analysis_data, output_file = output_JSON)
     pl.file_exists(output_JSON, kill = False)
     return(output_JSON)
 
 
 
-def submit_to_IGV_runner(analysis_data):
+def analysis_needs_snapshots(output_JSON):
+    '''
+    Check if any samples in a parsed analysis need new snapshots
+    '''
+    analysis_data = pl.load_json(output_JSON)
+    return(len(analysis_data.get('samples_needing_snapshots', [])) > 0)
+
+def mark_snapshots_done(output_JSON, snapshot_statuses):
+    '''
+    Remove the samples whose snapshots were all made from the list of samples needing snapshots for an analysis
+    snapshot_statuses : dict of barcode and True if all the sample's snapshots were made, from the IGV snapshotter
+    the samples that failed stay on the list, so they are run again the next time
+    '''
+    analysis_data = pl.load_json(output_JSON)
+    samples_needing_snapshots = [barcode for barcode in analysis_data.get('samples_needing_snapshots', []) if snapshot_statuses.get(barcode) != True]
+    if len(samples_needing_snapshots) > 0:
+        print('IGV snapshots failed for samples {0}, they will be run again next time'.format(', '.join(samples_needing_snapshots)))
+    analysis_data['samples_needing_snapshots'] = samples_needing_snapshots
+    pl.write_json(object = analysis_data, output_file = output_JSON)
+
+def snapshot_analysis(output_JSON, snapshot_workers = 1, snapshot_engine = None):
+    '''
+    Submit a parsed analysis to the IGV snapshotter if any of its samples need new snapshots
+    '''
+    if analysis_needs_snapshots(output_JSON) == False:
+        print('No samples need new snapshots in {0}, IGV snapshotter will not be run'.format(output_JSON))
+        return
+    snapshot_statuses = submit_to_IGV_runner(analysis_data = output_JSON, snapshot_workers = snapshot_workers, snapshot_engine = snapshot_engine)
+    mark_snapshots_done(output_JSON, snapshot_statuses)
+
+def submit_to_IGV_runner(analysis_data, snapshot_workers = 1, snapshot_engine = None):
     '''
     analysis_data can be either the dict object or the path to the JSON dump of the dict object;
     specify which it is in the call to the module here!
+    returns a dict of barcode and True if all the sample's snapshots were made
     '''
     print('submitting the analysis_data to be run by IGV snapshotter...')
     # run_IGV_snapshot_automator.main(analysis_data)
-    run_IGV_snapshot_automator.main(analysis_data, json_file = True)
+    snapshot_statuses = run_IGV_snapshot_automator.main(analysis_data, json_file = True, workers = snapshot_workers, engine = snapshot_engine)
     # end
     print('------------------------------------')
+    return(snapshot_statuses)
+
+def snapshot_consumer(snapshot_queue, snapshot_workers = 1, snapshot_engine = None):
+    '''
+    Run the snapshots of the parsed analyses on the queue one at a time, until None is received
+    errors are caught so a single bad analysis does not stop the snapshots of the others
+    '''
+    while True:
+        output_JSON = snapshot_queue.get()
+        if output_JSON is None:
+            return
+        try:
+            snapshot_analysis(output_JSON, snapshot_workers = snapshot_workers, snapshot_engine = snapshot_engine)
+        except (Exception, SystemExit) as e:
+            print("ERROR: Could not run the IGV snapshots for {0}: {1}".format(output_JSON, repr(e)))
 
-def main(analysis_IDs, nosnap = False):
+def start_snapshot_consumer(snapshot_workers = 1, snapshot_engine = None):
+    '''
+    Start a process to run the snapshots of the parsed analyses, so the next analysis can be parsed while IGV runs
+    returns (queue, process); put the output_JSON of each parsed analysis on the queue, then None once they are all parsed
+    '''
+    import multiprocessing
+    snapshot_queue = multiprocessing.Queue()
+    snapshot_process = multiprocessing.Process(target = snapshot_consumer, args = (snapshot_queue, snapshot_workers, snapshot_engine))
+    snapshot_process.start()
+    return((snapshot_queue, snapshot_process))
+
+def parse_analysis_pool(analysis_args):
+    '''
+    Run parse_analysis_dir in a pool process; returns (analysis_ID, output_JSON or None)
+    errors are caught so a single bad analysis does not stop the others
+    '''
+    analysis_ID, control_sample_IDs, force, hash_files = analysis_args
+    try:
+        analysis_outdir = pl.dir_exists(os.path.join(global_settings.outdir, analysis_ID), kill = True, return_path = True) #output/analysis_ID
+        print('\n- {0}: {1}\n'.format(analysis_ID, analysis_outdir))
+        output_JSON = parse_analysis_dir(analysis_ID, analysis_outdir, control_sample_IDs, force = force, hash_files = hash_files)
+        return((analysis_ID, output_JSON))
+    except (Exception, SystemExit) as e:
+        print("ERROR: Could not parse analysis {0}: {1}".format(analysis_ID, repr(e)))
+        return((analysis_ID, None))
+
+def parse_analyses(analysis_IDs, control_sample_IDs, threads = 1, force = False, hash_files = False):
+    '''
+    Parse the analysis dirs in a pool of processes
+    yields (analysis_ID, output_JSON or None) for each analysis as soon as it has been parsed, in the order they finish
+    '''
+    import multiprocessing
+    pool = multiprocessing.Pool(processes = threads)
+    try:
+        for result in pool.imap_unordered(parse_analysis_pool, [(analysis_ID, control_sample_IDs, force, hash_files) for analysis_ID in analysis_IDs]):
+            yield(result)
+    finally:
+        pool.close()
+        pool.join()
+
+def main(analysis_IDs, nosnap = False, threads = 1, force = False, hash_files = False, snapshot_workers = 1, snapshot_engine = None):
     '''
     Main control function for the script
+    threads : number of analyses to parse at once
+    the snapshots for each analysis are run in a separate process as soon as it has been parsed, while the next analyses are parsed
+    force : parse and snapshot every sample, even if its files have not changed since the last parse
+    hash_files : also compare file hashes to tell if a sample's files have changed
+    snapshot_workers : number of samples in an analysis to snapshot at once
+    snapshot_engine : "IGV", or "pileup" to draw the snapshots without IGV; defaults to the engine in global_settings
     '''
     if len(analysis_IDs) < 1:
         print("ERROR: Not enough analysis_IDs! Need at least 1")
@@ -482,13 +675,35 @@ def main(analysis_IDs, nosnap = False):
     # control sample ID's; do not run snapshots on these samples!
     control_sample_IDs = get_control_sample_IDs()
 
-    for analysis_ID in analysis_IDs:
-        analysis_outdir = pl.dir_exists(os.path.join(global_settings.outdir, analysis_ID), kill = True, return_path = True) #output/analysis_ID
-
-        print('\n- {0}: {1}\n'.format(analysis_ID, analysis_outdir))
-        output_JSON = parse_analysis_dir(analysis_ID, analysis_outdir, control_sample_IDs)
-        if nosnap == False:
-            submit_to_IGV_runner(analysis_data = output_JSON)
+    snapshot_queue = None
+    if nosnap == False:
+        snapshot_queue, snapshot_process = start_snapshot_consumer(snapshot_workers = snapshot_workers, snapshot_engine = snapshot_engine)
+    failed = []
+    try:
+        if threads > 1:
+            for analysis_ID, output_JSON in parse_analyses(analysis_IDs, control_sample_IDs, threads = threads, force = force, hash_files = hash_files):
+                if output_JSON is None:
+                    failed.append(analysis_ID)
+                    continue
+                print('Parsed analysis {0}: {1}'.format(analysis_ID, output_JSON))
+                if snapshot_queue is not None:
+                    snapshot_queue.put(output_JSON)
+        else:
+            for analysis_ID in analysis_IDs:
+                analysis_outdir = pl.dir_exists(os.path.join(global_settings.outdir, analysis_ID), kill = True, return_path = True) #output/analysis_ID
+
+                print('\n- {0}: {1}\n'.format(analysis_ID, analysis_outdir))
+                output_JSON = parse_analysis_dir(analysis_ID, analysis_outdir, control_sample_IDs, force = force, hash_files = hash_files)
+                if snapshot_queue is not None:
+                    snapshot_queue.put(output_JSON)
+    finally:
+        if snapshot_queue is not None:
+            # wait for the snapshots of the analyses that were parsed
+            snapshot_queue.put(None)
+            snapshot_process.join()
+    if len(failed) > 0:
+        print("ERROR: Analyses could not be parsed: {0}".format(', '.join(sorted(failed))))
+        sys.exit(1)
 
 
 def run():
@@ -500,11 +715,16 @@ def run():
     # required positional args
     parser.add_argument("analysis_IDs", nargs='+', help="path to the summary samplesheet to run") # , nargs='?'
     parser.add_argument("-nosnap", default = False, action='store_true', dest = 'nosnap', help="Do not run the IGV snapshot on the analyses passed, only run the parser to generate the JSON")
+    parser.add_argument("-force", default = False, action='store_true', dest = 'force', help="Parse and snapshot every sample, even if its summary table and BAM files have not changed since the last parse")
+    parser.add_argument("-hash", default = False, action='store_true', dest = 'hash_files', help="Also compare the SHA1 hash of the sample files to tell if they changed, not just their size and modification time")
+    parser.add_argument("-threads", default = 1, type = int, dest = 'threads', metavar = 'number of processes', help="Number of analyses to parse at once; snapshots are run for each analysis in a separate process as soon as it has been parsed")
+    parser.add_argument("-snapshot_workers", default = 1, type = int, dest = 'snapshot_workers', metavar = 'number of workers', help="Number of samples to snapshot at once, each with its own IGV and display")
+    parser.add_argument("-snapshot_engine", default = global_settings.snapshot_engine, choices = ['IGV', 'pileup'], type = str, dest = 'snapshot_engine', help="Make the snapshots with IGV, or draw them with the pileup renderer without Java or a display")
 
     args = parser.parse_args()
     analysis_IDs = args.analysis_IDs
     nosnap = args.nosnap
-    main(analysis_IDs, nosnap = nosnap)
+    main(analysis_IDs, nosnap = nosnap, threads = args.threads, force = args.force, hash_files = args.hash_files, snapshot_workers = args.snapshot_workers, snapshot_engine = args.snapshot_engine)
 
 if __name__ == "__main__":
     run()
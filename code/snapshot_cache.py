@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+Cache of rendered IGV snapshots
+
+Each snapshot is saved in the cache under a key made from everything that changes how it looks:
+the BAM files (path, size, and modification time of each), the locus, the panel height, the genome, and the renderer
+(the IGV jar, or the mock server). When the same snapshot is needed again, e.g. when an analysis is re-reported
+after a change upstream of the snapshots, the cached PNG is hard linked into the sample's snapshot dir
+and only the snapshots that are not in the cache are sent to IGV.
+
+usage:
+import snapshot_cache
+renderer = snapshot_cache.renderer_ID(igv_jar_bin = 'bin/IGV_2.3.81/igv.jar')
+miss_passes, pending = snapshot_cache.split_cached(bam_files, passes, outdir, genome = 'hg19', renderer = renderer)
+# ... make the snapshots in miss_passes ...
+snapshot_cache.store_snapshots(pending)
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import json
+import errno
+import shutil
+import hashlib
+import global_settings
+
+cache_version = 1
+
+
+def file_fingerprint(file_path):
+    '''
+    Return the absolute path, size, and modification time of a file, or None if there is no file
+    '''
+    if file_path is None or not os.path.isfile(file_path):
+        return(None)
+    stat = os.stat(file_path)
+    return([os.path.abspath(file_path), stat.st_size, stat.st_mtime])
+
+def renderer_ID(igv_jar_bin = None, mock = False):
+    '''
+    Return an identifier for the program making the snapshots; the IGV jar, or the mock IGV server
+    snapshots from a different IGV version, or from the mock server, are never mixed up with each other
+    '''
+    if mock == True:
+        return('mock')
+    if igv_jar_bin is None:
+        igv_jar_bin = global_settings.igv_bin
+    # e.g. IGV_2.3.81
+    return(':'.join(map(str, ['IGV', os.path.basename(os.path.dirname(os.path.abspath(igv_jar_bin)))] + (file_fingerprint(igv_jar_bin) or [igv_jar_bin])[1:])))
+
+def snapshot_key(bam_fingerprints, locus, image_height, genome, renderer):
+    '''
+    Return the cache key of a single snapshot
+    '''
+    key_items = [cache_version, bam_fingerprints, locus, str(image_height), genome, renderer]
+    return(hashlib.sha1(json.dumps(key_items, sort_keys = True).encode('utf-8')).hexdigest())
+
+def cache_file(key, cache_dir):
+    return(os.path.join(cache_dir, key[:2], key + '.png'))
+
+def link_file(source, destination):
+    '''
+    Hard link a file to a new path, replacing anything already at the path; copies the file if it cannot be linked,
+    e.g. when the cache is on a different filesystem
+    '''
+    if os.path.exists(destination):
+        if os.path.samefile(source, destination):
+            return
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+def split_cached(bam_files, passes, outdir, genome, renderer, cache_dir = None):
+    '''
+    Link the cached snapshots of the passes into the snapshot dir, and return the passes with only the snapshots that are not cached
+    passes : list of (regions, image height); regions are (chrom, start, stop, snapshot filename)
+    returns (miss_passes, pending); pending is a list of (snapshot file, cache file) for store_snapshots to add to the cache after they are made
+    '''
+    if cache_dir is None:
+        cache_dir = global_settings.IGV_snapshot_cache_dir
+    bam_fingerprints = [file_fingerprint(bam_file) for bam_file in bam_files]
+    miss_passes = []
+    pending = []
+    pending_keys = {}
+    hits = 0
+    for regions, image_height in passes:
+        misses = []
+        for chrom, start, stop, name in regions:
+            key = snapshot_key(bam_fingerprints, '{0}:{1}-{2}'.format(chrom, start, stop), image_height, genome, renderer)
+            cached_file = cache_file(key, cache_dir)
+            snapshot_file = os.path.join(outdir, name)
+            if os.path.isfile(cached_file):
+                link_file(cached_file, snapshot_file)
+                hits += 1
+            else:
+                # remove an old snapshot first; it may be a link to another cached snapshot, which IGV would write over
+                if os.path.lexists(snapshot_file):
+                    os.remove(snapshot_file)
+                misses.append((chrom, start, stop, name))
+                pending.append((snapshot_file, cached_file))
+                pending_keys.setdefault(snapshot_file, set()).add(cached_file)
+        if len(misses) > 0:
+            miss_passes.append((misses, image_height))
+    print('Snapshot cache: {0} cached, {1} to make'.format(hits, len(pending)))
+    # a snapshot file made for more than one locus or height only holds the last one; do not cache it
+    pending = [(snapshot_file, cached_file) for snapshot_file, cached_file in pending if len(pending_keys[snapshot_file]) == 1]
+    return((miss_passes, pending))
+
+def unlink_snapshots(passes, outdir):
+    '''
+    Remove the snapshots of the passes from the snapshot dir, so they are not linked to the cache
+    for when the snapshots are made some other way after split_cached, which would write over the cached files
+    '''
+    for regions, image_height in passes:
+        for chrom, start, stop, name in regions:
+            snapshot_file = os.path.join(outdir, name)
+            if os.path.lexists(snapshot_file):
+                os.remove(snapshot_file)
+
+def store_snapshots(pending):
+    '''
+    Add the snapshots that were made to the cache; snapshots that were not made are skipped
+    '''
+    stored = 0
+    for snapshot_file, cached_file in pending:
+        if not os.path.isfile(snapshot_file) or os.path.getsize(snapshot_file) < 1:
+            continue
+        cached_dir = os.path.dirname(cached_file)
+        try:
+            os.makedirs(cached_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # link under a temporary name, then rename, so a partly written file is never in the cache
+        temp_file = '{0}.{1}.tmp'.format(cached_file, os.getpid())
+        link_file(snapshot_file, temp_file)
+        os.rename(temp_file, cached_file)
+        stored += 1
+    return(stored)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+Run the IGV snapshots of many samples at once on a pool of workers
+
+Each worker has its own IGV server on its own Xvfb display; these are the servers started with
+code/IGV_daemon.py if any are running, otherwise each worker starts its own server and stops it when the pool is done.
+Sample jobs are passed to the workers through a bounded queue, so jobs are only prepared as fast as they are run.
+A job that fails or runs longer than the job timeout is retried on a restarted server.
+When the pool is done a summary of the jobs and the snapshots per minute is printed.
+
+usage:
+import snapshot_pool
+jobs = [{'name': 'sample1', 'sessions': [{'bam_files': [...], 'passes': [('regions.bed', '500'), ('regions_long.bed', '5000')], 'IGV_snapshots_dir': 'snapshots'}]}]
+results = snapshot_pool.run_snapshot_jobs(jobs, num_workers = 4)
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import pipeline_functions as pl
+import global_settings
+import IGV_daemon
+import snapshot_cache
+import bam_slicer
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# seconds a single sample job can run before it is stopped and retried
+default_job_timeout = 1800
+
+
+# ~~~~ WORKER SERVERS ~~~~~~ #
+def start_worker_server(worker, igv_jar_bin, igv_mem, mock = False):
+    '''
+    Get an IGV server for a worker; locks a running daemon server if there are any, otherwise starts a new server
+    returns True if the worker has a server
+    '''
+    if worker['use_daemon'] == True:
+        server, lock = IGV_daemon.acquire_server()
+        worker['server'] = server
+        worker['lock'] = lock
+        return(server is not None)
+    port = IGV_daemon.find_open_port()
+    log_file = os.path.join(worker['log_dir'], 'IGV_worker_{0}.log'.format(worker['ID']))
+    server = IGV_daemon.start_server(port, igv_jar_bin = igv_jar_bin, igv_mem = igv_mem, log_file = log_file, mock = mock)
+    if IGV_daemon.wait_for_server(server) == False:
+        print('ERROR: IGV server for worker {0} did not start, see log file: {1}'.format(worker['ID'], log_file))
+        IGV_daemon.stop_server(server)
+        worker['server'] = None
+        return(False)
+    worker['server'] = server
+    return(True)
+
+def stop_worker_server(worker):
+    '''
+    Release a worker's daemon server, or stop the server the worker started
+    '''
+    if worker['server'] is None:
+        return
+    if worker['use_daemon'] == True:
+        IGV_daemon.release_server(worker['lock'])
+    else:
+        IGV_daemon.stop_server(worker['server'])
+    worker['server'] = None
+
+def restart_worker_server(worker, igv_jar_bin, igv_mem, mock = False):
+    '''
+    Replace a worker's server after a failed job; the server may be stuck on the job
+    daemon servers are not restarted, since other scripts may be using them
+    '''
+    if worker['use_daemon'] == True:
+        return(worker['server'] is not None)
+    stop_worker_server(worker)
+    return(start_worker_server(worker, igv_jar_bin, igv_mem, mock = mock))
+
+
+# ~~~~ JOBS ~~~~~~ #
+def run_job(worker, job, genome, job_timeout):
+    '''
+    Run all the snapshots of a sample job on the worker's server
+    each session loads slices of its BAM files once, and makes the snapshots of all its passes that are not in the snapshot cache
+    returns the number of snapshots made or linked from the cache; raises socket.error if the server fails or the job times out
+    '''
+    deadline = time.time() + job_timeout
+    snapshots = 0
+    renderer = IGV_daemon.server_renderer(worker['server'])
+    connection = IGV_daemon.connect(worker['server']['port'])
+    try:
+        for session in job['sessions']:
+            passes = [(IGV_daemon.read_regions(region_file), image_height) for region_file, image_height in session['passes']]
+            pl.mkdir_p(session['IGV_snapshots_dir'])
+            snapshots += sum([len(regions) for regions, image_height in passes])
+            miss_passes, pending = snapshot_cache.split_cached(session['bam_files'], passes, session['IGV_snapshots_dir'], genome = genome, renderer = renderer)
+            if len(miss_passes) < 1:
+                continue
+            slice_files, scratch_dir = bam_slicer.slice_bams(session['bam_files'], miss_passes)
+            failed = []
+            try:
+                commands = IGV_daemon.session_commands(slice_files, miss_passes, session['IGV_snapshots_dir'], genome = genome)
+                errors = IGV_daemon.run_commands(connection, commands, deadline = deadline, failed = failed)
+            finally:
+                bam_slicer.remove_slices(scratch_dir)
+            failed_files = IGV_daemon.failed_snapshot_files(commands, failed, session['IGV_snapshots_dir'])
+            if errors > 0:
+                print('WARNING: {0} IGV commands failed for sample {1}'.format(errors, job['name']))
+                # remove the snapshots that may be wrong, so the job result shows they were not made
+                for snapshot_file in failed_files:
+                    if os.path.lexists(snapshot_file):
+                        os.remove(snapshot_file)
+            snapshot_cache.store_snapshots([(snapshot_file, cached_file) for snapshot_file, cached_file in pending if os.path.abspath(snapshot_file) not in failed_files])
+            snapshots -= len(failed_files)
+    finally:
+        IGV_daemon.close(connection)
+    return(snapshots)
+
+def worker_loop(worker, job_queue, results, genome, job_timeout, retries, igv_jar_bin, igv_mem, mock):
+    '''
+    Run jobs from the queue until the end of the queue is reached
+    '''
+    while True:
+        job = job_queue.get()
+        if job is None:
+            return
+        result = {'name': job['name'], 'worker': worker['ID'], 'status': 'failed', 'snapshots': 0, 'attempts': 0, 'time': 0.0, 'job': job}
+        start = time.time()
+        while result['attempts'] <= retries:
+            result['attempts'] += 1
+            if worker['server'] is None:
+                break
+            try:
+                result['snapshots'] = run_job(worker, job, genome, job_timeout)
+                result['status'] = 'done'
+                break
+            except Exception as e:
+                # any error fails just this job; the worker keeps taking jobs from the queue, so the queue never fills up
+                print('ERROR: Worker {0} job {1} failed on attempt {2}: {3}'.format(worker['ID'], job['name'], result['attempts'], repr(e)))
+                try:
+                    restart_worker_server(worker, igv_jar_bin, igv_mem, mock = mock)
+                except Exception as e:
+                    print('ERROR: Worker {0} could not restart its IGV server: {1}'.format(worker['ID'], repr(e)))
+                    worker['server'] = None
+        if worker['server'] is None and result['status'] != 'done':
+            # the worker has no server; leave the job to be run some other way
+            result['status'] = 'not run'
+        result['time'] = time.time() - start
+        with worker['results_lock']:
+            results.append(result)
+        print('Worker {0} {1} job {2}: {3} snapshots in {4:.1f}s'.format(worker['ID'], result['status'], job['name'], result['snapshots'], result['time']))
+
+
+# ~~~~ POOL ~~~~~~ #
+def print_pool_summary(results, elapsed, num_workers):
+    '''
+    Print the number of jobs and snapshots, and the snapshot rate of the pool
+    '''
+    done = [result for result in results if result['status'] == 'done']
+    failed = [result for result in results if result['status'] != 'done']
+    snapshots = sum([result['snapshots'] for result in done])
+    rate = 60.0 * snapshots / elapsed if elapsed > 0 else 0.0
+    print('\nSnapshot pool summary:')
+    print('workers: {0}'.format(num_workers))
+    print('jobs done: {0}, failed: {1}'.format(len(done), len(failed)))
+    print('snapshots: {0} in {1:.1f}s ({2:.1f} snapshots per minute)'.format(snapshots, elapsed, rate))
+    for worker_ID in sorted(set([result['worker'] for result in results])):
+        worker_results = [result for result in done if result['worker'] == worker_ID]
+        print('worker {0}: {1} jobs, {2} snapshots'.format(worker_ID, len(worker_results), sum([result['snapshots'] for result in worker_results])))
+    for result in failed:
+        print('{0} job {1} after {2} attempts'.format(result['status'], result['name'], result['attempts']))
+    print('')
+
+def run_snapshot_jobs(jobs, num_workers = 2, genome = 'hg19', job_timeout = default_job_timeout, retries = 1, queue_size = None, igv_jar_bin = None, igv_mem = "4000", mock = False):
+    '''
+    Run the sample snapshot jobs on a pool of workers
+    jobs : iterable of dicts with a 'name' and a list of 'sessions'; each session has the 'bam_files', the 'IGV_snapshots_dir',
+    and the 'passes' to snapshot, as a list of (regions file, image height)
+    retries : number of times to retry a failed job
+    queue_size : max number of jobs waiting for a worker; defaults to twice the number of workers
+    mock : start mock IGV servers instead of IGV
+    returns a list of dicts with the 'status' of each job; 'done', 'failed', or 'not run' if there was no IGV server to run it on
+    '''
+    if igv_jar_bin is None:
+        igv_jar_bin = global_settings.igv_bin
+    if queue_size is None:
+        queue_size = 2 * num_workers
+    use_daemon = IGV_daemon.daemon_running()
+    if use_daemon == True:
+        num_workers = min(num_workers, len(IGV_daemon.running_servers()))
+        print('Using {0} running IGV servers for snapshots'.format(num_workers))
+    log_dir = tempfile.mkdtemp(prefix = 'IGV_snapshot_pool_')
+    results_lock = threading.Lock()
+    results = []
+    job_queue = queue.Queue(maxsize = queue_size)
+    start = time.time()
+
+    # start the servers; each one gets its own display from the display pool
+    workers = []
+    for i in range(num_workers):
+        worker = {'ID': i + 1, 'use_daemon': use_daemon, 'server': None, 'lock': None, 'log_dir': log_dir, 'results_lock': results_lock}
+        if start_worker_server(worker, igv_jar_bin, igv_mem, mock = mock) == True:
+            workers.append(worker)
+    if len(workers) < 1:
+        print('ERROR: No IGV servers could be started for the snapshot pool')
+        results = [{'name': job['name'], 'worker': None, 'status': 'not run', 'snapshots': 0, 'attempts': 0, 'time': 0.0, 'job': job} for job in jobs]
+        return(results)
+    print('Started {0} snapshot workers'.format(len(workers)))
+
+    threads = []
+    for worker in workers:
+        thread = threading.Thread(target = worker_loop, args = (worker, job_queue, results, genome, job_timeout, retries, igv_jar_bin, igv_mem, mock))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    try:
+        for job in jobs:
+            job_queue.put(job)
+        for thread in threads:
+            job_queue.put(None)
+        for thread in threads:
+            thread.join()
+    finally:
+        for worker in workers:
+            stop_worker_server(worker)
+
+    print_pool_summary(results, time.time() - start, len(workers))
+    if all([result['status'] == 'done' for result in results]):
+        shutil.rmtree(log_dir, ignore_errors = True)
+    else:
+        print('IGV server logs are in: {0}'.format(log_dir))
+    return(results)
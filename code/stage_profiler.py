@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+USAGE: code/stage_profiler.py <analysis dirs or profile files> <args>
+DESCRIPTION: Per-stage timing and memory profiles for merge_vcf_annotations.py,
+and a summary of the slowest samples and stages across analyses
+
+merge_vcf_annotations.py -profile appends one JSON line per sample run to <barcode>_profile.jsonl next to the sample's tables;
+each line has the wall time, CPU time, peak RSS, and rows in and out of every stage of the run
+
+example:
+code/stage_profiler.py output/analysis1 output/analysis2 -n 10
+
+usage in a script:
+import stage_profiler
+profile = stage_profiler.new_profile(sample_fields)
+with stage_profiler.profile_stage(profile, 'load') as stage:
+    df = load_table()
+    stage['rows_out'] = len(df)
+stage_profiler.write_profile(profile, profile_file)
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import sys
+import os
+import json
+import time
+import argparse
+from contextlib import contextmanager
+
+profile_ext = "_profile.jsonl"
+
+
+# ~~~~ PROFILING ~~~~~~ #
+def cpu_time():
+    '''
+    Return the user + system CPU time of the current process in seconds
+    '''
+    times = os.times()
+    return(times[0] + times[1])
+
+def peak_rss_mb():
+    '''
+    Return the peak resident memory of the current process in MB
+    this is the high water mark of the whole process, so in a pool process it includes earlier samples
+    '''
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on Mac, kilobytes on Linux
+    if sys.platform == 'darwin':
+        return(round(peak / 1e6, 1))
+    return(round(peak / 1e3, 1))
+
+def new_profile(fields = None):
+    '''
+    Start a profile for a sample run
+    fields : dict of identifying fields to save with the profile; barcode, analysis ID, etc.
+    '''
+    profile = {
+    'start': time.time(),
+    'start_cpu': cpu_time(),
+    'pid': os.getpid(),
+    'stages': []
+    }
+    profile.update(fields or {})
+    return(profile)
+
+@contextmanager
+def profile_stage(profile, stage_name, rows_in = None):
+    '''
+    Time a stage of a run and add it to the profile
+    yields a dict for the stage; set its 'rows_out' in the block
+    a stage that is run more than once, e.g. once per chunk, is added up into a single entry
+    profile : the profile to add the stage to, or None to not profile
+    '''
+    stage = {'rows_in': rows_in, 'rows_out': None}
+    start = time.time()
+    start_cpu = cpu_time()
+    yield(stage)
+    if profile is None:
+        return
+    wall = time.time() - start
+    cpu = cpu_time() - start_cpu
+    for entry in profile['stages']:
+        if entry['stage'] == stage_name:
+            entry['wall'] += wall
+            entry['cpu'] += cpu
+            entry['calls'] += 1
+            entry['peak_rss_mb'] = peak_rss_mb()
+            for key in ['rows_in', 'rows_out']:
+                if stage[key] is not None:
+                    entry[key] = (entry[key] or 0) + stage[key]
+            return
+    profile['stages'].append({'stage': stage_name, 'wall': wall, 'cpu': cpu, 'calls': 1, 'peak_rss_mb': peak_rss_mb(), 'rows_in': stage['rows_in'], 'rows_out': stage['rows_out']})
+
+def finish_profile(profile):
+    '''
+    Add the totals for the run to the profile
+    '''
+    profile['wall'] = time.time() - profile['start']
+    profile['cpu'] = cpu_time() - profile.pop('start_cpu')
+    profile['peak_rss_mb'] = peak_rss_mb()
+    profile['date'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(profile.pop('start')))
+    return(profile)
+
+def write_profile(profile, profile_file):
+    '''
+    Append the profile of a run as a single JSON line to the profile file
+    '''
+    if 'wall' not in profile:
+        finish_profile(profile)
+    with open(profile_file, 'a') as f:
+        f.write(json.dumps(profile, sort_keys = True) + '\n')
+    return(profile_file)
+
+
+# ~~~~ AGGREGATION ~~~~~~ #
+def find_profile_files(paths):
+    '''
+    Find the profile files in a list of analysis dirs and files
+    '''
+    profile_files = []
+    for path in paths:
+        if os.path.isfile(path):
+            profile_files.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            for file in files:
+                if file.endswith(profile_ext):
+                    profile_files.append(os.path.join(root, file))
+    return(sorted(profile_files))
+
+def load_profiles(profile_files, latest = True):
+    '''
+    Load the profiles from the profile files
+    latest : only load the last run in each file
+    '''
+    profiles = []
+    for profile_file in profile_files:
+        with open(profile_file, 'r') as f:
+            lines = [line for line in f if line.strip()]
+        if latest == True:
+            lines = lines[-1:]
+        for line in lines:
+            profile = json.loads(line)
+            profile['profile_file'] = profile_file
+            profiles.append(profile)
+    return(profiles)
+
+def sample_label(profile):
+    return('{0} {1}'.format(profile.get('Analysis ID', ''), profile.get('Barcode', os.path.basename(profile['profile_file']))).strip())
+
+def rank_samples(profiles):
+    '''
+    Return the profiles sorted from slowest to fastest run
+    '''
+    return(sorted(profiles, key = lambda profile: profile['wall'], reverse = True))
+
+def rank_stages(profiles):
+    '''
+    Return a list of dicts with the total and mean time of each stage across the profiles, slowest stage first
+    '''
+    stages = {}
+    for profile in profiles:
+        for entry in profile['stages']:
+            stage = stages.setdefault(entry['stage'], {'stage': entry['stage'], 'wall': 0.0, 'cpu': 0.0, 'samples': 0, 'peak_rss_mb': 0.0, 'slowest_sample': None, 'slowest_wall': 0.0})
+            stage['wall'] += entry['wall']
+            stage['cpu'] += entry['cpu']
+            stage['samples'] += 1
+            stage['peak_rss_mb'] = max(stage['peak_rss_mb'], entry['peak_rss_mb'])
+            if entry['wall'] >= stage['slowest_wall']:
+                stage['slowest_wall'] = entry['wall']
+                stage['slowest_sample'] = sample_label(profile)
+    for stage in stages.values():
+        stage['mean_wall'] = stage['wall'] / stage['samples']
+    return(sorted(stages.values(), key = lambda stage: stage['wall'], reverse = True))
+
+def print_summary(profiles, num_samples = 10):
+    '''
+    Print the slowest samples and the time spent in each stage
+    '''
+    total_wall = sum([profile['wall'] for profile in profiles])
+    print("Profiles: {0} sample runs, {1:.2f}s total\n".format(len(profiles), total_wall))
+
+    print("Slowest samples:")
+    print("{0:<40} {1:>9} {2:>9} {3:>12} {4:<20}".format('sample', 'wall (s)', 'cpu (s)', 'peak RSS MB', 'slowest stage'))
+    for profile in rank_samples(profiles)[:num_samples]:
+        slowest_stage = max(profile['stages'], key = lambda entry: entry['wall'])['stage'] if len(profile['stages']) > 0 else ''
+        print("{0:<40} {1:>9.3f} {2:>9.3f} {3:>12.1f} {4:<20}".format(sample_label(profile), profile['wall'], profile['cpu'], profile['peak_rss_mb'], slowest_stage))
+
+    print("\nStages:")
+    print("{0:<20} {1:>9} {2:>7} {3:>9} {4:>9} {5:>12} {6:<40}".format('stage', 'wall (s)', '% wall', 'mean (s)', 'cpu (s)', 'peak RSS MB', 'slowest sample'))
+    for stage in rank_stages(profiles):
+        percent = 100.0 * stage['wall'] / total_wall if total_wall > 0 else 0.0
+        print("{0:<20} {1:>9.3f} {2:>7.1f} {3:>9.3f} {4:>9.3f} {5:>12.1f} {6:<40}".format(stage['stage'], stage['wall'], percent, stage['mean_wall'], stage['cpu'], stage['peak_rss_mb'], stage['slowest_sample']))
+
+def run():
+    '''
+    Parse script args to run the script
+    '''
+    # ~~~~ GET SCRIPT ARGS ~~~~~~ #
+    parser = argparse.ArgumentParser(description='Rank the slowest samples and stages from merge_vcf_annotations.py profiles')
+    # required positional args
+    parser.add_argument("paths", nargs = "+", help="Analysis dirs to search for profile files, or paths to profile files")
+    # optional args
+    parser.add_argument("-n", default = 10, type = int, dest = 'num_samples', metavar = 'number of samples', help="Number of slowest samples to print")
+    parser.add_argument("-all_runs", default = False, action='store_true', dest = 'all_runs', help="Use every run in each profile file instead of only the latest")
+
+    args = parser.parse_args()
+
+    profile_files = find_profile_files(args.paths)
+    if len(profile_files) < 1:
+        print("ERROR: No profile files found")
+        sys.exit(1)
+    print_summary(load_profiles(profile_files, latest = not args.all_runs), num_samples = args.num_samples)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+Column schemas for the tables read by the pipeline
+
+Each schema lists the columns of a table, the dtypes to parse them with,
+the columns to store as categoricals after loading, and the tokens to treat as NA.
+Each schema also lists the columns needed by each stage of the pipeline,
+so that readers only load what they use.
+
+Integer columns that may contain NA values (e.g. 'Coverage') are left to pandas to parse,
+since they can not be stored as integers once an NA is present.
+
+usage:
+import table_schemas
+summary_df = table_schemas.read_schema_table(summary_file, 'summary', stage = 'IGV_snapshots')
+'''
+import pipeline_functions as pl
+import global_settings
+
+# ~~~~ ANNOVAR COLUMNS ~~~~~~ #
+# columns added by each gene-based ANNOVAR database, e.g. refGene -> Func.refGene, Gene.refGene, ...
+annovar_gene_columns = ["Func", "Gene", "GeneDetail", "ExonicFunc", "AAChange"]
+# gene-based columns with few distinct values
+annovar_categorical_columns = ["Func", "Gene", "ExonicFunc"]
+# filter-based databases of allele frequencies; their columns are numeric
+annovar_frequency_databases = ('1000g', 'esp', 'exac', 'gnomad')
+
+def annovar_protocol_databases(annovar_protocol):
+    '''
+    Return the list of (database, operation) from the table_annovar.pl '-protocol' and '-operation' args
+    '''
+    args = annovar_protocol.split()
+    databases = args[args.index('-protocol') + 1].split(',')
+    operations = args[args.index('-operation') + 1].split(',')
+    return(zip(databases, operations))
+
+def annovar_schema_columns(annovar_protocol):
+    '''
+    Return the (columns, dtype, categorical) of a table_annovar.pl output table for an ANNOVAR protocol
+    '''
+    columns = ["Chr", "Start", "End", "Ref", "Alt"]
+    dtype = {"Chr": str, "Ref": str, "Alt": str}
+    categorical = []
+    for database, operation in annovar_protocol_databases(annovar_protocol):
+        if operation == 'g':
+            for prefix in annovar_gene_columns:
+                colname = '{0}.{1}'.format(prefix, database)
+                columns.append(colname)
+                dtype[colname] = str
+                if prefix in annovar_categorical_columns:
+                    categorical.append(colname)
+        else:
+            # region and filter based databases add a single column named after the database
+            columns.append(database)
+            dtype[database] = float if database.startswith(annovar_frequency_databases) else str
+    return((columns, dtype, categorical))
+
+
+# ~~~~ SCHEMAS ~~~~~~ #
+# bcftools query output; IonXpress_001_query.tsv
+# columns are set in annotate_vcfs.sh
+query_schema = {
+'columns': ["Chrom", "Position", "Ref", "Variant", "Quality", "Frequency", "Coverage", "Allele Coverage", "Strand Bias"],
+'dtype': {"Chrom": str, "Ref": str, "Variant": str, "Quality": float, "Frequency": float, "Strand Bias": float},
+'categorical': [],
+'na_values': ['.'],
+'stages': {}
+}
+
+# ANNOVAR table_annovar.pl output; IonXpress_001.hg19_multianno.txt
+# columns depend on the 'annovar_protocol' in global_settings
+annotation_columns, annotation_dtype, annotation_categorical = annovar_schema_columns(global_settings.annovar_protocol)
+annotation_schema = {
+'columns': annotation_columns,
+'dtype': annotation_dtype,
+'categorical': annotation_categorical,
+'na_values': ['.'],
+'stages': {}
+}
+
+# merge_vcf_annotations.py joins the tables on the variant, splits AAChange.refGene into the transcript columns,
+# and keeps every other query and annotation column in the full table;
+# any other columns in the files, e.g. ANNOVAR -otherinfo columns, are not loaded
+query_schema['stages']['merge'] = list(query_schema['columns'])
+annotation_schema['stages']['merge'] = list(annotation_schema['columns'])
+
+# sample barcode index for an analysis; sample_barcode_IDs.tsv
+barcodes_schema = {
+'columns': ["Sample Name", "Barcode", "Run Name"],
+'dtype': {"Sample Name": str, "Barcode": str, "Run Name": str},
+'categorical': [],
+'na_values': ['.'],
+'stages': {
+    'merge': ["Sample Name", "Barcode", "Run Name"]
+    }
+}
+
+# variant summary table made by merge_vcf_annotations.py; IonXpress_001_summary.tsv
+summary_schema = {
+'columns': ["Chrom", "Position", "Ref", "Variant", "Gene", "Quality", "Coverage", "Allele Coverage", "Strand Bias", "Coding", "Amino Acid Change", "Transcript", "Frequency", "Sample Name", "Barcode", "Run Name", "Review", "Analysis ID", "Date"],
+'dtype': {"Chrom": str, "Ref": str, "Variant": str, "Gene": str, "Quality": float, "Strand Bias": float, "Coding": str, "Amino Acid Change": str, "Transcript": str, "Frequency": float, "Sample Name": str, "Barcode": str, "Run Name": str, "Review": str, "Analysis ID": str, "Date": str},
+'categorical': ["Gene", "Transcript", "Review", "Sample Name", "Barcode", "Run Name", "Analysis ID", "Date"],
+'na_values': [],
+'stages': {
+    'IGV_snapshots': ["Chrom", "Position", "Gene", "Coding", "Frequency", "Barcode", "Analysis ID"],
+    'long_snapshots': ["Frequency"],
+    'report_comments': ["Gene"]
+    }
+}
+
+schemas = {
+'query': query_schema,
+'annotation': annotation_schema,
+'barcodes': barcodes_schema,
+'summary': summary_schema
+}
+
+# tables written by the pipeline that may have a columnar copy; see pl.write_columnar_table
+pipeline_output_schemas = ['summary']
+
+# Summary Table Fields:
+summary_cols = summary_schema['columns']
+
+
+# ~~~~ READERS ~~~~~~ #
+def read_header(table_file, sep = '\t'):
+    '''
+    Return the list of column names in the header line of a table file
+    '''
+    with open(table_file, 'r') as f:
+        return(f.readline().rstrip('\r\n').split(sep))
+
+def stage_columns(schema_name, stage = None):
+    '''
+    Return the list of columns needed by a stage, or None for all columns
+    '''
+    if stage is None:
+        return(None)
+    return(schemas[schema_name]['stages'][stage])
+
+def apply_categoricals(dataframe, schema_name):
+    '''
+    Convert the low cardinality columns of a loaded table to categoricals
+    '''
+    for colname in schemas[schema_name]['categorical']:
+        if colname in dataframe.columns and str(dataframe[colname].dtype) != 'category':
+            dataframe[colname] = dataframe[colname].astype('category')
+    return(dataframe)
+
+def read_schema_table(table_file, schema_name, stage = None, chunksize = None, nrows = None):
+    '''
+    Load a table with the dtypes, categoricals, and NA tokens from its schema
+    stage : name of the pipeline stage reading the table; only the columns it needs are loaded
+    chunksize : return an iterator of chunks of this many rows instead of a single dataframe
+    nrows : only load this many rows; 0 loads just the columns
+    '''
+    import pandas as pd
+    schema = schemas[schema_name]
+    usecols = stage_columns(schema_name, stage)
+
+    # pipeline output tables may have a typed columnar copy that is faster to load
+    if schema_name in pipeline_output_schemas and chunksize is None and nrows is None and pl.find_columnar_table(table_file) is not None:
+        return(apply_categoricals(pl.read_pipeline_table(table_file, usecols = usecols), schema_name))
+
+    # only pass dtypes for the columns that are present in this table, and only load the stage's columns that are present
+    header = read_header(table_file)
+    if usecols is not None:
+        usecols = [colname for colname in usecols if colname in header]
+    dtype = dict((key, value) for key, value in schema['dtype'].items() if key in header and (usecols is None or key in usecols))
+    reader = pd.read_table(table_file, sep = '\t', header = 0, na_values = schema['na_values'], dtype = dtype, usecols = usecols, chunksize = chunksize, nrows = nrows)
+    if chunksize is not None:
+        return((apply_categoricals(chunk, schema_name) for chunk in reader))
+    return(apply_categoricals(reader, schema_name))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+USAGE: code/table_views.py <view> <views manifests> <args>
+DESCRIPTION: Write the summary or filtered table of samples from the views manifests saved by merge_vcf_annotations.py
+The rows and columns of the view are taken directly from each sample's full table
+
+example:
+# print the filtered tables of every sample in an analysis, with a single header line
+code/table_views.py filtered $(find output/analysis -path "*variantCaller_out*" -name "*_views.json") > analysis_filtered.tsv
+
+# write the summary table of each sample next to its full table; IonXpress_001_summary.tsv
+code/table_views.py summary $(find output/analysis -path "*variantCaller_out*" -name "*_views.json") -write
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import sys
+import os
+import argparse
+import pipeline_functions as pl
+
+
+def print_views(view_name, manifest_files):
+    '''
+    Print the view of every sample to stdout; the header is printed from the first sample only
+    '''
+    for i, manifest_file in enumerate(manifest_files):
+        for line in pl.iter_table_view_lines(manifest_file, view_name, header = (i == 0)):
+            sys.stdout.write(line)
+
+def write_views(view_name, manifest_files):
+    '''
+    Write the view of every sample to the table file listed in its manifest
+    '''
+    for manifest_file in manifest_files:
+        print(pl.materialize_table_view(manifest_file, view_name))
+
+def run():
+    '''
+    Parse script args to run the script
+    '''
+    # ~~~~ GET SCRIPT ARGS ~~~~~~ #
+    parser = argparse.ArgumentParser(description='Write the summary or filtered tables from views manifests')
+    # required positional args
+    parser.add_argument("view_name", choices = ['summary', 'filtered'], help="The view to write")
+    parser.add_argument("manifest_files", nargs = "+", help="Paths to the _views.json manifests")
+    # optional args
+    parser.add_argument("-write", default = False, action='store_true', dest = 'write', help="Write each view to the table file listed in its manifest instead of printing all of them to stdout")
+
+    args = parser.parse_args()
+
+    if args.write == True:
+        write_views(args.view_name, args.manifest_files)
+    else:
+        print_views(args.view_name, args.manifest_files)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# python 2.7
+
+'''
+USAGE: code/test_pipeline_functions.py
+DESCRIPTION: Tests for the table processing functions in pipeline_functions.py
+
+The filter plan and the column split functions are checked against their previous implementations
+from benchmark_tables.py, and the streaming merge is checked against a pd.merge of the whole tables.
+
+example:
+code/test_pipeline_functions.py
+python -m unittest discover -s code -p 'test_*.py'
+'''
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import unittest
+import numpy as np
+import pandas as pd
+import pipeline_functions as pl
+import benchmark_tables
+
+# the filter criteria used by the pipeline, in the repo root
+filter_criteria_json_file = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'filter_criteria.json')
+
+
+def make_variant_table(chroms, num_rows, seed = 0, prefix = 'value'):
+    '''
+    Make a table sorted in the order of chroms, with some rows sharing a position
+    '''
+    random_state = np.random.RandomState(seed)
+    chrom_rows = random_state.randint(0, len(chroms), num_rows)
+    positions = random_state.randint(1, num_rows // 2 + 2, num_rows)
+    variant_df = pd.DataFrame({'Chrom': np.array(chroms, dtype = object)[chrom_rows], 'Position': positions, 'rank': chrom_rows})
+    variant_df = variant_df.sort_values(['rank', 'Position']).reset_index(drop = True)
+    variant_df[prefix] = ['{0}{1}'.format(prefix, i) for i in range(num_rows)]
+    del variant_df['rank']
+    return(variant_df)
+
+def iter_chunks(dataframe, chunksize):
+    '''
+    Yield the rows of a dataframe in chunks, like pd.read_table(..., chunksize = chunksize)
+    '''
+    for start in range(0, max(len(dataframe), 1), chunksize):
+        yield(dataframe.iloc[start:start + chunksize])
+
+def sort_rows(dataframe):
+    '''
+    Sort the rows on every column, so tables with the same rows in a different order can be compared
+    '''
+    return(dataframe.sort_values(list(dataframe.columns)).reset_index(drop = True))
+
+
+class TestTableMultiFilter(unittest.TestCase):
+    def setUp(self):
+        self.merged_df = benchmark_tables.make_merged_table(5000, seed = 1)
+
+    def assert_same_as_legacy(self, filter_criteria):
+        filtered_df = pl.table_multi_filter(self.merged_df, filter_criteria)
+        legacy_df = benchmark_tables.legacy_table_multi_filter(self.merged_df, filter_criteria)
+        pd.util.testing.assert_frame_equal(filtered_df, legacy_df)
+        return(filtered_df)
+
+    def test_repo_filter_criteria(self):
+        filtered_df = self.assert_same_as_legacy(pl.load_json(filter_criteria_json_file))
+        self.assertTrue(0 < len(filtered_df) < len(self.merged_df))
+
+    def test_all_criteria_types(self):
+        self.assert_same_as_legacy({
+        'include': {'Func.refGene': ['exonic', 'splicing']},
+        'exclude': {'ExonicFunc.refGene': ['synonymous SNV', 'unknown']},
+        'greater_than': {'Quality': 500, 'Coverage': 100},
+        'less_than': {'Strand Bias': 0.9},
+        'less_or_null': {'1000g2015aug_all': 0.02}
+        })
+
+    def test_missing_criteria_types(self):
+        self.assert_same_as_legacy({'greater_than': {'Frequency': 0.5}})
+
+    def test_include_values_are_any_of(self):
+        filter_criteria = {'include': {'Func.refGene': ['exonic', 'splicing']}}
+        filtered_df = pl.table_multi_filter(self.merged_df, filter_criteria)
+        conjunction_df = self.merged_df[pl.conjunction(self.merged_df['Func.refGene'].isin(['exonic', 'splicing']))]
+        pd.util.testing.assert_frame_equal(filtered_df, conjunction_df)
+
+    def test_single_include_value_matches_conjunction(self):
+        # with one value per column the membership test is the same as the original == test
+        filter_criteria = {'include': {'Func.refGene': ['exonic']}, 'exclude': {'ExonicFunc.refGene': ['synonymous SNV']}}
+        filtered_df = pl.table_multi_filter(self.merged_df, filter_criteria)
+        conjunction_df = self.merged_df[pl.conjunction(self.merged_df['Func.refGene'] == 'exonic', self.merged_df['ExonicFunc.refGene'] != 'synonymous SNV')]
+        pd.util.testing.assert_frame_equal(filtered_df, conjunction_df)
+
+    def test_filter_plan_rows(self):
+        filter_plan = pl.compile_filter_criteria({'greater_than': {'Quality': 1000}, 'less_or_null': {'1000g2015aug_all': 0.01}})
+        rows = pl.filter_plan_rows(self.merged_df, filter_plan)
+        expected_rows = np.flatnonzero(((self.merged_df['Quality'] > 1000) & ((self.merged_df['1000g2015aug_all'] < 0.01) | self.merged_df['1000g2015aug_all'].isnull())).values)
+        self.assertEqual(rows.tolist(), expected_rows.tolist())
+
+    def test_filter_plan_cached(self):
+        filter_criteria = pl.load_json(filter_criteria_json_file)
+        self.assertIs(pl.compile_filter_criteria(filter_criteria), pl.compile_filter_criteria(pl.load_json(filter_criteria_json_file)))
+
+    def test_empty_table(self):
+        filtered_df = pl.table_multi_filter(self.merged_df.iloc[:0], pl.load_json(filter_criteria_json_file))
+        self.assertEqual(len(filtered_df), 0)
+        self.assertEqual(list(filtered_df.columns), list(self.merged_df.columns))
+
+
+class TestSplitDfCol2Rows(unittest.TestCase):
+    def test_same_as_legacy(self):
+        annotation_df = benchmark_tables.make_annotation_table(500, seed = 2)
+        split_df = pl.split_df_col2rows(annotation_df.copy(), 'AAChange.refGene', ',', 'AAChange')
+        legacy_df = benchmark_tables.legacy_split_df_col2rows(annotation_df.copy(), 'AAChange.refGene', ',', 'AAChange')
+        pd.util.testing.assert_frame_equal(split_df, legacy_df)
+
+    def test_empty_values_and_missing_values(self):
+        annotation_df = pd.DataFrame({'Position': [1, 2, 3, 4], 'AAChange.refGene': ['a,b', np.nan, '', 'c,,d']})
+        split_df = pl.split_df_col2rows(annotation_df.copy(), 'AAChange.refGene', ',', 'AAChange')
+        legacy_df = benchmark_tables.legacy_split_df_col2rows(annotation_df.copy(), 'AAChange.refGene', ',', 'AAChange')
+        pd.util.testing.assert_frame_equal(split_df, legacy_df)
+        self.assertEqual(split_df['Position'].tolist(), [1, 1, 2, 3, 4, 4, 4])
+
+    def test_non_object_column_is_renamed(self):
+        annotation_df = pd.DataFrame({'Position': [1, 2], 'AAChange.refGene': [1.0, 2.0]})
+        split_df = pl.split_df_col2rows(annotation_df, 'AAChange.refGene', ',', 'AAChange')
+        self.assertEqual(split_df['AAChange'].tolist(), [1.0, 2.0])
+        self.assertNotIn('AAChange.refGene', split_df.columns)
+
+
+class TestSplitDfCol2Cols(unittest.TestCase):
+    colnames = ['Gene.AA', 'Transcript', 'Exon', 'Coding', 'Amino Acid Change']
+
+    def setUp(self):
+        annotation_df = benchmark_tables.make_annotation_table(300, seed = 3)
+        self.split_df = pl.split_df_col2rows(annotation_df, 'AAChange.refGene', ',', 'AAChange')
+
+    def test_same_as_legacy(self):
+        split_df = pl.split_df_col2cols(self.split_df.copy(), 'AAChange', ':', self.colnames, delete_old = True)
+        legacy_df = benchmark_tables.legacy_split_df_col2cols(self.split_df.copy(), 'AAChange', ':', self.colnames, delete_old = True)
+        pd.util.testing.assert_frame_equal(split_df, legacy_df)
+
+    def test_fewer_parts_are_filled_with_nan(self):
+        dataframe = pd.DataFrame({'AAChange': ['A:NM_1:exon1:c.1G>A:p.G1D', 'B:NM_2', np.nan]})
+        split_df = pl.split_df_col2cols(dataframe.copy(), 'AAChange', ':', self.colnames)
+        legacy_df = benchmark_tables.legacy_split_df_col2cols(dataframe.copy(), 'AAChange', ':', self.colnames)
+        pd.util.testing.assert_frame_equal(split_df, legacy_df)
+        self.assertTrue(split_df.loc[1, ['Exon', 'Coding', 'Amino Acid Change']].isnull().all())
+
+    def test_all_missing_values(self):
+        dataframe = pd.DataFrame({'AAChange': [np.nan, np.nan]})
+        split_df = pl.split_df_col2cols(dataframe, 'AAChange', ':', self.colnames, delete_old = True)
+        self.assertEqual(list(split_df.columns), self.colnames)
+        self.assertTrue(split_df.isnull().all().all())
+
+    def test_extra_parts_raise_error(self):
+        dataframe = pd.DataFrame({'AAChange': ['A:NM_1:exon1:c.1G>A:p.G1D', 'A:NM_1:exon1:c.1G>A:p.G1D:extra']})
+        with self.assertRaises(ValueError):
+            pl.split_df_col2cols(dataframe.copy(), 'AAChange', ':', self.colnames)
+        with self.assertRaises(ValueError):
+            benchmark_tables.legacy_split_df_col2cols(dataframe.copy(), 'AAChange', ':', self.colnames)
+
+    def test_categorical_cols(self):
+        split_df = pl.split_df_col2cols(self.split_df.copy(), 'AAChange', ':', self.colnames, categorical_cols = ['Gene.AA', 'Exon'])
+        object_df = pl.split_df_col2cols(self.split_df.copy(), 'AAChange', ':', self.colnames)
+        self.assertEqual(str(split_df['Gene.AA'].dtype), 'category')
+        pd.util.testing.assert_series_equal(split_df['Exon'].astype(object), object_df['Exon'])
+
+
+class TestIterSortedMerge(unittest.TestCase):
+    # a VCF contig order that is not karyotypic or lexical
+    chrom_order = ['chr2', 'chr10', 'chr1', 'chrX']
+
+    def setUp(self):
+        self.left_df = make_variant_table(self.chrom_order, 400, seed = 4, prefix = 'left')
+        self.right_df = make_variant_table(self.chrom_order, 300, seed = 5, prefix = 'right')
+
+    def stream_merge(self, left_df, right_df, chunksize, chrom_order = None):
+        merged_blocks = pl.iter_sorted_merge(iter_chunks(left_df, chunksize), iter_chunks(right_df, chunksize), on = ['Chrom', 'Position'], chrom_order = chrom_order)
+        return(list(merged_blocks))
+
+    def test_same_rows_as_merge(self):
+        expected_df = sort_rows(pd.merge(self.left_df, self.right_df, on = ['Chrom', 'Position']))
+        self.assertTrue(len(expected_df) > 0)
+        for chunksize in [1, 3, 7, 50, 1000]:
+            for chrom_order in [None, self.chrom_order]:
+                merged_df = pd.concat(self.stream_merge(self.left_df, self.right_df, chunksize, chrom_order = chrom_order))
+                pd.util.testing.assert_frame_equal(sort_rows(merged_df), expected_df)
+
+    def test_blocks_in_table_order(self):
+        merged_df = pd.concat(self.stream_merge(self.left_df, self.right_df, 7))
+        chrom_ranks = dict((chrom, i) for i, chrom in enumerate(self.chrom_order))
+        keys = pl.genomic_order_keys(merged_df, chrom_ranks)
+        self.assertTrue(np.all(np.diff(keys) >= 0))
+
+    def test_chrom_order_with_chromosome_missing_from_a_table(self):
+        # chrM is only in the right table, and sorts before the chromosomes the left table starts with
+        chrom_order = ['chrM'] + self.chrom_order
+        right_df = pd.concat([pd.DataFrame({'Chrom': ['chrM', 'chrM'], 'Position': [1, 2], 'right': ['M1', 'M2']}), self.right_df]).reset_index(drop = True)
+        expected_df = sort_rows(pd.merge(self.left_df, right_df, on = ['Chrom', 'Position']))
+        merged_df = pd.concat(self.stream_merge(self.left_df, right_df, 5, chrom_order = chrom_order))
+        pd.util.testing.assert_frame_equal(sort_rows(merged_df), expected_df)
+
+    def test_unsorted_table_raises_error(self):
+        unsorted_df = self.left_df.iloc[::-1].reset_index(drop = True)
+        with self.assertRaises(ValueError):
+            self.stream_merge(unsorted_df, self.right_df, 10)
+
+    def test_no_matches_yields_merged_columns(self):
+        merge_columns = list(pd.merge(self.left_df, self.right_df, on = ['Chrom', 'Position']).columns)
+        right_df = self.right_df.copy()
+        right_df['Position'] = right_df['Position'] + 100000
+        merged_blocks = self.stream_merge(self.left_df, right_df, 10)
+        self.assertTrue(len(merged_blocks) > 0)
+        self.assertEqual(sum([len(merge_df) for merge_df in merged_blocks]), 0)
+        self.assertEqual(list(merged_blocks[0].columns), merge_columns)
+        # an empty table gives a single empty block, with the same column order as a merge with rows
+        merged_blocks = self.stream_merge(self.left_df, self.right_df.iloc[:0], 10)
+        self.assertEqual(len(merged_blocks), 1)
+        self.assertEqual(len(merged_blocks[0]), 0)
+        self.assertEqual(list(merged_blocks[0].columns), merge_columns)
+
+
+if __name__ == "__main__":
+    unittest.main()
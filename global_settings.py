@@ -11,6 +11,9 @@ import os
 # path to output directory
 outdir="output"
 
+# persistent index of the files in the output directory; see code/output_index.py
+output_index_file="data/output_index.sqlite"
+
 # path to code dir
 codedir="code"
 
@@ -36,6 +39,9 @@ transcr_file="ref/hg19/canonical_transcript_list.txt"
 # genes in the panel
 panel_genes_file="data/panel_genes.txt"
 
+# binary bundle of the canonical transcript, panel gene, and actionable gene lists; made by ref/cannonical_transcript_table.py
+reference_bundle_file="ref/hg19/reference_lists.pickle"
+
 # file with server login information
 server_info_file="data/server_info.txt"
 
@@ -50,6 +56,21 @@ SC_control_sample_IDs_file="data/SC_control_sample_IDs.txt"
 
 igv_bin="bin/IGV_2.3.81/igv.jar"
 
+# engine for the sample snapshots; "IGV", or "pileup" to draw them without Java or a display, see code/pileup_renderer.py
+snapshot_engine="IGV"
+
+# used to slice the BAMs to the variant windows before they are loaded into IGV; see code/bam_slicer.py
+samtools_bin="bin/samtools"
+
+# IGV servers kept running for snapshots; see code/IGV_daemon.py
+IGV_daemon_file="data/IGV_daemon.json"
+
+# variants within this many bases of each other share a single snapshot; see coalesce_regions in code/run_IGV_snapshot_automator.py
+IGV_snapshot_coalesce_distance=10
+
+# rendered IGV snapshots, reused when the BAMs, locus, and panel height have not changed; see code/snapshot_cache.py
+IGV_snapshot_cache_dir="data/IGV_snapshot_cache"
+
 # git branches allowed to run the pipeline on
 allowed_git_branches = ['production']
 
@@ -60,6 +81,8 @@ allowed_output_dirs = ['/ifs/data/molecpathlab/IonTorrent_reporter/output']
 # ANNOVAR version:
 # Version: $Date: 2015-06-17 21:43:53 -0700 (Wed, 17 Jun 2015) $
 build_version="hg19"
+# ANNOVAR databases and operations; keep in sync with global_settings.sh
+annovar_protocol="-protocol refGene,cosmic68,clinvar_20150629,1000g2015aug_all -operation g,f,f,f"
 
 
 # ~~~~~~ REMOTE IONTORRENT SERVER LOCATION NAMES AND PATTERNS ~~~~~~ #
@@ -110,6 +133,8 @@ summary_table_ext="_summary.tsv"
 filtered_table_ext="_filtered.tsv"
 # full table with all variants and all fields
 full_table_ext="_full_table.tsv"
+# manifest of the summary and filtered table rows & columns within the full table
+table_views_ext="_views.json"
 
 # summary table with version control information
 summary_version_ext="_summary_version.tsv"
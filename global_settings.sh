@@ -7,6 +7,9 @@ umask 007 # permissions for all files; group + user all rw, no outside user acce
 # path to output directory
 outdir="output"
 
+# persistent index of the files in the output directory; see code/output_index.py
+output_index_file="data/output_index.sqlite"
+
 # path to code dir
 codedir="code"
 
@@ -30,6 +33,9 @@ transcr_file="ref/hg19/canonical_transcript_list.txt"
 # genes in the panel
 panel_genes_file="data/panel_genes.txt"
 
+# binary bundle of the canonical transcript, panel gene, and actionable gene lists; made by ref/cannonical_transcript_table.py
+reference_bundle_file="ref/hg19/reference_lists.pickle"
+
 # file with server login information
 server_info_file="data/server_info.txt"
 
@@ -118,6 +124,8 @@ summary_table_ext="_summary.tsv"
 filtered_table_ext="_filtered.tsv"
 # full table with all variants and all fields
 full_table_ext="_full_table.tsv"
+# manifest of the summary and filtered table rows & columns within the full table
+table_views_ext="_views.json"
 
 # summary table with version control information
 summary_version_ext="_summary_version.tsv"
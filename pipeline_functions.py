@@ -223,21 +223,32 @@ def split_df_col2rows(dataframe, split_col, split_char, new_colname):
     # split_char : chr to split the col on
     # new_colname : new name for the
     # ~~~~~~~~~~~~~~~~ #
+    # all the split values are produced by a single split of the joined column text,
+    # then each row is repeated once per value it contained using an offset array
+    # non-string entries (NaN) are kept as a single row with a NaN value
+    import re
     import pandas as pd
     import numpy as np
 
     # make sure that the split_col is an 'object' type so we can split it
-    if split_col in dataframe.select_dtypes([np.object]).columns:
-        # save the split column as a separate object
-        tmp_col = dataframe[split_col].str.split(split_char).apply(pd.Series, 1).stack()
-        # drop the last index level
-        tmp_col.index = tmp_col.index.droplevel(-1)
-        # set the new col name
-        tmp_col.name = new_colname
+    if split_col in dataframe.select_dtypes([np.object_]).columns:
+        split_values = dataframe[split_col]
+        # number of values in each row; NaN for entries that are not strings
+        num_values = split_values.str.count(re.escape(split_char)) + 1
+        is_string = num_values.notnull().values
+        num_values = num_values.fillna(1).values.astype(np.int64)
+        # split every string entry at once
+        string_values = split_values.values[is_string].tolist()
+        tokens = split_char.join(string_values).split(split_char) if len(string_values) > 0 else []
+        # fill in the new column, one entry per value
+        new_col = np.empty(num_values.sum(), dtype = np.object_)
+        new_col[:] = np.nan
+        new_col[np.repeat(is_string, num_values)] = tokens
         # remove the original column from the df
         del dataframe[split_col]
-        # join them into a new df
-        dataframe = dataframe.join(tmp_col)
+        # repeat each row once per value
+        dataframe = dataframe.iloc[np.repeat(np.arange(len(dataframe)), num_values)].reset_index(drop=True)
+        dataframe[new_colname] = new_col
     else:
         print """
 WARNING: Trying to split column {} in dataframe, where column is not dtype 'object'
@@ -251,27 +262,31 @@ Column will not be split but column name {} will be changed to: {}
     return dataframe
 
 
-def split_df_col2cols(dataframe, split_col, split_char, new_colnames, delete_old = False):
+def split_df_col2cols(dataframe, split_col, split_char, new_colnames, delete_old = False, categorical_cols = None):
     # # Splits a column into multiple columns
     # dataframe : pandas dataframe to be processed
     # split_col : chr string of the column name to be split
     # split_char : chr to split the col on
     # new_colnames : list of new name for the columns
     # delete_old : logical True / False, remove original column?
+    # categorical_cols : list of new column names to store as categoricals; for low cardinality values
     # ~~~~~~~~~~~~~~~~ #
-    import pandas as pd
+    # always returns exactly len(new_colnames) new columns; missing values are filled with NaN
+    # values with more parts than new_colnames raise a ValueError, as the per row split did
     import numpy as np
-    # pl.my_debugger(globals().copy())
-    # my_debugger(locals().copy())
-    # save the split column as a separate object
-    new_cols = dataframe[split_col].astype(np.object_).str.split(split_char).apply(pd.Series, 1)
-    # if all values were NaN, no split occured, only one col exists still
-    if len(new_cols.columns) < len(new_colnames):
-        # create the missing cols, fill with NaN
-        for i in range(len(new_cols.columns), len(new_colnames)):
-            new_cols[new_colnames[i]] = np.nan
+    # split all rows at once; one split more than needed, so values with extra parts can be found
+    new_cols = dataframe[split_col].astype(np.object_).str.split(split_char, n = len(new_colnames), expand = True)
+    if len(new_cols.columns) > len(new_colnames) and new_cols[len(new_colnames)].notnull().any():
+        raise ValueError("Column {0} has values with more than {1} parts split on '{2}', e.g.: {3}".format(split_col, len(new_colnames), split_char, dataframe[split_col][new_cols[len(new_colnames)].notnull()].iloc[0]))
+    # if all values were NaN or had fewer values, fewer cols exist; create the missing cols, fill with NaN
+    new_cols = new_cols.reindex(columns = range(len(new_colnames)))
+    # rows with fewer values are padded with None by the split; use NaN like the other missing values
+    new_cols = new_cols.where(new_cols.notnull(), np.nan)
     # rename the cols
     new_cols.columns = new_colnames
+    if categorical_cols is not None:
+        for colname in categorical_cols:
+            new_cols[colname] = new_cols[colname].astype('category')
     # remove the original column from the df
     if delete_old is True:
         del dataframe[split_col]
@@ -285,37 +300,540 @@ def conjunction(*conditions):
     import functools
     return functools.reduce(np.logical_and, conditions)
 
+# compiled filter plans, keyed on the JSON serialization of their filter criteria
+# so every sample processed in the same Python session reuses the same plan
+_filter_plan_cache = {}
+
+def compile_filter_criteria(filter_criteria):
+    '''
+    Compile a 'filter_criteria' dict into a reusable filter plan
+    'filter_criteria' = {'include': {'column_name': ['value1', 'value2']}, ... }
+
+    The plan is a tuple of (column, operation, value) steps;
+    include / exclude values are stored as a single membership list per column,
+    thresholds are stored as a single comparison per column.
+    Criteria types missing from the dict and empty value lists are skipped.
+    Plans are cached, so compiling the same criteria again is free.
+    '''
+    import json
+    cache_key = json.dumps(filter_criteria, sort_keys = True)
+    if cache_key in _filter_plan_cache:
+        return(_filter_plan_cache[cache_key])
+
+    filter_plan = []
+    for operation in ['include', 'exclude']:
+        for key, value in sorted(filter_criteria.get(operation, {}).items()):
+            if len(value) > 0:
+                filter_plan.append((key, operation, tuple(sorted(set(value)))))
+    for operation in ['greater_than', 'less_than', 'less_or_null']:
+        for key, value in sorted(filter_criteria.get(operation, {}).items()):
+            filter_plan.append((key, operation, value))
+    filter_plan = tuple(filter_plan)
+
+    _filter_plan_cache[cache_key] = filter_plan
+    return(filter_plan)
+
+def load_filter_plan(filter_criteria_json_file):
+    '''
+    Load the filter criteria JSON file and compile it into a filter plan
+    '''
+    return(compile_filter_criteria(load_json(filter_criteria_json_file)))
+
+def filter_plan_rows(dataframe, filter_plan):
+    '''
+    Evaluate a compiled filter plan against a dataframe in a single pass
+    returns a numpy array of the positions of the rows that pass every criteria
+
+    Each step is only evaluated on the rows that passed the previous steps,
+    so no full length boolean temporaries are created after the first step.
+    '''
+    import numpy as np
+    import pandas as pd
+    rows = np.arange(len(dataframe))
+    for column, operation, value in filter_plan:
+        if len(rows) < 1:
+            break
+        values = dataframe[column].values[rows]
+        with np.errstate(invalid = 'ignore'):
+            if operation == 'include':
+                keep = pd.Series(values).isin(value).values
+            elif operation == 'exclude':
+                keep = ~pd.Series(values).isin(value).values
+            elif operation == 'greater_than':
+                keep = values > value
+            elif operation == 'less_than':
+                keep = values < value
+            elif operation == 'less_or_null':
+                keep = (values < value) | pd.isnull(values)
+        rows = rows[keep]
+    return(rows)
+
 def table_multi_filter(dataframe, filter_criteria):
     # filter a dataframe based on multiple criteria
     # 'filter_criteria' = {'include': {'column_name': ['value1', 'value2']}, ... }
-    import pandas as pd
-    # my_debugger(locals().copy())
-    conditions_dfs = [] # empty list to hold conditional df's
-    for key, value in filter_criteria['include'].items():
-        for item in value:
-            includes_df = dataframe[key] == item
-            conditions_dfs.append(includes_df)
-
-    for key, value in filter_criteria['exclude'].items():
-        for item in value:
-            excludes_df = dataframe[key] != item
-            conditions_dfs.append(excludes_df)
-
-    for key, value in filter_criteria['less_than'].items():
-        less_thans_df = dataframe[key] < value
-        conditions_dfs.append(less_thans_df)
-
-    for key, value in filter_criteria['greater_than'].items():
-        greater_thans_df = dataframe[key] > value
-        conditions_dfs.append(greater_thans_df)
-
-    for key, value in filter_criteria['less_or_null'].items():
-        less_null_df = ( (dataframe[key] < value) | pd.isnull(dataframe[key]) )
-        conditions_dfs.append(less_null_df)
-
-    dataframe = dataframe[conjunction(*conditions_dfs)]
+    # include keeps rows matching any of the listed values, exclude drops rows matching any of them
+    # the criteria are compiled once and the compiled plan is reused for every table
+    filter_plan = compile_filter_criteria(filter_criteria)
+    dataframe = dataframe.iloc[filter_plan_rows(dataframe, filter_plan)]
     return dataframe
 
+def vcf_contig_order(vcf_file):
+    '''
+    Return the contig names from the ##contig header lines of a VCF file, in the order they are listed
+    the records of a sorted VCF, and the tables made from it, are in this order
+    '''
+    contigs = []
+    with open(vcf_file) as f:
+        for line in f:
+            if not line.startswith('##'):
+                break
+            if line.startswith('##contig=<'):
+                for field in line.strip()[len('##contig=<'):].rstrip('>').split(','):
+                    if field.startswith('ID='):
+                        contigs.append(field[len('ID='):])
+    return(contigs)
+
+def chromosome_rank(chrom, chrom_ranks):
+    '''
+    Return the sort rank of a chromosome name
+    chromosomes are ranked in the order they are first seen, after any ranks already assigned, e.g. from vcf_contig_order
+    chrom_ranks : dict of ranks already assigned; updated in place
+    '''
+    if chrom not in chrom_ranks:
+        chrom_ranks[chrom] = len(chrom_ranks)
+    return(chrom_ranks[chrom])
+
+def genomic_order_keys(dataframe, chrom_ranks, chrom_col = 'Chrom', pos_col = 'Position'):
+    '''
+    Return a numpy int64 array with one sortable key per row, combining the chromosome rank and position
+    '''
+    import numpy as np
+    for chrom in dataframe[chrom_col].unique():
+        chromosome_rank(chrom, chrom_ranks)
+    ranks = dataframe[chrom_col].map(chrom_ranks).values.astype(np.int64)
+    positions = dataframe[pos_col].values.astype(np.int64)
+    return((ranks << 32) + positions)
+
+def empty_merge(left_df, right_df, on):
+    '''
+    Inner join two tables with no rows, keeping the column order of a join of tables with rows;
+    pandas puts the join columns last when both tables are empty
+    '''
+    import pandas as pd
+    merge_df = pd.merge(left_df.iloc[:0], right_df.iloc[:0], on = on)
+    columns = list(left_df.columns) + [colname for colname in right_df.columns if colname not in on]
+    if sorted(columns) == sorted(merge_df.columns):
+        merge_df = merge_df[columns]
+    return(merge_df)
+
+def iter_sorted_merge(left_chunks, right_chunks, on, chrom_col = 'Chrom', pos_col = 'Position', chrom_order = None):
+    '''
+    Inner join two tables that are both sorted in genomic order, one block at a time
+    left_chunks, right_chunks : iterables of dataframe chunks, e.g. pd.read_table(..., chunksize = 10000)
+    on : list of columns to join on; must include chrom_col and pos_col
+    chrom_order : list of the chromosomes in the order the tables are sorted in, e.g. from vcf_contig_order;
+    chromosomes not in the list are ranked after it in the order they are first seen in either table
+
+    Yields the merged rows for each block of genomic positions as soon as both tables have moved past it,
+    so only about one chunk of each table is held in memory at a time.
+    Rows with the same chromosome and position always end up in the same block.
+    Raises ValueError if either table is not sorted in genomic order.
+    '''
+    import numpy as np
+    import pandas as pd
+    chrom_ranks = {}
+    for chrom in chrom_order or []:
+        chromosome_rank(chrom, chrom_ranks)
+    streams = []
+    for chunks in [left_chunks, right_chunks]:
+        streams.append({'chunks': iter(chunks), 'buffer': None, 'keys': np.array([], dtype = np.int64), 'done': False, 'columns': None})
+
+    def read_next_chunk(stream):
+        try:
+            chunk = next(stream['chunks'])
+        except StopIteration:
+            stream['done'] = True
+            return
+        if stream['columns'] is None:
+            stream['columns'] = chunk.iloc[:0]
+        keys = genomic_order_keys(chunk, chrom_ranks, chrom_col = chrom_col, pos_col = pos_col)
+        all_keys = np.concatenate([stream['keys'], keys])
+        if np.any(np.diff(all_keys) < 0):
+            raise ValueError("Table is not sorted in genomic order, cannot use a streaming merge")
+        if stream['buffer'] is None or len(stream['buffer']) < 1:
+            stream['buffer'] = chunk
+        else:
+            stream['buffer'] = pd.concat([stream['buffer'], chunk])
+        stream['keys'] = all_keys
+
+    merges_yielded = 0
+    while True:
+        # make sure each stream has rows buffered, unless it has run out
+        for stream in streams:
+            while not stream['done'] and len(stream['keys']) < 1:
+                read_next_chunk(stream)
+        # inner join; once either table is used up no more rows can match
+        if any([stream['done'] and len(stream['keys']) < 1 for stream in streams]):
+            break
+        # every row before the smallest last buffered key has been read from both tables
+        open_keys = [stream['keys'][-1] for stream in streams if not stream['done']]
+        if len(open_keys) > 0:
+            boundary = min(open_keys)
+            split_indexes = [np.searchsorted(stream['keys'], boundary, side = 'left') for stream in streams]
+        else:
+            split_indexes = [len(stream['keys']) for stream in streams]
+        if all([split_index < 1 for split_index in split_indexes]):
+            # the buffered rows all share the boundary position; read further in the tables that end on it
+            for stream in streams:
+                if not stream['done'] and stream['keys'][-1] == boundary:
+                    read_next_chunk(stream)
+            continue
+        blocks = []
+        for stream, split_index in zip(streams, split_indexes):
+            blocks.append(stream['buffer'].iloc[:split_index])
+            stream['buffer'] = stream['buffer'].iloc[split_index:]
+            stream['keys'] = stream['keys'][split_index:]
+        if len(blocks[0]) > 0 and len(blocks[1]) > 0:
+            merges_yielded += 1
+            yield(pd.merge(blocks[0], blocks[1], on = on))
+
+    # make sure the caller always gets the merged columns, even if nothing matched
+    if merges_yielded < 1 and all([stream['columns'] is not None for stream in streams]):
+        yield(empty_merge(streams[0]['columns'], streams[1]['columns'], on = on))
+
+# version of the reference list bundle format; bump this if the layout of the bundle changes
+# version 2: source paths are saved as absolute paths
+reference_bundle_version = 2
+
+def load_pickle_module():
+    '''
+    Return the C pickle module if there is one; the pure Python pickle in Python 2 is slower than reading the text lists
+    '''
+    try:
+        import cPickle as pickle
+    except ImportError:
+        import pickle
+    return(pickle)
+
+def reference_lists_checksum(reference_sets):
+    '''
+    Return a sha1 checksum of the contents of a dict of name: set of entries
+    '''
+    import hashlib
+    checksum = hashlib.sha1()
+    for name in sorted(reference_sets.keys()):
+        checksum.update(name.encode('utf-8') + b'\n')
+        for entry in sorted(reference_sets[name]):
+            checksum.update(entry.encode('utf-8') + b'\n')
+    return(checksum.hexdigest())
+
+def write_reference_bundle(list_files, output_file):
+    '''
+    Save reference lists as a binary bundle of hashed sets, for constant time loading and O(1) membership tests
+    list_files : dict of name: path to a list file with one entry per line
+    e.g. {'canonical_transcripts': 'hg19/canonical_transcript_list.txt', 'panel_genes': '../data/panel_genes.txt'}
+
+    The bundle records the path, size, and modification time of each list file,
+    so consumers can tell when a list has changed since the bundle was made
+    The saved bundle is loaded back and its checksum verified before it is used
+    '''
+    import os
+    pickle = load_pickle_module()
+    reference_sets = {}
+    sources = {}
+    for name, list_file in list_files.items():
+        reference_sets[name] = frozenset(list_file_lines(list_file))
+        sources[name] = {'path': os.path.abspath(list_file), 'size': os.path.getsize(list_file), 'mtime': os.path.getmtime(list_file)}
+    bundle = {
+    'bundle_version': reference_bundle_version,
+    'created': timestamp(),
+    'checksum': reference_lists_checksum(reference_sets),
+    'sources': sources,
+    'sets': reference_sets
+    }
+    with open(output_file, 'wb') as f:
+        pickle.dump(bundle, f, protocol = pickle.HIGHEST_PROTOCOL)
+    if load_reference_bundle(output_file, verify_checksum = True) is None:
+        os.remove(output_file)
+        kill_on_false(False, my_message = "ERROR: Reference bundle {0} did not match the reference lists after saving it".format(output_file))
+    return(output_file)
+
+def load_reference_bundle(bundle_file, verify_checksum = False):
+    '''
+    Load a reference list bundle made by write_reference_bundle
+    returns the bundle dict; the lists are frozensets under bundle['sets']
+    returns None if the bundle was made with a different bundle format version or its checksum does not match
+    '''
+    pickle = load_pickle_module()
+    with open(bundle_file, 'rb') as f:
+        bundle = pickle.load(f)
+    if bundle.get('bundle_version') != reference_bundle_version:
+        print("WARNING: Reference bundle {0} has version {1}, expected version {2}".format(bundle_file, bundle.get('bundle_version'), reference_bundle_version))
+        return(None)
+    if verify_checksum == True and reference_lists_checksum(bundle['sets']) != bundle['checksum']:
+        print("WARNING: Reference bundle {0} does not match its checksum".format(bundle_file))
+        return(None)
+    return(bundle)
+
+def reference_bundle_is_current(bundle, list_files):
+    '''
+    Check that a loaded reference bundle holds every list in list_files, made from the same list file paths,
+    and that none of the list files have changed since the bundle was made
+    list_files : dict of name: path to the list file
+    '''
+    import os
+    for name, list_file in list_files.items():
+        if name not in bundle['sources']:
+            return(False)
+        source = bundle['sources'][name]
+        if not os.path.isfile(list_file):
+            return(False)
+        if os.path.realpath(list_file) != os.path.realpath(source['path']):
+            return(False)
+        if os.path.getsize(list_file) != source['size'] or os.path.getmtime(list_file) != source['mtime']:
+            return(False)
+    return(True)
+
+def load_reference_sets(list_files, bundle_file = None):
+    '''
+    Load reference lists as frozensets
+    uses the reference bundle if it is present and current, otherwise reads the list files
+    list_files : dict of name: path to the list file
+    returns dict of name: frozenset
+    '''
+    import os
+    if bundle_file is not None and os.path.isfile(bundle_file):
+        bundle = load_reference_bundle(bundle_file)
+        if bundle is not None and reference_bundle_is_current(bundle, list_files):
+            return(dict((name, bundle['sets'][name]) for name in list_files.keys()))
+        print("WARNING: Reference bundle {0} is out of date, reading the reference list files instead".format(bundle_file))
+    return(dict((name, frozenset(list_file_lines(list_file))) for name, list_file in list_files.items()))
+
+def columnar_table_files(tsv_file):
+    '''
+    Return the possible columnar sidecar files for a TSV table, in order of preference
+    IonXpress_001_summary.tsv -> [IonXpress_001_summary.feather, IonXpress_001_summary.npz]
+    '''
+    import os
+    basename = os.path.splitext(tsv_file)[0]
+    return([basename + '.feather', basename + '.npz'])
+
+def write_columnar_table(dataframe, tsv_file):
+    '''
+    Save a typed columnar copy of a table next to its TSV file
+    uses Feather if the 'feather' package is installed, otherwise a NumPy .npz file
+    with one array per column; categorical columns are stored as codes and categories
+    returns the path to the sidecar file
+    '''
+    import os
+    import sys
+    import numpy as np
+    import pandas as pd
+    feather_file, npz_file = columnar_table_files(tsv_file)
+    # remove any older sidecars so a stale one is never read
+    for sidecar_file in [feather_file, npz_file]:
+        if os.path.isfile(sidecar_file):
+            os.remove(sidecar_file)
+    try:
+        import feather
+    except ImportError:
+        feather = None
+        # stderr, so the message does not end up in tables written to stdout
+        sys.stderr.write("The 'feather' package is not installed, saving the columnar table as NumPy .npz instead\n")
+    if feather is not None:
+        feather.write_dataframe(dataframe.reset_index(drop = True), feather_file)
+        return(feather_file)
+    arrays = {'__columns__': np.array(list(dataframe.columns), dtype = np.object_)}
+    for i, colname in enumerate(dataframe.columns):
+        column = dataframe.iloc[:, i]
+        if str(column.dtype) == 'category':
+            arrays['codes_{0}'.format(i)] = column.cat.codes.values
+            arrays['categories_{0}'.format(i)] = np.array(column.cat.categories, dtype = np.object_)
+        else:
+            arrays['col_{0}'.format(i)] = column.values
+    # write to a temporary file first so readers never see a partial sidecar
+    tmp_file = npz_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **arrays)
+    os.rename(tmp_file, npz_file)
+    return(npz_file)
+
+def read_columnar_table(sidecar_file, usecols = None):
+    '''
+    Load a table saved by write_columnar_table
+    usecols : list of columns to load; defaults to all columns
+    '''
+    import numpy as np
+    import pandas as pd
+    if sidecar_file.endswith('.feather'):
+        import feather
+        dataframe = feather.read_dataframe(sidecar_file)
+        if usecols is not None:
+            dataframe = dataframe[usecols]
+        return(dataframe)
+    arrays = np.load(sidecar_file, allow_pickle = True)
+    colnames = list(arrays['__columns__'])
+    if usecols is None:
+        usecols = colnames
+    columns = []
+    for colname in usecols:
+        i = colnames.index(colname)
+        if 'codes_{0}'.format(i) in arrays.files:
+            columns.append(pd.Categorical.from_codes(arrays['codes_{0}'.format(i)], arrays['categories_{0}'.format(i)]))
+        else:
+            columns.append(arrays['col_{0}'.format(i)])
+    arrays.close()
+    dataframe = pd.DataFrame(dict(zip(range(len(columns)), columns)), columns = range(len(columns)))
+    dataframe.columns = usecols
+    return(dataframe)
+
+def find_columnar_table(tsv_file):
+    '''
+    Return the columnar sidecar file for a TSV table if one exists and is at least as new as the TSV, otherwise None
+    '''
+    import os
+    for sidecar_file in columnar_table_files(tsv_file):
+        if os.path.isfile(sidecar_file):
+            if not os.path.isfile(tsv_file) or os.path.getmtime(sidecar_file) >= os.path.getmtime(tsv_file):
+                return(sidecar_file)
+    return(None)
+
+def read_pipeline_table(tsv_file, usecols = None):
+    '''
+    Load a pipeline output table; summary, filtered, or full table
+    prefers the columnar sidecar file if it is current, otherwise reads the TSV
+    '''
+    import pandas as pd
+    sidecar_file = find_columnar_table(tsv_file)
+    if sidecar_file is not None:
+        return(read_columnar_table(sidecar_file, usecols = usecols))
+    return(pd.read_table(tsv_file, sep = '\t', header = 0, usecols = usecols))
+
+def concat_pipeline_tables(tsv_files, usecols = None):
+    '''
+    Load and concatenate many pipeline output tables, e.g. the summary tables of all the samples in an analysis
+    using the columnar sidecars where they are current
+    '''
+    import pandas as pd
+    dataframes = [read_pipeline_table(tsv_file, usecols = usecols) for tsv_file in tsv_files]
+    return(pd.concat(dataframes, ignore_index = True))
+
+table_views_version = 1
+
+def write_table_views(full_table_file, views, output_file):
+    '''
+    Save a manifest of the views of a full table, e.g. the filtered and summary tables
+    views = {'view_name': {'rows': [row positions in the full table], 'columns': [column names] or None for all columns, 'file': 'path/to/view.tsv'}, ... }
+    file paths are stored relative to the manifest
+    '''
+    import os
+    manifest_dir = os.path.dirname(os.path.abspath(output_file))
+    manifest = {
+    'views_version': table_views_version,
+    'full_table': os.path.relpath(os.path.abspath(full_table_file), manifest_dir),
+    'views': {}
+    }
+    for view_name, view in views.items():
+        manifest['views'][view_name] = {
+        'rows': [int(row) for row in view['rows']],
+        'columns': list(view['columns']) if view['columns'] is not None else None,
+        'file': os.path.relpath(os.path.abspath(view['file']), manifest_dir)
+        }
+    # write to a temporary file first so readers never see a partial manifest
+    tmp_file = output_file + '.tmp'
+    write_json(manifest, tmp_file)
+    os.rename(tmp_file, output_file)
+    return(output_file)
+
+def load_table_views(manifest_file):
+    '''
+    Load a manifest saved by write_table_views, with the file paths resolved relative to the manifest
+    '''
+    import os
+    manifest = load_json(manifest_file)
+    kill_on_false(manifest.get('views_version') == table_views_version, my_message = "ERROR: Table views manifest {0} has version {1}, expected {2}".format(manifest_file, manifest.get('views_version'), table_views_version))
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+    manifest['full_table'] = os.path.join(manifest_dir, manifest['full_table'])
+    for view in manifest['views'].values():
+        view['file'] = os.path.join(manifest_dir, view['file'])
+    return(manifest)
+
+def iter_table_view_lines(manifest_file, view_name, header = True):
+    '''
+    Yield the lines of a view of a full table, taken directly from the full table TSV
+    the lines are identical to those of the view table written with pandas
+    '''
+    manifest = load_table_views(manifest_file)
+    kill_on_false(view_name in manifest['views'], my_message = "ERROR: Table views manifest {0} has no view '{1}'".format(manifest_file, view_name))
+    view = manifest['views'][view_name]
+    rows = set(view['rows'])
+    with open(manifest['full_table'], 'r') as f:
+        colnames = f.readline().rstrip('\n').split('\t')
+        if view['columns'] is None:
+            col_positions = None
+        else:
+            col_positions = [colnames.index(colname) for colname in view['columns']]
+        def project(fields):
+            if col_positions is None:
+                return('\t'.join(fields) + '\n')
+            return('\t'.join([fields[i] for i in col_positions]) + '\n')
+        if header == True:
+            yield(project(colnames))
+        for i, line in enumerate(f):
+            if i in rows:
+                yield(project(line.rstrip('\n').split('\t')))
+
+def materialize_table_view(manifest_file, view_name, output_file = None):
+    '''
+    Write a view of a full table to a TSV file; defaults to the view's file in the manifest
+    returns the path to the TSV file
+    '''
+    if output_file is None:
+        output_file = load_table_views(manifest_file)['views'][view_name]['file']
+    with open(output_file, 'w') as f:
+        for line in iter_table_view_lines(manifest_file, view_name):
+            f.write(line)
+    return(output_file)
+
+def read_table_view(manifest_file, view_name):
+    '''
+    Load a view of a full table as a dataframe
+    uses the view's TSV if it has been written, otherwise selects the rows and columns from the full table
+    '''
+    import os
+    manifest = load_table_views(manifest_file)
+    view = manifest['views'][view_name]
+    if os.path.isfile(view['file']):
+        return(read_pipeline_table(view['file']))
+    dataframe = read_pipeline_table(manifest['full_table'], usecols = view['columns'])
+    dataframe = dataframe.iloc[view['rows']].reset_index(drop = True)
+    if view['columns'] is not None:
+        dataframe = dataframe[view['columns']]
+    return(dataframe)
+
+
+def summary_metadata_file(summary_file):
+    '''
+    Return the path to the metadata file for a summary table
+    IonXpress_001_summary.tsv -> IonXpress_001_summary_meta.json
+    '''
+    import os
+    return(os.path.splitext(summary_file)[0] + '_meta.json')
+
+def load_summary_metadata(summary_file):
+    '''
+    Load the metadata saved for a summary table by merge_vcf_annotations.py;
+    row count, min and max Frequency, genes, Review counts, and SHA1 hash of the table
+    returns None if there is no metadata file, or if it is older than the summary table
+    '''
+    import os
+    metadata_file = summary_metadata_file(summary_file)
+    if not os.path.isfile(metadata_file):
+        return(None)
+    if os.path.isfile(summary_file) and os.path.getmtime(summary_file) > os.path.getmtime(metadata_file):
+        return(None)
+    return(load_json(metadata_file))
+
 def write_json(object, output_file):
     import json
     with open(output_file,"w") as f:
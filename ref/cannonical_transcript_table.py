@@ -13,6 +13,11 @@
 # http://hgdownload.soe.ucsc.edu/goldenPath/hg19/database/kgXref.txt.gz
 # # as per this dicussion
 # # https://groups.google.com/a/soe.ucsc.edu/forum/#!topic/genome/_6asF5KciPc
+#
+# the canonical transcript list, panel genes, and actionable genes are also saved together
+# as a binary bundle of sets, 'reference_lists.pickle', for fast loading by the pipeline
+# rebuild just the bundle after editing any of the lists with:
+# ./cannonical_transcript_table.py -bundle_only
 
 
 import sys
@@ -49,6 +54,21 @@ def create_crossreference_tables(crossref_file, canon_file, outdir, replace_valu
                     item = replace_values_dict[item]
             myfile.write("%s\n" % item)
 
+def make_reference_bundle(outdir, panel_genes_file, actionable_genes_file):
+    '''
+    Save the canonical transcripts, panel genes, and actionable genes lists as a reference bundle in the outdir
+    '''
+    list_files = {
+    'canonical_transcripts': os.path.join(outdir, "canonical_transcript_list.txt"),
+    'panel_genes': panel_genes_file,
+    'actionable_genes': actionable_genes_file
+    }
+    for list_file in list_files.values():
+        pl.file_exists(list_file, kill = True)
+    bundle_file = pl.write_reference_bundle(list_files, os.path.join(outdir, "reference_lists.pickle"))
+    print("Reference bundle saved to:\n{0}".format(bundle_file))
+    return(bundle_file)
+
 # ~~~~ GET SCRIPT ARGS ~~~~~~ #
 parser = argparse.ArgumentParser(description='Canonical Transcript table creation script')
 
@@ -61,6 +81,9 @@ parser.add_argument("-cnu", default = "http://hgdownload.soe.ucsc.edu/goldenPath
 parser.add_argument("-cru", default = "http://hgdownload.soe.ucsc.edu/goldenPath/hg19/database/kgXref.txt.gz", type = str, dest = 'crossref_URL', metavar = "Cross reference URL")
 
 parser.add_argument("-o", default = ".", type = str, dest = 'outdir', metavar = "Parent outdir")
+parser.add_argument("-panel", default = "../data/panel_genes.txt", type = str, dest = 'panel_genes_file', metavar = "Panel genes list", help="Path to the panel genes list to include in the reference bundle")
+parser.add_argument("-actionable", default = "../data/actionable_genes.txt", type = str, dest = 'actionable_genes_file', metavar = "Actionable genes list", help="Path to the actionable genes list to include in the reference bundle")
+parser.add_argument("-bundle_only", default = False, action = 'store_true', dest = 'bundle_only', help="Only rebuild the reference bundle from the existing lists, do not download the transcript tables")
 parser.add_argument("-r", default = "IDs_to_replace.csv", type = str, dest = 'IDs_to_replace', metavar = "A CSV formatted list of transcript IDs to replace, one per line. Format: <old ID>,<new ID>")
 
 
@@ -79,8 +102,16 @@ outdir = os.path.abspath(os.path.join(parent_outdir, build_version))
 
 IDs_to_replace_file = args.IDs_to_replace
 
+panel_genes_file = args.panel_genes_file
+actionable_genes_file = args.actionable_genes_file
+bundle_only = args.bundle_only
+
 
 if __name__ == "__main__":
+    if bundle_only == True:
+        make_reference_bundle(outdir, panel_genes_file, actionable_genes_file)
+        sys.exit()
+
     # make outdir
     pl.mkdir_p(outdir, return_path=True)
 
@@ -103,3 +134,5 @@ if __name__ == "__main__":
         replace_values_dict = None
 
     create_crossreference_tables(crossref_file, canon_file, outdir, replace_values_dict = replace_values_dict)
+
+    make_reference_bundle(outdir, panel_genes_file, actionable_genes_file)